@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+from kubernetes.client import V1Container, V1ContainerStatus, V1Deployment, V1DeploymentSpec, V1LabelSelector, \
+    V1ObjectMeta, V1Pod, V1PodCondition, V1PodList, V1PodSpec, V1PodStatus, V1PodTemplateSpec, \
+    V1ResourceRequirements, V1Scale, V1ScaleSpec
+
+from main.api_groups import custom_objects_api, pod_api
+from main.hpa.async_engine import AsyncEngine
+from main.hpa.hpa_main import ClusterActions, HpaConfig, scale_replicas, scale_replicas_async
+from main.hpa.structured_log import muted
+
+NAMESPACE = "my_namespace"
+LABELS = {"app": "my_app", "role": "web"}
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+# The O(N^2) per-pod metrics cycle runs at most this many per-pod calls and is extrapolated beyond
+MAX_PER_POD_CALLS = 200
+
+ENV = {"MIN_REPLICAS": "2", "MAX_REPLICAS": "100000", "UPPER_CPU_THRESHOLD": "0.7", "LOWER_CPU_THRESHOLD": "0.4",
+       "LOOP_TIME_S": "90", "NO_SCALE_DOWN_PERIOD": "300"}
+HPA_CONFIG = HpaConfig(ENV)
+
+
+class ApiStats:
+
+    def __init__(self):
+        self.api_calls = 0
+        self.objects_decoded = 0
+
+    def add(self, objects: int):
+        self.api_calls += 1
+        self.objects_decoded += objects
+
+
+# In-memory API server. Objects are rebuilt on every call, standing in for response deserialization.
+class SyntheticCluster:
+
+    def __init__(self, num_pods: int, noise_factor: int):
+        self.stats = ApiStats()
+        self.pods = [(f"web-{i}", NAMESPACE, LABELS) for i in range(num_pods)]
+        self.pods += [(f"other-{i}", f"tenant-{i % 10}", {"app": "other", "role": "web"})
+                      for i in range(num_pods * noise_factor)]
+        self.replicas = num_pods
+        # built once, its deletion-cost executor is not part of what a cycle measures
+        self.cluster_actions = ClusterActions(self, self, self, NAMESPACE)
+
+    @staticmethod
+    def decode_pod(name, namespace, labels) -> V1Pod:
+        return V1Pod(metadata=V1ObjectMeta(name=name, namespace=namespace, labels=dict(labels)),
+                     spec=V1PodSpec(containers=[V1Container(name="web")], node_name="node-1"),
+                     status=V1PodStatus(phase="Running", pod_ip=f"10.0.{len(name)}.1",
+                                        conditions=[V1PodCondition(type="Ready", status="True")],
+                                        container_statuses=[V1ContainerStatus(name="web", ready=True, restart_count=0,
+                                                                              image="web", image_id="web")]))
+
+    # CoreV1Api
+    def list_pod_for_all_namespaces(self, **kwargs):
+        items = [self.decode_pod(*p) for p in self.pods]
+        self.stats.add(len(items))
+        return V1PodList(items=items)
+
+    def list_namespaced_pod(self, namespace, label_selector=None, field_selector=None, **kwargs):
+        selector = dict(term.split("=") for term in (label_selector or "").split(",") if term)
+        items = [self.decode_pod(*p) for p in self.pods
+                 if p[1] == namespace and all(p[2].get(k) == v for k, v in selector.items())]
+        self.stats.add(len(items))
+        return V1PodList(items=items)
+
+    def patch_namespaced_pod(self, name, namespace, body, **kwargs):
+        self.stats.add(1)
+
+    # CustomObjectsApi
+    def list_namespaced_custom_object(self, group, version, namespace, plural, label_selector=None, **kwargs):
+        selector = dict(term.split("=") for term in (label_selector or "").split(",") if term)
+        items = [{"metadata": {"name": name, "labels": dict(labels)},
+                  "containers": [{"name": "web", "usage": {"cpu": "200000000n", "memory": "100Mi"}}]}
+                 for name, ns, labels in self.pods
+                 if ns == namespace and all(labels.get(k) == v for k, v in selector.items())]
+        self.stats.add(len(items))
+        return {"items": items}
+
+    # AppsV1Api
+    def read_namespaced_deployment(self, name, namespace, **kwargs):
+        self.stats.add(1)
+        container = V1Container(name="web", resources=V1ResourceRequirements(requests={"cpu": "250m"}))
+        return V1Deployment(metadata=V1ObjectMeta(name=name, resource_version="1"),
+                            spec=V1DeploymentSpec(replicas=self.replicas, selector=V1LabelSelector(),
+                                                  template=V1PodTemplateSpec(spec=V1PodSpec(containers=[container]))))
+
+    def patch_namespaced_deployment_scale(self, name, namespace, body, **kwargs):
+        self.stats.add(1)
+        return V1Scale(metadata=V1ObjectMeta(name=name, resource_version="2"),
+                       spec=V1ScaleSpec(replicas=body[-1]["value"]))
+
+
+def ready_pods_all_namespaces(cluster: SyntheticCluster, num_pods: int):
+    pod_api.get_ready_pods(cluster, "my_app", "web", NAMESPACE, "web")
+
+
+def ready_pods_namespaced(cluster: SyntheticCluster, num_pods: int):
+    pod_api.get_ready_pods_namespaced(cluster, "my_app", "web", NAMESPACE, "web")
+
+
+# Previous per-pod lookups: one full namespace list per pod
+def usages_per_pod(cluster: SyntheticCluster, num_pods: int):
+    for i in range(min(num_pods, MAX_PER_POD_CALLS)):
+        custom_objects_api.get_usages_from_pod(cluster, f"web-{i}", NAMESPACE)
+
+
+def usages_snapshot(cluster: SyntheticCluster, num_pods: int):
+    custom_objects_api.get_pods_usages(cluster, NAMESPACE, "app=my_app,role=web")
+
+
+def scale_replicas_cycle(cluster: SyntheticCluster, num_pods: int):
+    scale_replicas(cluster.cluster_actions, HPA_CONFIG, None, 0)
+
+
+engine: AsyncEngine = None
+
+
+def scale_replicas_async_cycle(cluster: SyntheticCluster, num_pods: int):
+    global engine
+    if engine is None:
+        engine = AsyncEngine(4)
+    engine.run(scale_replicas_async(engine, cluster.cluster_actions, HPA_CONFIG, None, 0))
+
+
+CASES = {
+    "get_ready_pods": ready_pods_all_namespaces,
+    "get_ready_pods_namespaced": ready_pods_namespaced,
+    "get_usages_from_pod": usages_per_pod,
+    "get_pods_usages": usages_snapshot,
+    "scale_replicas": scale_replicas_cycle,
+    "scale_replicas_async": scale_replicas_async_cycle,
+}
+
+
+def measure(case: str, num_pods: int, noise_factor: int, repeat: int) -> dict:
+    fn = CASES[case]
+    cluster = SyntheticCluster(num_pods, noise_factor)
+    wall_times = []
+    with muted():
+        for _ in range(repeat):
+            cluster.stats = ApiStats()
+            start = time.perf_counter()
+            fn(cluster, num_pods)
+            wall_times.append(time.perf_counter() - start)
+        stats = cluster.stats
+        cluster.stats = ApiStats()
+        tracemalloc.start()
+        fn(cluster, num_pods)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    cluster.cluster_actions.write_executor.shutdown()
+    wall_s = min(wall_times)
+    api_calls, objects_decoded = stats.api_calls, stats.objects_decoded
+    extrapolated = case == "get_usages_from_pod" and num_pods > MAX_PER_POD_CALLS
+    if extrapolated:
+        scale = num_pods / MAX_PER_POD_CALLS
+        wall_s, api_calls, objects_decoded = wall_s * scale, int(api_calls * scale), int(objects_decoded * scale)
+    return {"case": case, "pods": num_pods, "wall_s": wall_s, "peak_memory_kib": peak / 1024,
+            "api_calls": api_calls, "objects_decoded": objects_decoded, "extrapolated": extrapolated}
+
+
+def run(sizes: list[int], cases: list[str], noise_factor: int, repeat: int) -> dict:
+    results = []
+    for num_pods in sizes:
+        for case in cases:
+            result = measure(case, num_pods, noise_factor, repeat)
+            results.append(result)
+            sys.stderr.write(f"{case:28} {num_pods:>6} pods  {result['wall_s'] * 1000:10.2f}ms  "
+                             f"{result['peak_memory_kib']:10.0f}KiB  {result['api_calls']:>8} calls  "
+                             f"{result['objects_decoded']:>10} objects\n")
+    return {"python": platform.python_version(), "noise_factor": noise_factor, "results": results}
+
+
+# Returns the regressions of current against baseline: wall time beyond tolerance, any growth of calls or objects
+def compare(baseline: dict, current: dict, tolerance: float) -> list[str]:
+    base = {(r["case"], r["pods"]): r for r in baseline["results"]}
+    regressions = []
+    for r in current["results"]:
+        b = base.get((r["case"], r["pods"]))
+        if b is None:
+            continue
+        name = f"{r['case']}[{r['pods']}]"
+        if r["wall_s"] > b["wall_s"] * (1 + tolerance):
+            regressions.append(f"{name} wall time {b['wall_s'] * 1000:.2f}ms -> {r['wall_s'] * 1000:.2f}ms")
+        for key in ["api_calls", "objects_decoded"]:
+            if r[key] > b[key]:
+                regressions.append(f"{name} {key} {b[key]} -> {r[key]}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Decision latency and API volume of the autoscaler by pod count")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES))
+    parser.add_argument("--noise-factor", type=int, default=1,
+                        help="pods of other namespaces per pod of the deployment")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"),
+                        help="compare two result files and exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative wall time increase")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            baseline = json.load(f)
+        with open(args.compare[1]) as f:
+            current = json.load(f)
+        regressions = compare(baseline, current, args.tolerance)
+        for line in regressions:
+            print(line)
+        sys.exit(1 if regressions else 0)
+
+    results = run(args.sizes, args.cases, args.noise_factor, args.repeat)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import logging
+import random
+import threading
+import time
+from typing import Callable
+
+from kubernetes import client
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+logger = logging.getLogger("hpa.api")
+
+
+# Client side QPS/burst token bucket. Writes may take every token; reads leave write_reserve tokens for them and
+# wait while a write is queued, so scale patches and deletion-cost annotations are never stuck behind list calls.
+class RateBudget:
+
+    def __init__(self, qps: float, burst: int, write_reserve: int = None, clock: Callable[[], float] = time.monotonic):
+        self.qps = qps
+        self.burst = max(1, burst)
+        write_reserve = max(1, self.burst // 4) if write_reserve is None else write_reserve
+        # a read needs write_reserve + 1 tokens, the bucket never holds more than burst
+        self.write_reserve = min(write_reserve, self.burst - 1)
+        self.clock = clock
+        self.tokens = float(self.burst)
+        self.updated = clock()
+        self.writers_waiting = 0
+        self.cond = threading.Condition()
+
+    def refill(self):
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.qps)
+        self.updated = now
+
+    # Takes a token if one is available for this kind of request, else returns the seconds to wait for it
+    def try_acquire(self, write: bool) -> float:
+        self.refill()
+        floor = 0 if write else self.write_reserve
+        if self.tokens >= floor + 1 and (write or self.writers_waiting == 0):
+            self.tokens -= 1
+            return 0.0
+        return max((floor + 1 - self.tokens) / self.qps, 0.001)
+
+    def acquire(self, write: bool) -> float:
+        start = self.clock()
+        with self.cond:
+            if write:
+                self.writers_waiting += 1
+            try:
+                while (wait_s := self.try_acquire(write)) > 0:
+                    self.cond.wait(wait_s)
+            finally:
+                if write:
+                    self.writers_waiting -= 1
+                    self.cond.notify_all()
+        return self.clock() - start
+
+
+# Exponential backoff with full jitter, never shorter than the Retry-After the API server asked for
+class RetryPolicy:
+
+    def __init__(self, max_retries: int = 4, base_delay_s: float = 0.2, max_delay_s: float = 5.0):
+        self.max_retries = max_retries
+        self.base_delay_s = base_delay_s
+        self.max_delay_s = max_delay_s
+
+    def delay_s(self, attempt: int, retry_after: str = None) -> float:
+        delay = random.uniform(0, min(self.max_delay_s, self.base_delay_s * 2 ** attempt))
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, min(float(retry_after), self.max_delay_s))
+        return delay
+
+
+# ApiClient that applies a default per-request timeout, the rate budget and retries on 429/5xx to every call.
+# Watches keep their own timeouts and bypass both, they hold the connection open.
+class BudgetedApiClient(client.ApiClient):
+
+    def __init__(self, configuration=None, budget: RateBudget = None, retry: RetryPolicy = None,
+                 request_timeout=(5, 30), sleep: Callable[[float], None] = time.sleep):
+        super().__init__(configuration)
+        self.budget = budget
+        self.retry = retry if retry is not None else RetryPolicy(0)
+        self.request_timeout = request_timeout
+        self.sleep = sleep
+
+    def call_api(self, method, url, header_params=None, body=None, post_params=None, _request_timeout=None):
+        if "watch=true" in url:
+            return super().call_api(method, url, header_params, body, post_params, _request_timeout)
+        write = method not in ("GET", "HEAD")
+        timeout = _request_timeout or self.request_timeout
+        attempt = 0
+        while True:
+            if self.budget is not None:
+                self.budget.acquire(write)
+            response = super().call_api(method, url, header_params, body, post_params, timeout)
+            if response.status not in RETRY_STATUSES or attempt >= self.retry.max_retries:
+                return response
+            response.read()  # releases the connection back to the pool
+            delay_s = self.retry.delay_s(attempt, response.getheader("Retry-After"))
+            logger.warning(f"{method} {url}: {response.status}, retry {attempt + 1} in {delay_s:.2f}s")
+            self.sleep(delay_s)
+            attempt += 1
+
+
+def new_api_client(qps: float, burst: int, pool_size: int, request_timeout_s: float,
+                   max_retries: int) -> BudgetedApiClient:
+    configuration = client.Configuration.get_default_copy()
+    configuration.connection_pool_maxsize = pool_size
+    configuration.keep_alive = True
+    budget = RateBudget(qps, burst) if qps > 0 else None
+    return BudgetedApiClient(configuration, budget, RetryPolicy(max_retries),
+                             (min(5.0, request_timeout_s), request_timeout_s))
@@ -1,6 +1,27 @@
 from kubernetes.client import CustomObjectsApi
 
 
+def list_pods_metrics(custom_objects_api: CustomObjectsApi, namespace, label_selector=None):
+    kwargs = {}
+    if label_selector:
+        kwargs["label_selector"] = label_selector
+    resource = custom_objects_api.list_namespaced_custom_object(group="metrics.k8s.io", version="v1beta1",
+                                                                namespace=namespace, plural="pods", **kwargs)
+    return resource["items"]
+
+
+# Indexes a single metrics list by pod name and container name: {pod_name: {container_name: usage}}
+def get_pods_usages(custom_objects_api: CustomObjectsApi, namespace, label_selector=None) -> dict[str, dict[str, dict]]:
+    usages = {}
+    for pod in list_pods_metrics(custom_objects_api, namespace, label_selector):
+        usages[pod["metadata"]["name"]] = {c["name"]: c["usage"] for c in pod["containers"]}
+    return usages
+
+
+def get_container_usage(pods_usages: dict[str, dict[str, dict]], pod_name, container_name) -> dict:
+    return pods_usages.get(pod_name, {}).get(container_name, {})
+
+
 def get_usages_from_pod(custom_objects_api: CustomObjectsApi, pod_name, namespace):
     resource = custom_objects_api.list_namespaced_custom_object(group="metrics.k8s.io", version="v1beta1",
                                                                 namespace=namespace, plural="pods")
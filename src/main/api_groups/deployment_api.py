@@ -1,9 +1,21 @@
+import logging
+import threading
+from typing import Callable
+
+from kubernetes import watch
 from kubernetes.client import AppsV1Api
+from kubernetes.client.rest import ApiException
+
+from main.api_groups import utils
+
+
+def read_deployment(apps_api_client: AppsV1Api, deployment_name, namespace):
+    return utils.read_or_none(apps_api_client.read_namespaced_deployment, deployment_name, namespace)
 
 
 def get_deployment_by_name(apps_api_client: AppsV1Api, deployment_name, namespace):
-    deployments = apps_api_client.list_namespaced_deployment(namespace)
-    return list(filter(lambda d: d.metadata.name == deployment_name, deployments.items))
+    deployment = read_deployment(apps_api_client, deployment_name, namespace)
+    return [] if deployment is None else [deployment]
 
 
 def get_deployment_replicas(apps_api_client: AppsV1Api, deployment_name, namespace):
@@ -15,9 +27,28 @@ def get_deployment_replicas(apps_api_client: AppsV1Api, deployment_name, namespa
         return web_depoyment.spec.replicas
 
 
-def set_deployment_replicas(apps_api_client: AppsV1Api, deployment_name, namespace, num_replicas):
+# With a resource_version the patch carries a JSON patch 'test' precondition, so the API server rejects it with
+# 422 Unprocessable Entity (409 Conflict on a concurrent write) if the deployment changed after it was read, status
+# updates included. Returns the resource version after the write.
+def set_deployment_replicas(apps_api_client: AppsV1Api, deployment_name, namespace, num_replicas,
+                            resource_version=None):
     patch = [{'op': 'replace', 'path': '/spec/replicas', 'value': num_replicas}]
-    apps_api_client.patch_namespaced_deployment_scale(deployment_name, namespace, patch)
+    if resource_version is not None:
+        patch.insert(0, {'op': 'test', 'path': '/metadata/resourceVersion', 'value': resource_version})
+    scale = apps_api_client.patch_namespaced_deployment_scale(deployment_name, namespace, patch)
+    if scale is None or scale.metadata is None:
+        return None
+    return scale.metadata.resource_version
+
+
+def is_precondition_failure(e: ApiException) -> bool:
+    return e.status in (409, 422)
+
+
+def get_container_resource_requests(deployment, container_name):
+    containers = deployment.spec.template.spec.containers
+    container = next(c for c in containers if c.name == container_name)
+    return container.resources.requests
 
 
 def get_deployment_resource_requests(apps_api_client: AppsV1Api, deployment_name, namespace, container_name):
@@ -25,7 +56,53 @@ def get_deployment_resource_requests(apps_api_client: AppsV1Api, deployment_name
     if len(deployments) != 1:
         return {"cpu": "0m"}
     else:
-        web_deployment = deployments[0]
-        containers = web_deployment.spec.template.spec.containers
-        web_container = next(c for c in containers if c.name == container_name)
-        return web_container.resources.requests
\ No newline at end of file
+        return get_container_resource_requests(deployments[0], container_name)
+
+
+def get_deployment_available_replicas(apps_api_client: AppsV1Api, deployment_name, namespace):
+    deployments = get_deployment_by_name(apps_api_client, deployment_name, namespace)
+    if len(deployments) != 1:
+        return 0
+    else:
+        return deployments[0].status.available_replicas or 0
+
+
+def create_deployment(apps_api_client: AppsV1Api, namespace, deployment):
+    return apps_api_client.create_namespaced_deployment(namespace, deployment)
+
+
+# Calls on_change when the replicas of the deployment change, in the spec or in the ready count
+class DeploymentMonitor:
+
+    def deployment_monitor(self):
+        w = watch.Watch()
+        while not self.stop_event.is_set():
+            try:
+                for event in w.stream(self.apps_api_client.list_namespaced_deployment, self.namespace,
+                                      field_selector=f"metadata.name={self.deployment_name}", timeout_seconds=30):
+                    if self.stop_event.is_set():
+                        break
+                    deployment = event['object']
+                    replicas = (deployment.spec.replicas, deployment.status.ready_replicas)
+                    if self.replicas is not None and replicas != self.replicas:
+                        self.on_change(f"deployment {self.deployment_name} replicas {replicas}")
+                    self.replicas = replicas
+            except Exception as e:
+                logging.warning(f"Deployment watch failed: {e}")
+                self.stop_event.wait(1)
+
+    def __init__(self, apps_api_client: AppsV1Api, deployment_name, namespace, on_change: Callable[[str], None]):
+        self.apps_api_client = apps_api_client
+        self.deployment_name = deployment_name
+        self.namespace = namespace
+        self.on_change = on_change
+        self.replicas = None
+        self.thread = threading.Thread(target=self.deployment_monitor, daemon=True)
+        self.stop_event = threading.Event()
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
@@ -1,11 +1,13 @@
-import sys
+import logging
 
 from kubernetes.client import AutoscalingV1Api
 
+from main.api_groups import utils
+
 
 def get_hpa_by_name(hpa_client: AutoscalingV1Api, hpa_name, namespace):
-    hpas = hpa_client.list_namespaced_horizontal_pod_autoscaler(namespace)
-    return list(filter(lambda hpa: hpa.metadata.name == hpa_name, hpas.items))
+    hpa = utils.read_or_none(hpa_client.read_namespaced_horizontal_pod_autoscaler, hpa_name, namespace)
+    return [] if hpa is None else [hpa]
 
 
 def get_min_replicas(hpa_client: AutoscalingV1Api, hpa_name, namespace) -> int:
@@ -13,11 +15,5 @@ def get_min_replicas(hpa_client: AutoscalingV1Api, hpa_name, namespace) -> int:
     try:
         min_replicas = get_hpa_by_name(hpa_client, hpa_name, namespace)[0].spec.min_replicas
     except Exception as e:
-        log_line(str(e))
-        sys.stderr.write(str(e))
+        logging.getLogger("hpa.api").warning(f"HPA {hpa_name}: {e}")
     return min_replicas
-
-
-def log_line(message):
-    sys.stdout.write(message + '\n')
-    sys.stdout.flush()
@@ -0,0 +1,34 @@
+import json
+from datetime import datetime
+
+from kubernetes.client import CoreV1Api
+
+
+# The kubelet summary of a node through the API server node proxy (needs get on nodes/proxy)
+def get_node_summary(core_api: CoreV1Api, node_name, timeout_s: float = 5) -> dict:
+    # read raw, the generated client would turn the JSON body into a python repr string
+    resp = core_api.connect_get_node_proxy_with_path(node_name, "stats/summary", _preload_content=False,
+                                                     _request_timeout=timeout_s)
+    return json.loads(resp.data)
+
+
+def cpu_time_s(timestamp: str) -> float:
+    return datetime.fromisoformat(timestamp.replace("Z", "+00:00")).timestamp()
+
+
+# Cumulative CPU counters of the given pods: {pod_name: {container_name: (sample_time_s, usageCoreNanoSeconds,
+# usageNanoCores)}}
+def get_containers_cpu_counters(summary: dict, namespace, pod_names) -> dict[str, dict[str, tuple]]:
+    counters = {}
+    for pod in summary.get("pods", []):
+        ref = pod["podRef"]
+        if ref["namespace"] != namespace or ref["name"] not in pod_names:
+            continue
+        containers = {}
+        for container in pod.get("containers", []):
+            cpu = container.get("cpu") or {}
+            if "usageCoreNanoSeconds" in cpu and "time" in cpu:
+                containers[container["name"]] = (cpu_time_s(cpu["time"]), cpu["usageCoreNanoSeconds"],
+                                                 cpu.get("usageNanoCores"))
+        counters[ref["name"]] = containers
+    return counters
@@ -1,7 +1,11 @@
 import logging
 
-from kubernetes.client import CoreV1Api
+from kubernetes.client import CoreV1Api, V1Pod
+from kubernetes.client.rest import ApiException
 import threading
+from types import MappingProxyType
+from typing import Callable, Mapping
+
 from kubernetes import watch
 
 
@@ -11,7 +15,7 @@ def get_pods_by_namespace(client: CoreV1Api, namespace):
 
 
 def check_pod_label(pod, label_name, label_value):
-    pod_labels = pod.metadata.labels
+    pod_labels = pod.metadata.labels or {}
     result = False
     if label_name in pod_labels.keys():
         result = pod_labels[label_name] == label_value
@@ -84,61 +88,182 @@ def get_ready_pods(client: CoreV1Api, app_name, role, namespace, container_name)
         container_name)
 
 
+class DecodeCounter:
+    # Counts list requests and the pod objects decoded from them, to compare discovery paths per cycle
+
+    def __init__(self):
+        self.list_calls = 0
+        self.pods_decoded = 0
+
+    def add(self, pods):
+        self.list_calls += 1
+        self.pods_decoded += len(pods)
+
+    def reset(self):
+        self.list_calls = 0
+        self.pods_decoded = 0
+
+
+def labels_selector(labels: dict[str, str]) -> str:
+    return ",".join(f"{k}={v}" for k, v in labels.items())
+
+
+def list_namespaced_pods(client: CoreV1Api, namespace, label_selector=None, field_selector=None,
+                         counter: DecodeCounter = None):
+    ret = client.list_namespaced_pod(namespace, label_selector=label_selector, field_selector=field_selector)
+    if counter is not None:
+        counter.add(ret.items)
+    return ret.items
+
+
+def is_pod_serving(pod, container_name) -> bool:
+    return is_pod_ready(pod) and pod.status.container_statuses is not None and is_container_ready(container_name, pod)
+
+
+def get_ready_pods_namespaced(client: CoreV1Api, app_name, role, namespace, container_name,
+                              counter: DecodeCounter = None):
+    # Label and phase filtering happen server side, readiness and container checks in a single pass
+    pods = list_namespaced_pods(client, namespace,
+                                label_selector=labels_selector({"app": app_name, "role": role}),
+                                field_selector="status.phase=Running",
+                                counter=counter)
+    return [pod for pod in pods if is_pod_serving(pod, container_name)]
+
+
 def in_namespace(pod, namespace):
     return pod.metadata.namespace == namespace
 
 
+# Read-only view of the monitored pods, replaced as a whole on every change so readers never take a lock
+class PodCacheSnapshot:
+
+    def __init__(self, pods: dict[str, V1Pod] = None):
+        self.pods: Mapping[str, V1Pod] = MappingProxyType(pods if pods is not None else {})  # by uid
+        self.ip_addrs = frozenset(pod.status.pod_ip for pod in self.pods.values()
+                                  if pod.status is not None and pod.status.pod_ip and is_pod_ready(pod))
+
+    # The pods get_ready_pods_namespaced would list, in the same order
+    def ready_pods(self, container_name) -> list[V1Pod]:
+        pods = [pod for pod in self.pods.values()
+                if pod.status is not None and pod.status.phase == "Running" and is_pod_serving(pod, container_name)]
+        return sorted(pods, key=lambda pod: pod.metadata.name)
+
+
+# Watch cache of the pods of one app and role in one namespace, keyed by pod UID. It lists once, then watches from
+# the list's resourceVersion and resumes from the last one seen, bookmarks included, each time the watch times out.
+# It lists again only when the server answers 410 Gone or the watch fails, and then reports the pods that changed
+# in the meantime, deletions included, to on_pod_event.
 class PodMonitor:
 
     def pod_monitor(self):
-        w = watch.Watch()
-        exit = False
-        while not exit:
-            for event in w.stream(self.client.list_pod_for_all_namespaces, timeout_seconds=3):
-
+        while not self.stop_event.is_set():
+            self.watch_once()
+
+    def watch_once(self):
+        try:
+            if self.resource_version is None:
+                self.relist()
+            for event in self.watcher.stream(self.client.list_namespaced_pod, self.namespace,
+                                             label_selector=self.label_selector,
+                                             resource_version=self.resource_version,
+                                             allow_watch_bookmarks=True, timeout_seconds=self.timeout_s):
                 if self.stop_event.is_set():
-                    exit = True
                     break
-
-                if event['object'].kind == "Pod":
-                    pod = event['object']
-
-                    if in_namespace(pod, self.namespace) \
-                            and check_pod_label(pod, "app", self.app) \
-                            and check_pod_label(pod, "role", self.role):
-
-                        event_t = event['type']
-
-                        global ip_addrs
-                        if (event_t == "ADDED" or event_t == "MODIFIED") and is_pod_ready(
-                                pod) and pod.status.pod_ip not in self.ip_addrs:
-                            self.ip_addrs.append(pod.status.pod_ip)
-                            logging.debug(f"Pods activos: {str(self.ip_addrs)}")
-                        elif event_t == "DELETED" and pod.status.pod_ip in self.ip_addrs:
-                            self.ip_addrs.remove(pod.status.pod_ip)
-                            logging.debug(f"Pods activos: {str(self.ip_addrs)}")
-
-                            # print("Event: %s %s %s %s" % (
-                        #    event['type'],        #ADDED, MODIFIED, DELETED
-                        #    event['object'].kind, #Pod
-                        #    event['object'].metadata.name,
-                        #    event['object'].status.pod_ip
-                        # )
-                        # )
-                        #print(str(self.ip_addrs))
-
-    def __init__(self, app: str, role: str, namespace: str, client: CoreV1Api):
+                self.handle_event(event)
+        except ApiException as e:
+            self.resource_version = None
+            if e.status == 410:
+                logging.info(f"Pod watch of {self.label_selector}: resourceVersion expired, listing again")
+                return
+            self.watch_failed(e)
+        except Exception as e:
+            self.resource_version = None
+            self.watch_failed(e)
+
+    def watch_failed(self, e: Exception):
+        logging.warning(f"Pod watch of {self.label_selector} failed: {e}")
+        # readers go back to listing until the cache is listed again
+        self.synced.clear()
+        self.stop_event.wait(1)
+
+    def relist(self):
+        pod_list = self.client.list_namespaced_pod(self.namespace, label_selector=self.label_selector)
+        old_pods = self.snapshot.pods
+        pods = {pod.metadata.uid: pod for pod in pod_list.items}
+        self.snapshot = PodCacheSnapshot(pods)
+        self.resource_version = pod_list.metadata.resource_version if pod_list.metadata else None
+        for uid, old in old_pods.items():
+            if uid not in pods:
+                self.pod_changed("DELETED", old, old)
+        for uid, pod in pods.items():
+            old = old_pods.get(uid)
+            if old is None:
+                self.pod_changed("ADDED", None, pod)
+            elif old.metadata.resource_version != pod.metadata.resource_version:
+                self.pod_changed("MODIFIED", old, pod)
+        self.synced.set()
+
+    def handle_event(self, event):
+        event_t = event['type']
+        if event_t == "BOOKMARK":
+            self.resource_version = event['raw_object']['metadata']['resourceVersion']
+            return
+        pod = event['object']
+        self.resource_version = pod.metadata.resource_version
+        pods = dict(self.snapshot.pods)
+        old = pods.pop(pod.metadata.uid, None)
+        if event_t != "DELETED":
+            pods[pod.metadata.uid] = pod
+        self.snapshot = PodCacheSnapshot(pods)
+        self.pod_changed(event_t, old, pod)
+
+    def pod_changed(self, event_t: str, old: V1Pod, pod: V1Pod):
+        if self.on_pod_event is not None:
+            self.on_pod_event(event_t, pod)
+        was_ready = old is not None and old.status is not None and is_pod_ready(old)
+        ready = event_t != "DELETED" and pod.status is not None and is_pod_ready(pod)
+        if ready and not was_ready:
+            self.notify(f"pod {pod.metadata.name} ready")
+        elif was_ready and not ready:
+            self.notify(f"pod {pod.metadata.name} {'deleted' if event_t == 'DELETED' else 'not ready'}")
+
+    def notify(self, reason: str):
+        logging.debug(f"Pods activos: {sorted(self.ip_addrs)}")
+        if self.on_change is not None:
+            self.on_change(reason)
+
+    def __init__(self, app: str, role: str, namespace: str, client: CoreV1Api,
+                 on_change: Callable[[str], None] = None, on_pod_event: Callable[[str, object], None] = None,
+                 timeout_s: int = 300):
+        self.on_change = on_change
+        self.on_pod_event = on_pod_event
         self.namespace = namespace
         self.app = app
         self.role = role
+        self.label_selector = labels_selector({"app": app, "role": role})
         self.client = client
-        self.thread = threading.Thread(target=self.pod_monitor)
-        self.ip_addrs: list[str] = []
+        self.timeout_s = timeout_s
+        self.watcher = watch.Watch()
+        self.resource_version: str = None
+        self.snapshot = PodCacheSnapshot()
+        self.synced = threading.Event()  # set while the snapshot follows the watch
+        self.thread = threading.Thread(target=self.pod_monitor, daemon=True)
         self.stop_event = threading.Event()
 
+    @property
+    def ip_addrs(self) -> frozenset[str]:
+        return self.snapshot.ip_addrs
+
+    # None while the cache is not synced, the caller lists the pods itself
+    def ready_pods(self, container_name) -> list[V1Pod]:
+        if not self.synced.is_set():
+            return None
+        return self.snapshot.ready_pods(container_name)
+
     def start(self):
         self.thread.start()
 
     def stop(self):
         self.stop_event.set()
+        self.watcher.stop()
         self.thread.join()
@@ -1,13 +1,14 @@
 from kubernetes.client import CoreV1Api
 
+from main.api_groups import utils
+
 
 # Returns a list of services https://github.com/kubernetes-client/python/blob/master/kubernetes/docs/V1Service.md
 
 
 def get_service_by_name(core_api_client: CoreV1Api, namespace, name):
-    services = core_api_client.list_service_for_all_namespaces(watch=False)
-    return list(filter(lambda service: service.metadata.name == name and service.metadata.namespace == namespace,
-                       services.items))
+    service = utils.read_or_none(core_api_client.read_namespaced_service, name, namespace)
+    return [] if service is None else [service]
 
 
 def get_service_ip(service):
@@ -1,6 +1,9 @@
 import os
 
 from kubernetes import config
+from kubernetes.client.rest import ApiException
+
+
 def get_incluster_namespace():
     ns_path = "/var/run/secrets/kubernetes.io/serviceaccount/namespace"
     if os.path.exists(ns_path):
@@ -10,4 +13,14 @@ def get_incluster_namespace():
         _, active_context = config.list_kube_config_contexts()
         return active_context["context"]["namespace"]
     except KeyError:
-        return "default"
\ No newline at end of file
+        return "default"
+
+
+# Direct read by name, returning None instead of raising when the object does not exist
+def read_or_none(read_fn, name, namespace, **kwargs):
+    try:
+        return read_fn(name, namespace, **kwargs)
+    except ApiException as e:
+        if e.status == 404:
+            return None
+        raise
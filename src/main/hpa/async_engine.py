@@ -0,0 +1,56 @@
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
+
+from main.hpa.dataset_prober import ProbeResult
+
+
+# Runs the scaling cycles on one event loop thread. The blocking API calls of a cycle go to a thread pool side by
+# side: the ready pods, the pod metrics and the deployment are read at the same time, and the datasets-info probes
+# can start as soon as the pod IPs are known. Cycles are submitted from any thread and run concurrently.
+class AsyncEngine:
+
+    def __init__(self, max_workers: int = 16):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="async-engine")
+        self.loop = asyncio.new_event_loop()
+        self.loop.set_default_executor(self.executor)
+        self.thread = threading.Thread(target=self.loop.run_forever, name="async-engine", daemon=True)
+        self.thread.start()
+
+    # Blocks the calling thread until the coroutine is done
+    def run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    async def call(self, fn, *args):
+        return await self.loop.run_in_executor(self.executor, fn, *args)
+
+    # Same snapshot as ClusterActions.get_snapshot, with the reads overlapped. When probe_pods is given the probes
+    # of the ready pods are started right after the pod list, the returned future holds their results.
+    async def get_snapshot(self, cluster_actions,
+                           probe_pods: Callable[[list[str]], dict[str, ProbeResult]] = None) -> tuple[object, Future]:
+        probes: list[Future] = []
+
+        async def ready_pods():
+            name_ip_pairs = await self.call(cluster_actions.get_name_ip_pairs)
+            if probe_pods is not None:
+                probes.append(self.executor.submit(probe_pods, [ip for _, ip in name_ip_pairs]))
+            return name_ip_pairs
+
+        async def pods_usages(pods_task):
+            if getattr(cluster_actions, "kubelet_usage", None) is not None:
+                # the kubelet source reads the nodes of the ready pods
+                await pods_task
+            return await self.call(cluster_actions.get_pods_usages)
+
+        pods_task = asyncio.ensure_future(ready_pods())
+        name_ip_pairs, usages, deployment = await asyncio.gather(pods_task, pods_usages(pods_task),
+                                                                 self.call(cluster_actions.read_deployment))
+        snapshot = await self.call(lambda: cluster_actions.complete_snapshot(
+            cluster_actions.build_snapshot(name_ip_pairs, usages, deployment)))
+        return snapshot, probes[0] if probes else None
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.executor.shutdown(wait=False)
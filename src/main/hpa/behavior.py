@@ -0,0 +1,157 @@
+import json
+import math
+from collections import deque
+
+POLICY_PODS = "Pods"
+POLICY_PERCENT = "Percent"
+SELECT_MAX = "Max"
+SELECT_MIN = "Min"
+SELECT_DISABLED = "Disabled"
+# upper bound of every history, the windows usually hold far fewer cycles
+MAX_ENTRIES = 4096
+
+
+class ScalingPolicy:
+
+    def __init__(self, policy_type: str, value: int, period_s: float):
+        if policy_type not in (POLICY_PODS, POLICY_PERCENT):
+            raise ValueError(f"Unknown scaling policy type {policy_type}")
+        if value <= 0 or period_s <= 0:
+            raise ValueError("Scaling policy value and periodSeconds must be positive")
+        self.type = policy_type
+        self.value = value
+        self.period_s = period_s
+
+
+# Same fields as the policies of a HorizontalPodAutoscaler behavior: [{"type": "Pods", "value": 4,
+# "periodSeconds": 60}, {"type": "Percent", "value": 100, "periodSeconds": 60}]
+def parse_scaling_policies(text: str) -> list[ScalingPolicy]:
+    if not text:
+        return []
+    return [ScalingPolicy(p["type"], int(p["value"]), float(p["periodSeconds"])) for p in json.loads(text)]
+
+
+# Largest (or smallest) value added in the last window_s. A monotonic deque: every value is added and dropped once,
+# and only values that can still become the extreme are kept.
+class WindowExtreme:
+
+    def __init__(self, window_s: float, maximum: bool, max_entries: int = MAX_ENTRIES):
+        self.window_s = window_s
+        self.maximum = maximum
+        self.entries: deque[tuple[float, int]] = deque(maxlen=max_entries)
+
+    def dominates(self, a: int, b: int) -> bool:
+        return a >= b if self.maximum else a <= b
+
+    def add(self, t: float, value: int):
+        while self.entries and self.dominates(value, self.entries[-1][1]):
+            self.entries.pop()
+        self.entries.append((t, value))
+
+    def value(self, now: float) -> int:
+        while self.entries and self.entries[0][0] < now - self.window_s:
+            self.entries.popleft()
+        return self.entries[0][1] if self.entries else None
+
+
+class ScalingRules:
+
+    def __init__(self, stabilization_s: float = 0, policies: list[ScalingPolicy] = None, select: str = SELECT_MAX):
+        if select not in (SELECT_MAX, SELECT_MIN, SELECT_DISABLED):
+            raise ValueError(f"Unknown select policy {select}")
+        self.stabilization_s = stabilization_s
+        self.policies = policies if policies is not None else []
+        self.select = select
+
+    @property
+    def period_s(self) -> float:
+        return max((p.period_s for p in self.policies), default=0)
+
+
+# HPA v2 behavior. The recommendation of a cycle is stabilized over the recommendations of the last
+# stabilization window of its direction: a scale-up goes no higher than the lowest of them and a scale-down no
+# lower than the highest. The change is then limited by the policies, each allowing Pods or Percent replicas per
+# period counted from the replicas at the start of the period; select Max applies the one allowing the largest
+# change, Min the smallest, Disabled forbids scaling in that direction.
+class ScalingBehavior:
+
+    def __init__(self, scale_up: ScalingRules, scale_down: ScalingRules):
+        self.scale_up = scale_up
+        self.scale_down = scale_down
+        self.up_window = WindowExtreme(scale_up.stabilization_s, maximum=False)
+        self.down_window = WindowExtreme(scale_down.stabilization_s, maximum=True)
+        self.events: deque[tuple[float, int]] = deque(maxlen=MAX_ENTRIES)  # (time, replicas change)
+
+    def record_recommendation(self, now: float, desired: int):
+        self.up_window.add(now, desired)
+        self.down_window.add(now, desired)
+
+    # As if desired was already recorded
+    def stabilize(self, now: float, current: int, desired: int) -> int:
+        up_recommendation = self.up_window.value(now)
+        down_recommendation = self.down_window.value(now)
+        up_recommendation = desired if up_recommendation is None else min(up_recommendation, desired)
+        down_recommendation = desired if down_recommendation is None else max(down_recommendation, desired)
+        return min(max(current, up_recommendation), down_recommendation)
+
+    def changed_in(self, now: float, period_s: float, scale_up: bool) -> int:
+        return sum(abs(delta) for t, delta in self.events if t > now - period_s and (delta > 0) == scale_up)
+
+    def scale_up_limit(self, now: float, current: int) -> float:
+        rules = self.scale_up
+        if rules.select == SELECT_DISABLED:
+            return current
+        limits = []
+        for policy in rules.policies:
+            start = current - self.changed_in(now, policy.period_s, True)
+            if policy.type == POLICY_PODS:
+                limits.append(start + policy.value)
+            else:
+                limits.append(math.ceil(start * (1 + policy.value / 100)))
+        if not limits:
+            return math.inf
+        return max(current, max(limits) if rules.select == SELECT_MAX else min(limits))
+
+    def scale_down_limit(self, now: float, current: int) -> float:
+        rules = self.scale_down
+        if rules.select == SELECT_DISABLED:
+            return current
+        limits = []
+        for policy in rules.policies:
+            start = current + self.changed_in(now, policy.period_s, False)
+            if policy.type == POLICY_PODS:
+                limits.append(start - policy.value)
+            else:
+                limits.append(int(start * (1 - policy.value / 100)))
+        if not limits:
+            return -math.inf
+        return min(current, min(limits) if rules.select == SELECT_MAX else max(limits))
+
+    # Records the recommendation of this cycle and returns the replicas it may scale to. Without record the caller
+    # records the replicas it actually scales to with record_recommendation.
+    def apply(self, now: float, current: int, desired: int, record: bool = True) -> int:
+        if record:
+            self.record_recommendation(now, desired)
+        stabilized = self.stabilize(now, current, desired)
+        if stabilized > current:
+            return int(min(stabilized, self.scale_up_limit(now, current)))
+        if stabilized < current:
+            return int(max(stabilized, self.scale_down_limit(now, current)))
+        return stabilized
+
+    def record_scale(self, now: float, old: int, new: int):
+        period_s = max(self.scale_up.period_s, self.scale_down.period_s)
+        while self.events and self.events[0][0] <= now - period_s:
+            self.events.popleft()
+        if new != old:
+            self.events.append((now, new - old))
+
+    def to_state(self) -> dict:
+        return {"up": list(self.up_window.entries), "down": list(self.down_window.entries),
+                "events": list(self.events)}
+
+    # Entries older than the configured windows and periods expire on the next cycle
+    def restore(self, state: dict):
+        self.up_window.entries.extend((t, v) for t, v in state.get("up", []))
+        self.down_window.entries.extend((t, v) for t, v in state.get("down", []))
+        self.events.extend((t, delta) for t, delta in state.get("events", []))
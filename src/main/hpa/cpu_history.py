@@ -0,0 +1,104 @@
+import math
+from array import array
+
+AGGREGATION_INSTANT = "instant"
+AGGREGATION_EWMA = "ewma"
+AGGREGATION_PERCENTILE = "percentile"
+AGGREGATION_MAX = "max"
+AGGREGATIONS = (AGGREGATION_INSTANT, AGGREGATION_EWMA, AGGREGATION_PERCENTILE, AGGREGATION_MAX)
+
+
+# Fixed capacity ring of floats backed by a flat array, the oldest value is overwritten when full
+class RingBuffer:
+    __slots__ = ("data", "start", "count")
+
+    def __init__(self, capacity: int):
+        self.data = array('d', bytes(8 * capacity))
+        self.start = 0
+        self.count = 0
+
+    @property
+    def capacity(self) -> int:
+        return len(self.data)
+
+    def __len__(self):
+        return self.count
+
+    def append(self, value: float):
+        if self.count < self.capacity:
+            self.data[(self.start + self.count) % self.capacity] = value
+            self.count += 1
+        else:
+            self.data[self.start] = value
+            self.start = (self.start + 1) % self.capacity
+
+    def values(self) -> list[float]:
+        return [self.data[(self.start + i) % self.capacity] for i in range(self.count)]
+
+    def last(self) -> float:
+        return self.data[(self.start + self.count - 1) % self.capacity]
+
+    def max(self) -> float:
+        return max(self.values())
+
+
+def percentile(values: list[float], p: float) -> float:
+    ordered = sorted(values)
+    rank = max(1, math.ceil(p / 100 * len(ordered)))  # nearest rank
+    return ordered[rank - 1]
+
+
+# Bounded CPU history per pod. Pods missing from a sample are evicted with their history.
+class CpuHistory:
+
+    def __init__(self, aggregation: str, window: int, ewma_alpha: float = 0.5, percentile: float = 90):
+        if aggregation not in AGGREGATIONS:
+            raise ValueError(f"Unknown CPU aggregation {aggregation}, expected one of {AGGREGATIONS}")
+        self.aggregation = aggregation
+        self.window = window
+        self.ewma_alpha = ewma_alpha
+        self.percentile = percentile
+        self.buffers: dict[str, RingBuffer] = {}
+        self.ewma: dict[str, float] = {}
+
+    def record(self, pods_cpu_m: dict[str, float]):
+        for name in [n for n in self.buffers if n not in pods_cpu_m]:
+            del self.buffers[name]
+            del self.ewma[name]
+        for name, cpu_m in pods_cpu_m.items():
+            if name not in self.buffers:
+                self.buffers[name] = RingBuffer(self.window)
+                self.ewma[name] = cpu_m
+            else:
+                self.ewma[name] = self.ewma_alpha * cpu_m + (1 - self.ewma_alpha) * self.ewma[name]
+            self.buffers[name].append(cpu_m)
+
+    def pod_cpu_m(self, name) -> float:
+        buffer = self.buffers[name]
+        if self.aggregation == AGGREGATION_EWMA:
+            return self.ewma[name]
+        elif self.aggregation == AGGREGATION_PERCENTILE:
+            return percentile(buffer.values(), self.percentile)
+        elif self.aggregation == AGGREGATION_MAX:
+            return buffer.max()
+        return buffer.last()
+
+    def pods_cpu_m(self) -> dict[str, float]:
+        return {name: self.pod_cpu_m(name) for name in self.buffers}
+
+    def total_cpu_m(self) -> float:
+        return sum(self.pod_cpu_m(name) for name in self.buffers)
+
+    def to_state(self) -> dict:
+        return {"samples": {name: buffer.values() for name, buffer in self.buffers.items()}, "ewma": dict(self.ewma)}
+
+    # A smaller window keeps the newest samples
+    def restore(self, state: dict):
+        for name, values in state.get("samples", {}).items():
+            if not values:
+                continue
+            buffer = RingBuffer(self.window)
+            for value in values[-self.window:]:
+                buffer.append(value)
+            self.buffers[name] = buffer
+            self.ewma[name] = state.get("ewma", {}).get(name, values[-1])
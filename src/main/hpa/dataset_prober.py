@@ -0,0 +1,120 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from enum import Enum
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class ProbeOutcome(Enum):
+    OK = 1
+    TIMEOUT = 2
+    CONNECTION_ERROR = 3
+    HTTP_ERROR = 4
+    BAD_RESPONSE = 5
+    DEADLINE_EXCEEDED = 6
+    NOT_MODIFIED = 7  # answer to a conditional probe, the previous result still holds
+
+
+class ProbeResult:
+
+    def __init__(self, outcome: ProbeOutcome, num_datasets: int = None, last_time_access: str = None,
+                 detail: str = "", elapsed_s: float = 0.0, etag: str = None):
+        self.outcome = outcome
+        self.num_datasets = num_datasets
+        self.last_time_access = last_time_access
+        self.detail = detail
+        self.elapsed_s = elapsed_s
+        self.etag = etag
+
+    @property
+    def ok(self) -> bool:
+        return self.outcome == ProbeOutcome.OK
+
+    def __repr__(self):
+        return f"ProbeResult({self.outcome.name}, numDataSets={self.num_datasets}, {self.detail})"
+
+
+# Probes /admin/datasets-info on many pods at once. Connections are kept alive per pod between cycles, every
+# request has a (connect, read) timeout and probe_all never waits longer than the overall deadline.
+class DatasetProber:
+
+    def __init__(self, port: int = 20610, path: str = "/admin/datasets-info", request_timeout_s: float = 2.0,
+                 deadline_s: float = 5.0, max_workers: int = 16, max_hosts: int = 256):
+        self.port = port
+        self.path = path
+        self.request_timeout_s = request_timeout_s
+        self.deadline_s = deadline_s
+        self.session = requests.Session()
+        # One small pool per pod ip, enough of them to keep every pod connection alive across cycles
+        self.session.mount("http://", HTTPAdapter(pool_connections=max_hosts, pool_maxsize=2, max_retries=0))
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="dataset-prober")
+
+    def url(self, pod_ip, path: str = None) -> str:
+        return f"http://{pod_ip}:{self.port}{self.path if path is None else path}"
+
+    def request(self, pod_ip, path: str = None, headers: dict = None) -> tuple[ProbeOutcome, dict, str, str]:
+        try:
+            resp = self.session.get(self.url(pod_ip, path), headers=headers,
+                                    timeout=(self.request_timeout_s, self.request_timeout_s))
+        except requests.Timeout as e:
+            return ProbeOutcome.TIMEOUT, None, str(e), None
+        except requests.RequestException as e:
+            return ProbeOutcome.CONNECTION_ERROR, None, str(e), None
+        if resp.status_code == 304:
+            return ProbeOutcome.NOT_MODIFIED, None, "", resp.headers.get("ETag")
+        if resp.status_code != 200:
+            return ProbeOutcome.HTTP_ERROR, None, f"HTTP {resp.status_code}", None
+        try:
+            return ProbeOutcome.OK, json.loads(resp.text), "", resp.headers.get("ETag")
+        except ValueError as e:
+            return ProbeOutcome.BAD_RESPONSE, None, str(e), None
+
+    def get_json(self, pod_ip, path: str = None) -> tuple[ProbeOutcome, dict, str]:
+        outcome, doc, detail, _ = self.request(pod_ip, path)
+        return outcome, doc, detail
+
+    # With the ETag of a previous answer the pod may answer 304 Not Modified instead of the whole document
+    def probe(self, pod_ip, etag: str = None) -> ProbeResult:
+        start = time.monotonic()
+        outcome, ds_info, detail, etag = self.request(pod_ip, headers={"If-None-Match": etag} if etag else None)
+        elapsed_s = time.monotonic() - start
+        if outcome != ProbeOutcome.OK:
+            return ProbeResult(outcome, detail=detail, elapsed_s=elapsed_s, etag=etag)
+        try:
+            return ProbeResult(ProbeOutcome.OK, int(ds_info['numDataSets']), ds_info.get('lastTimeAccess'),
+                               elapsed_s=elapsed_s, etag=etag)
+        except (KeyError, TypeError, ValueError) as e:
+            return ProbeResult(ProbeOutcome.BAD_RESPONSE, detail=f"missing or invalid {e}", elapsed_s=elapsed_s)
+
+    def probe_all(self, pod_ips: list[str], etags: dict[str, str] = None) -> dict[str, ProbeResult]:
+        etags = etags or {}
+        futures = {ip: self.executor.submit(self.probe, ip, etags.get(ip)) for ip in pod_ips}
+        wait(futures.values(), timeout=self.deadline_s)
+        results = {}
+        for ip, future in futures.items():
+            if future.done():
+                results[ip] = future.result()
+            else:
+                future.cancel()
+                results[ip] = ProbeResult(ProbeOutcome.DEADLINE_EXCEEDED, detail=f"no answer in {self.deadline_s}s",
+                                          elapsed_s=self.deadline_s)
+        return results
+
+    # Any other JSON endpoint of the pods, on the same connections and with the same deadline as the probes
+    def get_json_all(self, pod_ips: list[str], path: str) -> dict[str, tuple[ProbeOutcome, dict, str]]:
+        futures = {ip: self.executor.submit(self.get_json, ip, path) for ip in pod_ips}
+        wait(futures.values(), timeout=self.deadline_s)
+        results = {}
+        for ip, future in futures.items():
+            if future.done():
+                results[ip] = future.result()
+            else:
+                future.cancel()
+                results[ip] = ProbeOutcome.DEADLINE_EXCEEDED, None, f"no answer in {self.deadline_s}s"
+        return results
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
@@ -0,0 +1,119 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable
+
+from main.hpa.dataset_prober import ProbeOutcome, ProbeResult
+
+
+class CacheEntry:
+
+    def __init__(self, uid: str, ip: str, result: ProbeResult, expires_at: float):
+        self.uid = uid
+        self.ip = ip
+        self.result = result
+        self.expires_at = expires_at
+
+
+# Last datasets-info answer of every pod, keyed by pod UID and IP, so a recreated pod reusing an IP never gets the
+# answer of its predecessor. Entries live ttl_s, the least recently used go first beyond max_size, and pod events
+# (restart, new IP, deletion) drop them right away. Expired entries keep their ETag for a conditional refresh.
+class DatasetsCache:
+
+    def __init__(self, ttl_s: float, max_size: int = 1024, clock: Callable[[], float] = time.monotonic):
+        self.ttl_s = ttl_s
+        self.max_size = max_size
+        self.clock = clock
+        self.entries: OrderedDict[tuple[str, str], CacheEntry] = OrderedDict()
+        self.uids: dict[str, str] = {}  # ip -> uid, from the pod events
+        self.ips: dict[str, str] = {}  # uid -> ip
+        self.restarts: dict[str, int] = {}  # uid -> container restarts
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.invalidations = 0
+
+    def key(self, ip) -> tuple[str, str]:
+        return self.uids.get(ip), ip
+
+    # The cached result while fresh, else None and the ETag to refresh it with
+    def lookup(self, ip) -> tuple[ProbeResult, str]:
+        with self.lock:
+            entry = self.entries.get(self.key(ip))
+            if entry is None:
+                self.misses += 1
+                return None, None
+            self.entries.move_to_end(entry_key(entry))
+            if self.clock() < entry.expires_at:
+                self.hits += 1
+                return entry.result, None
+            self.misses += 1
+            return None, entry.result.etag
+
+    # Stores a fresh probe result and returns the result to use: the cached one when the pod answered 304, None when
+    # that entry was dropped since the lookup and the pod must be probed again without the ETag
+    def update(self, ip, result: ProbeResult) -> ProbeResult:
+        with self.lock:
+            key = self.key(ip)
+            if result.outcome == ProbeOutcome.NOT_MODIFIED:
+                if key not in self.entries:
+                    return None
+                entry = self.entries[key]
+                entry.expires_at = self.clock() + self.ttl_s
+                self.revalidated += 1
+                return entry.result
+            if not result.ok:
+                self.entries.pop(key, None)
+                return result
+            self.entries[key] = CacheEntry(key[0], ip, result, self.clock() + self.ttl_s)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+            return result
+
+    def invalidate(self, uid: str = None, ip: str = None):
+        with self.lock:
+            self.drop(uid, ip)
+
+    def drop(self, uid, ip):
+        for key in [k for k in self.entries if (uid is not None and k[0] == uid) or (ip is not None and k[1] == ip)]:
+            del self.entries[key]
+            self.invalidations += 1
+
+    # PodMonitor callback
+    def observe_pod(self, event_type: str, pod):
+        uid = pod.metadata.uid
+        ip = pod.status.pod_ip if pod.status else None
+        restarts = sum(cs.restart_count or 0 for cs in (pod.status.container_statuses or [])) if pod.status else 0
+        with self.lock:
+            if event_type == "DELETED":
+                self.drop(uid, self.ips.pop(uid, None))
+                self.restarts.pop(uid, None)
+                if ip is not None and self.uids.get(ip) == uid:
+                    del self.uids[ip]
+                return
+            old_ip = self.ips.get(uid)
+            if restarts > self.restarts.get(uid, restarts) or (old_ip is not None and old_ip != ip):
+                self.drop(uid, old_ip)
+            self.restarts[uid] = restarts
+            if old_ip is not None and old_ip != ip and self.uids.get(old_ip) == uid:
+                del self.uids[old_ip]
+            if ip is not None:
+                if self.uids.get(ip) not in (None, uid):
+                    self.drop(None, ip)
+                self.uids[ip] = uid
+                self.ips[uid] = ip
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> dict:
+        return {"size": len(self.entries), "hits": self.hits, "misses": self.misses, "revalidated": self.revalidated,
+                "invalidations": self.invalidations, "hit_ratio": round(self.hit_ratio, 3)}
+
+
+def entry_key(entry: CacheEntry) -> tuple[str, str]:
+    return entry.uid, entry.ip
@@ -0,0 +1,67 @@
+import threading
+import time
+from typing import Callable
+
+
+# Decides when the next scaling evaluation runs. Watch events wake it up right away (but never sooner than
+# min_interval_s after the previous evaluation, unless the event is immediate), the interval shrinks to
+# min_interval_s while the usage is close to a threshold and grows up to max_interval_s while nothing happens.
+class EvaluationScheduler:
+
+    def __init__(self, min_interval_s: float, max_interval_s: float, base_interval_s: float,
+                 near_margin: float = 0.1, backoff: float = 2.0, clock: Callable[[], float] = time.monotonic):
+        self.min_interval_s = min_interval_s
+        self.max_interval_s = max_interval_s
+        self.base_interval_s = max(min_interval_s, min(max_interval_s, base_interval_s))
+        self.near_margin = near_margin
+        self.backoff = backoff
+        self.clock = clock
+        self.interval_s = self.base_interval_s
+        self.last_evaluation = None
+        self.wake_event = threading.Event()
+        self.wake_reason = None
+        self.wake_immediate = False
+        self.wakeups = 0
+
+    # immediate skips the debounce, for a single event that must be acted on now like a leadership change
+    def notify(self, reason: str, immediate: bool = False):
+        self.wake_reason = reason
+        self.wake_immediate = self.wake_immediate or immediate
+        self.wake_event.set()
+
+    def is_near_threshold(self, utilization: float, lower_threshold: float, upper_threshold: float) -> bool:
+        return abs(utilization - upper_threshold) <= self.near_margin \
+            or abs(utilization - lower_threshold) <= self.near_margin
+
+    # acted: the last evaluation changed the replicas. utilization: usage over requested CPU of the ready pods.
+    def next_interval(self, acted: bool, utilization: float, lower_threshold: float, upper_threshold: float) -> float:
+        if acted:
+            # pods are starting, the Ready events will wake us up earlier if they come before the timer
+            self.interval_s = self.base_interval_s
+        elif utilization is not None and self.is_near_threshold(utilization, lower_threshold, upper_threshold):
+            self.interval_s = self.min_interval_s
+        else:
+            self.interval_s = min(self.max_interval_s, max(self.interval_s, self.min_interval_s) * self.backoff)
+        return self.interval_s
+
+    def mark_evaluation(self):
+        self.last_evaluation = self.clock()
+
+    # Blocks until the interval expires or an event arrives. Returns what ended the wait.
+    def wait(self, interval_s: float = None) -> str:
+        interval_s = self.interval_s if interval_s is None else interval_s
+        start = self.last_evaluation if self.last_evaluation is not None else self.clock()
+        woken = self.wake_event.wait(max(0.0, start + interval_s - self.clock()))
+        reason = "timer"
+        if woken:
+            self.wakeups += 1
+            reason = self.wake_reason or "event"
+            immediate = self.wake_immediate
+            self.wake_event.clear()
+            self.wake_reason = None
+            self.wake_immediate = False
+            # debounce bursts of events, a rollout emits one per pod
+            remaining = start + self.min_interval_s - self.clock()
+            if remaining > 0 and not immediate:
+                time.sleep(remaining)
+        return reason
@@ -0,0 +1,101 @@
+import math
+from array import array
+
+
+# Additive Holt-Winters (level, trend and one seasonal term per slot of the season). Updates are O(1) except the
+# one that completes the first season and initializes the model; past observations are never refitted.
+class HoltWinters:
+
+    def __init__(self, season_length: int, alpha: float = 0.3, beta: float = 0.02, gamma: float = 0.3):
+        self.season_length = season_length
+        self.alpha = alpha
+        self.beta = beta
+        self.gamma = gamma
+        self.level = None
+        self.trend = 0.0
+        self.seasonal = array('d', bytes(8 * season_length))
+        self.observations = 0
+
+    def update(self, value: float):
+        idx = self.observations % self.season_length
+        if self.observations < self.season_length:
+            # the first season is kept raw and becomes the initial level and seasonal terms once complete
+            self.seasonal[idx] = value
+            if idx == self.season_length - 1:
+                self.level = sum(self.seasonal) / self.season_length
+                for i in range(self.season_length):
+                    self.seasonal[i] -= self.level
+        else:
+            last_level = self.level
+            season = self.seasonal[idx]
+            self.level = self.alpha * (value - season) + (1 - self.alpha) * (self.level + self.trend)
+            self.trend = self.beta * (self.level - last_level) + (1 - self.beta) * self.trend
+            self.seasonal[idx] = self.gamma * (value - self.level) + (1 - self.gamma) * season
+        self.observations += 1
+
+    @property
+    def ready(self) -> bool:
+        return self.observations >= self.season_length
+
+    # Expected value h observations after the last one
+    def forecast(self, h: int) -> float:
+        idx = (self.observations + h - 1) % self.season_length
+        return self.level + h * self.trend + self.seasonal[idx]
+
+    def to_state(self) -> dict:
+        return {"level": self.level, "trend": self.trend, "seasonal": list(self.seasonal),
+                "observations": self.observations}
+
+    # Ignored when the season length changed, the slots would no longer line up
+    def restore(self, state: dict) -> bool:
+        if len(state.get("seasonal", [])) != self.season_length:
+            return False
+        self.level = state["level"]
+        self.trend = state["trend"]
+        self.seasonal = array('d', state["seasonal"])
+        self.observations = state["observations"]
+        return True
+
+
+# Feeds Holt-Winters with the mean total CPU of fixed time slots, whatever the evaluation interval is, and forecasts it
+# one pod startup ahead.
+class LoadForecaster:
+
+    def __init__(self, season_s: float, slot_s: float, horizon_s: float, alpha: float = 0.3, beta: float = 0.02,
+                 gamma: float = 0.3):
+        self.slot_s = slot_s
+        self.horizon_slots = max(1, math.ceil(horizon_s / slot_s))
+        self.model = HoltWinters(max(1, round(season_s / slot_s)), alpha, beta, gamma)
+        self.slot = None
+        self.slot_sum = 0.0
+        self.slot_count = 0
+
+    def record(self, now: float, total_cpu_m: float):
+        slot = int(now // self.slot_s)
+        if self.slot is not None and slot != self.slot:
+            value = self.slot_sum / self.slot_count
+            # slots without samples (controller down, long interval) repeat the last known value
+            for _ in range(min(slot - self.slot, self.model.season_length)):
+                self.model.update(value)
+            self.slot_sum = 0.0
+            self.slot_count = 0
+        self.slot = slot
+        self.slot_sum += total_cpu_m
+        self.slot_count += 1
+
+    def to_state(self) -> dict:
+        return {"slot_s": self.slot_s, "slot": self.slot, "slot_sum": self.slot_sum, "slot_count": self.slot_count,
+                "model": self.model.to_state()}
+
+    def restore(self, state: dict):
+        if state.get("slot_s") != self.slot_s or not self.model.restore(state.get("model", {})):
+            return
+        self.slot = state["slot"]
+        self.slot_sum = state["slot_sum"]
+        self.slot_count = state["slot_count"]
+
+    def predicted_cpu_m(self) -> float:
+        if not self.model.ready:
+            return None
+        # the current slot is not in the model yet, so it counts as one more step ahead
+        return max(0.0, self.model.forecast(self.horizon_slots + 1))
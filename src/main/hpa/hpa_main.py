@@ -1,9 +1,34 @@
 #!/usr/bin/env python3
+import atexit
+import copy
 import os
 
 from kubernetes.client import CoreV1Api, AppsV1Api, CustomObjectsApi
+from kubernetes.client.rest import ApiException
 
 from main.api_groups import deployment_api, custom_objects_api, pod_api, utils
+from main.api_groups.api_client import BudgetedApiClient, new_api_client
+from main.hpa.async_engine import AsyncEngine
+from main.hpa.behavior import SELECT_MAX, ScalingBehavior, ScalingRules, parse_scaling_policies
+from main.hpa.cpu_history import AGGREGATION_INSTANT, CpuHistory
+from main.hpa.dataset_prober import DatasetProber, ProbeResult
+from main.hpa.datasets_cache import DatasetsCache
+from main.hpa.evaluation_scheduler import EvaluationScheduler
+from main.hpa.forecast import LoadForecaster
+from main.hpa.metric_sources import MetricSource, MetricValue, parse_metric_sources, read_metric_sources
+from main.hpa.kubelet_usage import KubeletUsageSource
+from main.hpa.leader_election import LEADERSHIP_ACQUIRED, LeaderElector
+from main.hpa.instrumentation import HpaMetrics, InstrumentedApi, MetricsServer, instrument_cluster_actions, \
+    instrument_custom_app_info
+from main.hpa.namespace_cache import NamespaceCache
+from main.hpa.scheduler import TargetScheduler
+from main.hpa.shadow import ShadowEvaluator, ShadowPolicy, parse_shadow_policies
+from main.hpa.standby_pool import StandbyPool
+from main.hpa.state_store import ConfigMapStateStore, FileStateStore, StateStore, controller_state, \
+    restore_controller_state
+from main.hpa.structured_log import SAMPLED, CycleRecord, logger, setup_logging
+from main.hpa.targets import Target, load_targets_configmap, load_targets_file
+from main.hpa.victim_ranking import VICTIM_COST, VictimRanker, select_victims
 
 # https://setuptools.pypa.io/en/latest/setuptools.html#develop-deploy-the-project-source-in-development-mode
 # https://www.jetbrains.com/pycharm/guide/tutorials/visual_pytest/setup/
@@ -11,10 +36,13 @@ os.environ['KUBERNETES_SERVICE_HOST'] = 'kubernetes.default.svc'
 os.environ['KUBERNETES_SERVICE_PORT'] = '443'
 from kubernetes import client, config
 
+import math
+import signal
+from concurrent.futures import ThreadPoolExecutor
+import socket
 import time
 import sys
-import requests
-import json
+from typing import Callable, Mapping
 
 
 def get_namespace():
@@ -33,43 +61,123 @@ def load_config():
         config.load_incluster_config()
 
 
-def log_line(str):
-    sys.stdout.write(str + '\n')
-    sys.stdout.flush()
-
-
 class CustomAppInfo:
 
+    def __init__(self, prober: DatasetProber = None, cache: DatasetsCache = None):
+        self.prober = prober if prober is not None else DatasetProber()
+        self.cache = cache
+
     def get_pod_num_datasets(self, pod_ip):
-        num_ds = None
-        try:
-            url = f"http://{pod_ip}:20610/admin/datasets-info"
-            log_line(f"GET {url}")
-            ds_infostr = requests.get(url).text
-            log_line(f"RESP: {ds_infostr}")
-            ds_info = json.loads(ds_infostr)
+        result = self.prober.probe(pod_ip)
+        logger.debug("GET %s: %s", self.prober.url(pod_ip), result, extra=SAMPLED)
+        if not result.ok:
+            logger.warning("GET %s failed: %s", self.prober.url(pod_ip), result.detail)
+        return result.num_datasets
+
+    # All pods are probed concurrently, the call takes about as long as the slowest healthy pod. With a cache only
+    # the pods without a fresh answer are probed, conditionally when an earlier answer had an ETag.
+    def get_pods_num_datasets(self, pod_ips: list[str]) -> dict[str, ProbeResult]:
+        if self.cache is None:
+            return self.prober.probe_all(pod_ips)
+        results = {}
+        etags = {}
+        for ip in pod_ips:
+            result, etag = self.cache.lookup(ip)
+            if result is not None:
+                results[ip] = result
+            else:
+                etags[ip] = etag
+        if etags:
+            evicted = []
+            for ip, result in self.prober.probe_all(list(etags), etags).items():
+                cached = self.cache.update(ip, result)
+                if cached is None:
+                    evicted.append(ip)
+                else:
+                    results[ip] = cached
+            if evicted:
+                for ip, result in self.prober.probe_all(evicted).items():
+                    results[ip] = self.cache.update(ip, result) or result
+        logger.info("Datasets cache: %s probed of %s", len(etags), len(pod_ips), extra={"fields": self.cache.stats()})
+        return results
 
-            num_ds = ds_info['numDataSets']
-            lt_str = ds_info['lastTimeAccess']
 
-        except Exception as e:
-            log_line(str(e))
-            sys.stderr.write(str(e))
-        return num_ds
+last_scaleup = time.time()
 
+SCALING_MODE_STEP = "step"
+SCALING_MODE_PROPORTIONAL = "proportional"
 
-last_scaleup = time.time()
+CPU_USAGE_METRICS_SERVER = "metrics-server"
+CPU_USAGE_KUBELET = "kubelet"
+
+ENGINE_SYNC = "sync"
+ENGINE_ASYNC = "async"
 
 
 class HpaConfig:
 
-    def __init__(self):
-        self.mir = int(os.getenv('MIN_REPLICAS'))
-        self.mar = int(os.getenv('MAX_REPLICAS'))
-        self.uct = float(os.getenv('UPPER_CPU_THRESHOLD'))  # 0.7
-        self.lct = float(os.getenv('LOWER_CPU_THRESHOLD'))  # 0.4
-        self.lts = int(os.getenv('LOOP_TIME_S'))  # Amout of time that takes to a pod to be ready
-        self.nsdp = int(os.getenv('NO_SCALE_DOWN_PERIOD'))
+    def __init__(self, env: Mapping[str, str] = None):
+        env = os.environ if env is None else env
+        self.env = dict(env)  # the shadow policies override some of it
+        self.mir = int(env.get('MIN_REPLICAS'))
+        self.mar = int(env.get('MAX_REPLICAS'))
+        self.uct = float(env.get('UPPER_CPU_THRESHOLD'))  # 0.7
+        self.lct = float(env.get('LOWER_CPU_THRESHOLD'))  # 0.4
+        self.lts = int(env.get('LOOP_TIME_S'))  # Amout of time that takes to a pod to be ready
+        self.nsdp = int(env.get('NO_SCALE_DOWN_PERIOD'))
+        self.spmi = int(env.get('STANDBY_POOL_MIN', '0'))
+        self.spma = int(env.get('STANDBY_POOL_MAX', '0'))  # 0 disables the standby pool
+        self.spw = int(env.get('STANDBY_POOL_WINDOW_S', '3600'))
+        self.sppc = env.get('STANDBY_PRIORITY_CLASS', 'hpa-standby')
+        self.pts = float(env.get('PROBE_TIMEOUT_S', '2'))
+        self.pds = float(env.get('PROBE_DEADLINE_S', '5'))
+        self.pw = int(env.get('PROBE_WORKERS', '16'))
+        self.tw = int(env.get('TARGET_WORKERS', '4'))
+        self.sm = env.get('SCALING_MODE', SCALING_MODE_STEP)
+        self.mlts = float(env.get('MIN_LOOP_TIME_S', self.lts))
+        self.xlts = float(env.get('MAX_LOOP_TIME_S', self.lts))
+        self.ntm = float(env.get('NEAR_THRESHOLD_MARGIN', '0.1'))
+        self.ca = env.get('CPU_AGGREGATION', AGGREGATION_INSTANT)
+        self.cw = int(env.get('CPU_WINDOW', '5'))
+        self.cea = float(env.get('CPU_EWMA_ALPHA', '0.5'))
+        self.cp = float(env.get('CPU_PERCENTILE', '90'))
+        self.ps = env.get('PREDICTIVE_SCALING', 'false').lower() == 'true'
+        self.pss = float(env.get('POD_STARTUP_S', self.lts))
+        self.fss = float(env.get('FORECAST_SEASON_S', '86400'))
+        self.fsl = float(env.get('FORECAST_SLOT_S', '300'))
+        self.ll = env.get('LOG_LEVEL', 'INFO')
+        self.lse = int(env.get('LOG_SAMPLE_EVERY', '1'))  # keep one in every N per-pod debug lines
+        self.aq = float(env.get('API_QPS', '20'))  # 0 disables the client side rate budget
+        self.ab = int(env.get('API_BURST', '40'))
+        self.ats = float(env.get('API_TIMEOUT_S', '30'))
+        self.amr = int(env.get('API_MAX_RETRIES', '4'))
+        self.dcts = float(env.get('DATASETS_CACHE_TTL_S', '0'))  # 0 probes every pod every time
+        self.dcs = int(env.get('DATASETS_CACHE_SIZE', '1024'))
+        self.pc = env.get('POD_CACHE', 'false').lower() == 'true'
+        self.sp = env.get('SHADOW_POLICIES', '')  # JSON object of policy name to settings
+        self.uss = float(env.get('SCALE_UP_STABILIZATION_S', '0'))
+        self.dss = float(env.get('SCALE_DOWN_STABILIZATION_S', '0'))
+        self.upo = env.get('SCALE_UP_POLICIES', '')  # JSON list of HPA scaling policies, empty is no limit
+        self.dpo = env.get('SCALE_DOWN_POLICIES', '')
+        self.use = env.get('SCALE_UP_SELECT', SELECT_MAX)
+        self.dse = env.get('SCALE_DOWN_SELECT', SELECT_MAX)
+        self.aps = int(env.get('API_POOL_SIZE', '32'))
+        self.ms = env.get('METRIC_SOURCES', '')  # JSON list of extra scaling signals
+        self.cus = env.get('CPU_USAGE_SOURCE', CPU_USAGE_METRICS_SERVER)
+        self.kw = int(env.get('KUBELET_WORKERS', '8'))
+        self.le = env.get('LEADER_ELECTION', 'false').lower() == 'true'
+        self.ln = env.get('LEASE_NAME', 'k8s-hpa')
+        self.lds = float(env.get('LEASE_DURATION_S', '10'))
+        self.lrs = float(env.get('LEASE_RETRY_S', '1'))
+        self.dc = float(env.get('DATASET_COST', '100'))
+        self.ahl = float(env.get('ACCESS_HALF_LIFE_S', '600'))
+        self.cc = float(env.get('CPU_COST', '1'))
+        self.mp = int(env.get('METRICS_PORT', '0'))  # 0 disables the /metrics endpoint
+        self.en = env.get('ENGINE', ENGINE_SYNC)
+        self.ew = int(env.get('ENGINE_WORKERS', '16'))
+        self.stf = env.get('STATE_FILE', '')
+        self.stc = env.get('STATE_CONFIGMAP', '')
+        self.ssi = float(env.get('STATE_SAVE_INTERVAL_S', '30'))
 
     @property
     def no_scale_down_period_s(self):
@@ -95,68 +203,434 @@ class HpaConfig:
     def max_replicas(self) -> int:
         return self.mar
 
+    @property
+    def standby_pool_min(self) -> int:
+        return self.spmi
+
+    @property
+    def standby_pool_max(self) -> int:
+        return self.spma
+
+    @property
+    def standby_pool_window_s(self) -> int:
+        return self.spw
+
+    @property
+    def standby_priority_class(self) -> str:
+        return self.sppc
+
+    @property
+    def probe_timeout_s(self) -> float:
+        return self.pts
+
+    @property
+    def probe_deadline_s(self) -> float:
+        return self.pds
+
+    @property
+    def probe_workers(self) -> int:
+        return self.pw
+
+    @property
+    def target_workers(self) -> int:
+        return self.tw
+
+    @property
+    def scaling_mode(self) -> str:
+        return self.sm
+
+    @property
+    def min_loop_time_s(self) -> float:
+        return self.mlts
+
+    @property
+    def max_loop_time_s(self) -> float:
+        return self.xlts
+
+    @property
+    def near_threshold_margin(self) -> float:
+        return self.ntm
+
+    @property
+    def cpu_aggregation(self) -> str:
+        return self.ca
+
+    @property
+    def cpu_window(self) -> int:
+        return self.cw
+
+    @property
+    def cpu_ewma_alpha(self) -> float:
+        return self.cea
+
+    @property
+    def cpu_percentile(self) -> float:
+        return self.cp
+
+    @property
+    def predictive_scaling(self) -> bool:
+        return self.ps
+
+    @property
+    def pod_startup_s(self) -> float:
+        return self.pss
+
+    @property
+    def forecast_season_s(self) -> float:
+        return self.fss
+
+    @property
+    def forecast_slot_s(self) -> float:
+        return self.fsl
+
+    @property
+    def metrics_port(self) -> int:
+        return self.mp
+
+    @property
+    def log_level(self) -> str:
+        return self.ll
+
+    @property
+    def log_sample_every(self) -> int:
+        return self.lse
+
+    @property
+    def api_qps(self) -> float:
+        return self.aq
+
+    @property
+    def api_burst(self) -> int:
+        return self.ab
+
+    @property
+    def api_timeout_s(self) -> float:
+        return self.ats
+
+    @property
+    def api_max_retries(self) -> int:
+        return self.amr
+
+    @property
+    def api_pool_size(self) -> int:
+        return self.aps
+
+    @property
+    def datasets_cache_ttl_s(self) -> float:
+        return self.dcts
+
+    @property
+    def datasets_cache_size(self) -> int:
+        return self.dcs
+
+    @property
+    def scale_up_stabilization_s(self) -> float:
+        return self.uss
+
+    @property
+    def scale_down_stabilization_s(self) -> float:
+        return self.dss
+
+    @property
+    def scale_up_policies(self) -> str:
+        return self.upo
+
+    @property
+    def scale_down_policies(self) -> str:
+        return self.dpo
+
+    @property
+    def scale_up_select(self) -> str:
+        return self.use
+
+    @property
+    def scale_down_select(self) -> str:
+        return self.dse
+
+    @property
+    def shadow_policies(self) -> str:
+        return self.sp
+
+    @property
+    def pod_cache(self) -> bool:
+        return self.pc
+
+    @property
+    def metric_sources(self) -> str:
+        return self.ms
+
+    @property
+    def cpu_usage_source(self) -> str:
+        return self.cus
+
+    @property
+    def kubelet_workers(self) -> int:
+        return self.kw
+
+    @property
+    def leader_election(self) -> bool:
+        return self.le
+
+    @property
+    def lease_name(self) -> str:
+        return self.ln
+
+    @property
+    def lease_duration_s(self) -> float:
+        return self.lds
+
+    @property
+    def lease_retry_s(self) -> float:
+        return self.lrs
+
+    @property
+    def state_file(self) -> str:
+        return self.stf
+
+    @property
+    def state_configmap(self) -> str:
+        return self.stc
+
+    @property
+    def state_save_interval_s(self) -> float:
+        return self.ssi
+
+    @property
+    def dataset_cost(self) -> float:
+        return self.dc
+
+    @property
+    def access_half_life_s(self) -> float:
+        return self.ahl
+
+    @property
+    def cpu_cost(self) -> float:
+        return self.cc
+
+    @property
+    def engine(self) -> str:
+        return self.en
+
+    @property
+    def engine_workers(self) -> int:
+        return self.ew
+
+
+def cpu_millis(cpu_s: str) -> int:
+    req_cpu_m = 0
+    if 'm' in cpu_s:
+        req_cpu_m = int(cpu_s[:len(cpu_s) - 1])
+    return req_cpu_m
+
+
+# Everything a scaling decision reads, gathered once at the start of a cycle
+class ClusterSnapshot:
+
+    def __init__(self,
+                 name_ip_pairs: list[tuple[str, str]],
+                 total_cpu_m: float,
+                 deployment_replicas: int,
+                 requested_cpu_m: int,
+                 resource_version: str = None,
+                 pods_cpu_m: dict[str, float] = None,
+                 raw_total_cpu_m: float = None):
+        self.name_ip_pairs = name_ip_pairs
+        self.total_cpu_m = total_cpu_m  # smoothed when a CPU aggregation is configured
+        self.raw_total_cpu_m = total_cpu_m if raw_total_cpu_m is None else raw_total_cpu_m
+        self.pods_cpu_m = pods_cpu_m if pods_cpu_m is not None else {}
+        self.predicted_cpu_m: float = None  # total CPU expected one pod startup ahead
+        self.metrics: dict[str, MetricValue] = {}  # of the configured metric sources
+        self.deployment_replicas = deployment_replicas
+        self.requested_cpu_m = requested_cpu_m
+        self.resource_version = resource_version  # of the deployment, used as write precondition
+
+    @property
+    def num_replicas_ready(self) -> int:
+        return len(self.name_ip_pairs)
+
+    @property
+    def cpu_utilization(self) -> float:
+        total_req = self.requested_cpu_m * self.num_replicas_ready
+        if total_req == 0:
+            return None
+        return self.total_cpu_m / total_req
+
 
 class ClusterActions:
-    def __init__(self, core_api_c: CoreV1Api, custom_objects_api_c: CustomObjectsApi, apps_api_c: AppsV1Api, namespace):
+    def __init__(self, core_api_c: CoreV1Api, custom_objects_api_c: CustomObjectsApi, apps_api_c: AppsV1Api, namespace,
+                 standby_pool: StandbyPool = None, app="my_app", role="web", deployment="web", container="web",
+                 namespace_cache: NamespaceCache = None, cpu_history: CpuHistory = None,
+                 forecaster: LoadForecaster = None, metric_sources: list[MetricSource] = None,
+                 kubelet_usage: KubeletUsageSource = None, pod_monitor: pod_api.PodMonitor = None,
+                 shadow: ShadowEvaluator = None, behavior: ScalingBehavior = None):
         self.core_api_client = core_api_c
         self.custom_objects_api_client = custom_objects_api_c
         self.apps_api_client = apps_api_c
-        self.app = "my_app"
-        self.role = "web"
-        self.service_name = "web"
-        self.main_container_name = "web"
-        self.hpa_web = "web"
-        self.deployment_web = "web"
+        self.app = app
+        self.role = role
+        self.service_name = deployment
+        self.main_container_name = container
+        self.hpa_web = deployment
+        self.deployment_web = deployment
         self.namespace = namespace
+        self.pods_decode_counter = pod_api.DecodeCounter()
+        self.standby_pool = standby_pool
+        self.namespace_cache = namespace_cache
+        self.last_snapshot: ClusterSnapshot = None
+        self.cpu_history = cpu_history
+        self.forecaster = forecaster
+        self.metric_sources = metric_sources if metric_sources is not None else []
+        self.kubelet_usage = kubelet_usage
+        self.pod_monitor = pod_monitor
+        self.shadow = shadow
+        self.behavior = behavior  # its recommendation history and scale events
+        self.pod_nodes: dict[str, str] = {}  # ready pod name -> node, from the last get_name_ip_pairs
+        self.deletion_costs: dict[str, int] = {}  # last written to each pod
+        self.write_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="deletion-cost")
 
     def get_requested_deployment_cpu(self):
         resource_request = deployment_api.get_deployment_resource_requests(self.apps_api_client, self.deployment_web,
                                                                            self.namespace,
                                                                            self.main_container_name)
-        req_cpu_s = resource_request.get("cpu", "0m")
-
-        req_cpu_m = 0
-        if 'm' in req_cpu_s:
-            req_cpu_m = int(req_cpu_s[:len(req_cpu_s) - 1])
-
-        return req_cpu_m
-
-    def set_deployment_replicas(self, target_replicas):
-        deployment_api.set_deployment_replicas(self.apps_api_client, self.deployment_web, self.namespace,
-                                               target_replicas)
+        return cpu_millis(resource_request.get("cpu", "0m"))
+
+    def set_deployment_replicas(self, target_replicas, resource_version: str = None):
+        return deployment_api.set_deployment_replicas(self.apps_api_client, self.deployment_web, self.namespace,
+                                                      target_replicas, resource_version)
+
+    def get_snapshot(self) -> ClusterSnapshot:
+        return self.complete_snapshot(self.take_snapshot())
+
+    # Forecast and metric sources, which read the ready pods of the snapshot
+    def complete_snapshot(self, snapshot: ClusterSnapshot) -> ClusterSnapshot:
+        if self.forecaster is not None:
+            self.forecaster.record(time.time(), snapshot.raw_total_cpu_m)
+            snapshot.predicted_cpu_m = self.forecaster.predicted_cpu_m()
+        if self.metric_sources:
+            snapshot.metrics = read_metric_sources(self.metric_sources, snapshot)
+        self.last_snapshot = snapshot
+        return snapshot
+
+    def take_snapshot(self) -> ClusterSnapshot:
+        name_ip_pairs = self.get_name_ip_pairs()
+        # after the pods, the kubelet source reads the nodes they run on
+        usages = self.get_pods_usages()
+        return self.build_snapshot(name_ip_pairs, usages, self.read_deployment())
+
+    def build_snapshot(self, name_ip_pairs: list[tuple[str, str]], usages: dict[str, dict[str, dict]],
+                       deployment) -> ClusterSnapshot:
+        pods_cpu_m = self.get_pods_cpu_usage(name_ip_pairs, usages)
+        raw_total_cpu_m = sum(pods_cpu_m.values())
+        total_cpu_m = raw_total_cpu_m
+        if self.cpu_history is not None:
+            self.cpu_history.record(pods_cpu_m)
+            pods_cpu_m = self.cpu_history.pods_cpu_m()
+            total_cpu_m = self.cpu_history.total_cpu_m()
+            logger.debug("CPU %s: %s milliCores (instant %s)", self.cpu_history.aggregation, total_cpu_m,
+                         raw_total_cpu_m)
+        if deployment is None:
+            return ClusterSnapshot(name_ip_pairs, total_cpu_m, 0, 0, None, pods_cpu_m, raw_total_cpu_m)
+        resource_requests = deployment_api.get_container_resource_requests(deployment,
+                                                                           self.main_container_name) or {}
+        return ClusterSnapshot(name_ip_pairs,
+                               total_cpu_m,
+                               deployment.spec.replicas,
+                               cpu_millis(resource_requests.get("cpu", "0m")),
+                               deployment.metadata.resource_version,
+                               pods_cpu_m,
+                               raw_total_cpu_m)
+
+    def read_deployment(self):
+        return deployment_api.read_deployment(self.apps_api_client, self.deployment_web, self.namespace)
 
     def get_deployment_replicas(self):
         return deployment_api.get_deployment_replicas(self.apps_api_client, self.deployment_web, self.namespace)
 
     def get_name_ip_pairs(self) -> list[tuple[str, str]]:
-        return pod_api.get_pods_names_and_ips(
-            pod_api.get_ready_pods(self.core_api_client, self.app, self.role, self.namespace, self.main_container_name)
-        )
-
-    def get_total_cpu_usage(self, name_ip_pairs: list[tuple[str, str]]) -> float:
-        total_cpu_n = 0
+        pods = self.get_ready_pods()
+        self.pod_nodes = {pod.metadata.name: pod.spec.node_name for pod in pods}
+        return pod_api.get_pods_names_and_ips(pods)
+
+    def get_ready_pods(self):
+        if self.pod_monitor is not None:
+            pods = self.pod_monitor.ready_pods(self.main_container_name)
+            if pods is not None:  # None until the watch cache is synced
+                return pods
+        if self.namespace_cache is not None:
+            return self.namespace_cache.get_ready_pods(self.app, self.role, self.main_container_name)
+        self.pods_decode_counter.reset()
+        pods = pod_api.get_ready_pods_namespaced(self.core_api_client, self.app, self.role, self.namespace,
+                                                 self.main_container_name, self.pods_decode_counter)
+        logger.debug("Pods decoded: %s in %s list calls", self.pods_decode_counter.pods_decoded,
+                     self.pods_decode_counter.list_calls)
+        return pods
+
+    def get_label_selector(self) -> str:
+        return f"app={self.app},role={self.role}"
+
+    def get_pods_usages(self) -> dict[str, dict[str, dict]]:
+        if self.kubelet_usage is not None:
+            return self.kubelet_usage.get_pods_usages(self.pod_nodes)
+        if self.namespace_cache is not None:
+            return self.namespace_cache.get_pods_usages()
+        # One metrics.k8s.io list per cycle, indexed by pod and container name
+        return custom_objects_api.get_pods_usages(self.custom_objects_api_client, self.namespace,
+                                                  self.get_label_selector())
+
+    def get_pods_cpu_usage(self, name_ip_pairs: list[tuple[str, str]],
+                           usages: dict[str, dict[str, dict]] = None) -> dict[str, float]:
+        if usages is None:
+            usages = self.get_pods_usages()
+        pods_cpu_m = {}
         for t in name_ip_pairs:
             name = t[0]
             ip = t[1]
             # logLine(f"Active pod -> Name: {name}, ip: {ip}")
-            cpu_n = self.get_pod_cpu_usage(name)
-            total_cpu_n += cpu_n
-            log_line(f"CPU for pod {name} ({ip}): {cpu_n / 1000000}ms")
+            cpu_n = self.get_pod_cpu_usage(name, usages)
+            pods_cpu_m[name] = cpu_n / 1000000
+            logger.debug("CPU for pod %s (%s): %sm", name, ip, pods_cpu_m[name], extra=SAMPLED)
+        return pods_cpu_m
 
-        total_cpu_m = total_cpu_n / 1000000
-        return total_cpu_m
+    def get_total_cpu_usage(self, name_ip_pairs: list[tuple[str, str]]) -> float:
+        return sum(self.get_pods_cpu_usage(name_ip_pairs).values())
 
-    def get_pod_cpu_usage(self, name: str) -> int:
-        usages = custom_objects_api.get_usages_from_pod(self.custom_objects_api_client, name, self.namespace)
+    def get_pod_cpu_usage(self, name: str, usages: dict[str, dict[str, dict]] = None) -> int:
+        if usages is None:
+            usages = self.get_pods_usages()
+        container_usage = custom_objects_api.get_container_usage(usages, name, self.main_container_name)
         cpu_n = 0
-        if 'n' in usages["cpu"]:
-            v = usages["cpu"]
+        v = container_usage.get("cpu", "0n")
+        if 'n' in v:
             cpu_n = int(v[:len(v) - 1])
         return cpu_n
 
     def annotate_pod_deletion_cost(self, name: str, cost: int) -> None:
         self.core_api_client.patch_namespaced_pod(name, self.namespace, body={
             "metadata": {"annotations": {"controller.kubernetes.io/pod-deletion-cost": f"{cost}"}}})
+        self.deletion_costs[name] = cost
+
+    # Patches every pod whose cost changed at the same time, returns once all are written
+    def annotate_pods_deletion_cost(self, costs: dict[str, int]) -> None:
+        changed = [name for name, cost in costs.items() if self.deletion_costs.get(name) != cost]
+        for future in [self.write_executor.submit(self.annotate_pod_deletion_cost, name, costs[name])
+                       for name in changed]:
+            future.result()
+        self.deletion_costs = {name: cost for name, cost in self.deletion_costs.items() if name in costs}
+
+    def maintain_standby_pool(self):
+        if self.standby_pool is None:
+            return
+        if self.standby_pool.size is None:
+            self.standby_pool.ensure(deployment_api.get_deployment_resource_requests(
+                self.apps_api_client, self.deployment_web, self.namespace, self.main_container_name))
+        self.standby_pool.refresh()
+        size = self.standby_pool.resize()
+        logger.info("Standby pool: %s placeholders, %s available, warm scale-up ratio %.2f", size,
+                    self.standby_pool.available, self.standby_pool.warm_hit_ratio)
+
+    def record_scale_up(self, replicas_added: int):
+        if self.standby_pool is not None:
+            self.standby_pool.record_scale_up(replicas_added)
 
     def delete_pod(self, name):
         self.annotate_pod_deletion_cost(name, 0)
@@ -166,11 +640,80 @@ class ClusterActions:
         target_replicas = current_replicas - 1
         # hpaClient.patch_namespaced_horizontal_pod_autoscaler(hpa_web, namespace, body = { "status":{"desiredReplicas": f"{str(target_replicas)}"}})
         self.set_deployment_replicas(target_replicas)
-        log_line(f"Replicas set to {target_replicas}")
-
-
-def scale_down_period(hpa_config, last_scale_up):
-    return (time.time() - last_scale_up) > hpa_config.no_scale_down_period_s
+        logger.info("Replicas set to %s", target_replicas)
+
+
+# Replicas that bring the utilization to the middle of the thresholds, clamped to the configured limits
+def proportional_replicas(total_cpu_m: float, req_cpu_m: int, hpa_config: HpaConfig) -> int:
+    target_utilization = (hpa_config.upper_cpu_threshold + hpa_config.lower_cpu_threshold) / 2
+    desired = hpa_config.min_replicas
+    if req_cpu_m > 0 and target_utilization > 0:
+        desired = math.ceil(total_cpu_m / (req_cpu_m * target_utilization))
+    return max(hpa_config.min_replicas, min(hpa_config.max_replicas, desired))
+
+
+# Replicas that keep the forecast usage under the upper threshold, None while there is no forecast
+def predicted_replicas(snapshot: ClusterSnapshot, hpa_config: HpaConfig) -> int:
+    if snapshot.predicted_cpu_m is None or snapshot.requested_cpu_m <= 0 or hpa_config.upper_cpu_threshold <= 0:
+        return None
+    desired = math.ceil(snapshot.predicted_cpu_m / (snapshot.requested_cpu_m * hpa_config.upper_cpu_threshold))
+    return max(hpa_config.min_replicas, min(hpa_config.max_replicas, desired))
+
+
+# Highest replicas wanted by the metric sources, None when there are none
+def metric_replicas(snapshot: ClusterSnapshot, hpa_config: HpaConfig) -> int:
+    desired = [d for d in (v.desired_replicas(snapshot.num_replicas_ready) for v in snapshot.metrics.values())
+               if d is not None]
+    if not desired:
+        return None
+    return max(hpa_config.min_replicas, min(hpa_config.max_replicas, max(desired)))
+
+
+# Replicas the scaling behavior allows on the way to desired, desired when there is no behavior
+def apply_behavior(behavior: ScalingBehavior, cycle: CycleRecord, now: float, current: int, desired: int,
+                   record: bool = True) -> int:
+    if behavior is None:
+        return desired
+    allowed = behavior.apply(now, current, desired, record)
+    if allowed != desired:
+        cycle.set(desired_replicas=desired, behavior_replicas=allowed)
+    return allowed
+
+
+# The behavior counts the change against its policies, the standby pool is sized from the replicas added
+def record_scale(cluster_actions: ClusterActions, now: float, old: int, new: int):
+    if cluster_actions.behavior is not None:
+        cluster_actions.behavior.record_scale(now, old, new)
+    if new > old:
+        cluster_actions.record_scale_up(new - old)
+
+
+# Writes the replicas with the resourceVersion of the snapshot as precondition. It also fails on status-only updates
+# of the deployment, common while the pods are probed, so the deployment is read again: with the replicas the cycle
+# decided from the write is retried once with its new resourceVersion, with others someone else scaled it and the
+# cycle gives up. Returns whether the replicas were written.
+def write_replicas(cluster_actions: ClusterActions, snapshot: ClusterSnapshot, target_replicas: int) -> bool:
+    try:
+        snapshot.resource_version = cluster_actions.set_deployment_replicas(target_replicas,
+                                                                            snapshot.resource_version)
+        return True
+    except ApiException as e:
+        if not deployment_api.is_precondition_failure(e):
+            raise
+    deployment = cluster_actions.read_deployment()
+    replicas = deployment.spec.replicas if deployment is not None else None
+    if replicas != snapshot.deployment_replicas:
+        logger.warning("Deployment %s replicas changed from %s to %s during the cycle, not scaling to %s",
+                       cluster_actions.deployment_web, snapshot.deployment_replicas, replicas, target_replicas)
+        return False
+    snapshot.resource_version = cluster_actions.set_deployment_replicas(target_replicas,
+                                                                        deployment.metadata.resource_version)
+    return True
+
+
+def scale_down_period(hpa_config, last_scale_up, now: float = None):
+    now = time.time() if now is None else now
+    return (now - last_scale_up) > hpa_config.no_scale_down_period_s
 
 
 from enum import Enum
@@ -182,93 +725,493 @@ class ScalerAction(Enum):
     SCALE_DOWN = 3
 
 
+def new_cycle_record(cluster_actions: ClusterActions, hpa_config: HpaConfig, **fields) -> CycleRecord:
+    return CycleRecord(deployment=cluster_actions.deployment_web, min_replicas=hpa_config.min_replicas,
+                       max_replicas=hpa_config.max_replicas, **fields)
+
+
 def scale_replicas(cluster_actions: ClusterActions,
                    hpa_config: HpaConfig,
                    custom_app_info: CustomAppInfo,
-                   last_scale_up: float) -> ScalerAction:
-    action = ScalerAction.NOTHING
-    log_line(f"Min. replicas: {hpa_config.min_replicas}")
-    log_line(f"Max. replicas: {hpa_config.max_replicas}")
-    name_ip_pairs: list[tuple[str, str]] = cluster_actions.get_name_ip_pairs()
-    num_replicas_ready = len(name_ip_pairs)
+                   last_scale_up: float,
+                   now: float = None) -> ScalerAction:
+    cycle = new_cycle_record(cluster_actions, hpa_config)
+    snapshot: ClusterSnapshot = cluster_actions.get_snapshot()
+    return scale_snapshot(cluster_actions, hpa_config, snapshot, lambda ips: custom_app_info.get_pods_num_datasets(ips),
+                          last_scale_up, now, cycle)
 
-    total_cpu_m = cluster_actions.get_total_cpu_usage(name_ip_pairs)
-    log_line(f"CPU total: {total_cpu_m} milliCores")
-    log_line(f"Deployment replicas: {cluster_actions.get_deployment_replicas()}")
 
-    req_cpu_m = cluster_actions.get_requested_deployment_cpu()
-
-    log_line(f"Req. CPU millis: {req_cpu_m}")
+# The decision and its API writes for a snapshot taken by either engine. probe_pods returns the datasets-info
+# results of the given pod IPs and is only called on scale-down.
+def scale_snapshot(cluster_actions: ClusterActions,
+                   hpa_config: HpaConfig,
+                   snapshot: ClusterSnapshot,
+                   probe_pods: Callable[[list[str]], dict[str, ProbeResult]],
+                   last_scale_up: float,
+                   now: float = None,
+                   cycle: CycleRecord = None) -> ScalerAction:
+    action = ScalerAction.NOTHING
+    if cycle is None:
+        cycle = new_cycle_record(cluster_actions, hpa_config)
+    shadow = cluster_actions.shadow
+    if shadow is not None:
+        # the shadow policies decide on the inputs of this cycle, before the decision updates the snapshot
+        shadow_snapshot = copy.copy(snapshot)
+        probe_pods = shadow.record_probes(probe_pods)
+    behavior = cluster_actions.behavior
+    now_s = time.time() if now is None else now
+    name_ip_pairs: list[tuple[str, str]] = snapshot.name_ip_pairs
+    num_replicas_ready = snapshot.num_replicas_ready
+
+    total_cpu_m = snapshot.total_cpu_m
+    req_cpu_m = snapshot.requested_cpu_m
+    cycle.set(cpu_total_m=total_cpu_m, deployment_replicas=snapshot.deployment_replicas,
+              ready_replicas=num_replicas_ready, requested_cpu_m=req_cpu_m)
 
     total_req = req_cpu_m * num_replicas_ready
 
     upper_cpu_limit = total_req * hpa_config.upper_cpu_threshold
     lower_cpu_limit = total_req * hpa_config.lower_cpu_threshold
 
+    proportional = hpa_config.scaling_mode == SCALING_MODE_PROPORTIONAL
+    predicted_floor = predicted_replicas(snapshot, hpa_config)
+    metrics_floor = metric_replicas(snapshot, hpa_config)
+    # the replicas never go below what the forecast or any metric source asks for
+    replicas_floor = max((f for f in (predicted_floor, metrics_floor) if f is not None), default=None)
+    cycle.set(upper_cpu_limit_m=upper_cpu_limit, lower_cpu_limit_m=lower_cpu_limit)
+    if predicted_floor is not None:
+        cycle.set(predicted_cpu_m=snapshot.predicted_cpu_m, predicted_replicas=predicted_floor)
+    if metrics_floor is not None:
+        cycle.set(metrics={k: v.to_dict() for k, v in snapshot.metrics.items()}, metric_replicas=metrics_floor)
     if total_cpu_m > upper_cpu_limit:
-        log_line(f"Scale up")
-        current_replicas = cluster_actions.get_deployment_replicas()
-        if current_replicas < hpa_config.max_replicas and current_replicas == num_replicas_ready:  # no hemos llegado al maximo ni hay pods levantandose
-            target_replicas = current_replicas + 1
-            cluster_actions.set_deployment_replicas(target_replicas)
+        cycle.set(decision="scale up")
+        current_replicas = snapshot.deployment_replicas
+        target_replicas = current_replicas + 1
+        if proportional:
+            target_replicas = max(target_replicas, proportional_replicas(total_cpu_m, req_cpu_m, hpa_config))
+        if replicas_floor is not None:
+            target_replicas = max(target_replicas, replicas_floor)
+        target_replicas = apply_behavior(behavior, cycle, now_s, current_replicas,
+                                         min(target_replicas, hpa_config.max_replicas))
+        if (target_replicas > current_replicas and current_replicas == num_replicas_ready  # no hemos llegado al maximo ni hay pods levantandose
+                and write_replicas(cluster_actions, snapshot, target_replicas)):
+            record_scale(cluster_actions, now_s, current_replicas, target_replicas)
+            snapshot.deployment_replicas = target_replicas
+            cycle.set(target_replicas=target_replicas)
+            action = ScalerAction.SCALE_UP
+    elif replicas_floor is not None and replicas_floor > snapshot.deployment_replicas:
+        cycle.set(decision="predictive scale up" if replicas_floor == predicted_floor else "metric scale up")
+        current_replicas = snapshot.deployment_replicas
+        target_replicas = apply_behavior(behavior, cycle, now_s, current_replicas, replicas_floor)
+        if (target_replicas > current_replicas and current_replicas == num_replicas_ready
+                and write_replicas(cluster_actions, snapshot, target_replicas)):
+            record_scale(cluster_actions, now_s, current_replicas, target_replicas)
+            snapshot.deployment_replicas = target_replicas
+            cycle.set(target_replicas=target_replicas)
             action = ScalerAction.SCALE_UP
     elif lower_cpu_limit < total_cpu_m < upper_cpu_limit:
-        log_line(f"Do nothing")
+        cycle.set(decision="nothing")
+        apply_behavior(behavior, cycle, now_s, snapshot.deployment_replicas, snapshot.deployment_replicas)
         action = ScalerAction.NOTHING
     else:
-        current_replicas = cluster_actions.get_deployment_replicas()
+        current_replicas = snapshot.deployment_replicas
         max_to_kill = num_replicas_ready - hpa_config.min_replicas
+        if proportional:
+            max_to_kill = min(max_to_kill,
+                              current_replicas - proportional_replicas(total_cpu_m, req_cpu_m, hpa_config))
+        if replicas_floor is not None:
+            max_to_kill = min(max_to_kill, current_replicas - replicas_floor)
+        # step mode removes as many pods as victims are found, known after the probes: the replicas it scales to are
+        # recorded below instead of this upper bound
+        max_to_kill = current_replicas - apply_behavior(behavior, cycle, now_s, current_replicas,
+                                                        current_replicas - max(max_to_kill, 0), record=proportional)
+        recommendation = current_replicas
 
         if max_to_kill > 0 and current_replicas == num_replicas_ready and scale_down_period(hpa_config,
-                                                                                            last_scale_up):  # si estamos por encima de las replicas mínimas y no hay pods levantándose
-            log_line("Scale down")
-            num_killed = 0
-            for t in name_ip_pairs:
-                name = t[0]
-                ip = t[1]
-
-                if num_killed < max_to_kill:
-                    num_ds = custom_app_info.get_pod_num_datasets(ip)
-                    log_line(f"pod {name} ({ip}) has {num_ds} datasets")
-                    if num_ds == 0:
-                        log_line(f"Pod {name} will be killed for having no datasets")
-
-                        cluster_actions.annotate_pod_deletion_cost(name, 0)
-                        current_replicas = cluster_actions.get_deployment_replicas()
-                        target_replicas = current_replicas - 1
-                        cluster_actions.set_deployment_replicas(target_replicas)
-                        log_line(f"Replicas set to {target_replicas}")
-
-                        action = ScalerAction.SCALE_DOWN
-                        num_killed += 1
+                                                                                            last_scale_up, now):  # si estamos por encima de las replicas mínimas y no hay pods levantándose
+            cycle.set(decision="scale down")
+            probes = probe_pods([t[1] for t in name_ip_pairs])
+            probe_failures = 0
+            for name, ip in name_ip_pairs:
+                probe = probes[ip]
+                if not probe.ok:
+                    logger.warning("pod %s (%s) datasets probe failed: %s %s", name, ip, probe.outcome.name,
+                                   probe.detail)
+                    probe_failures += 1
+                else:
+                    logger.debug("pod %s (%s) has %s datasets, last access %s", name, ip, probe.num_datasets,
+                                 probe.last_time_access, extra=SAMPLED)
+            ranker = VictimRanker(hpa_config.dataset_cost, hpa_config.access_half_life_s, hpa_config.cpu_cost)
+            ranked = ranker.rank(name_ip_pairs, probes, snapshot.pods_cpu_m, now_s)
+            victims = [score.name for score in select_victims(ranked, max_to_kill, proportional)]
+            cycle.set(probed=len(probes), probe_failures=probe_failures, victims=victims)
+
+            if victims:
+                # every pod gets its cost and the victims the lowest before the single replica update, so the
+                # ReplicaSet removes exactly them
+                costs = {score.name: score.cost for score in ranked}
+                costs.update({name: VICTIM_COST for name in victims})
+                cluster_actions.annotate_pods_deletion_cost(costs)
+                target_replicas = current_replicas - len(victims)
+                if write_replicas(cluster_actions, snapshot, target_replicas):
+                    record_scale(cluster_actions, now_s, current_replicas, target_replicas)
+                    snapshot.deployment_replicas = target_replicas
+                    cycle.set(target_replicas=target_replicas)
+                    action = ScalerAction.SCALE_DOWN
+                    recommendation = target_replicas
         else:
-            log_line(f"Do nothing")
+            cycle.set(decision="nothing")
+        if behavior is not None and not proportional:
+            behavior.record_recommendation(now_s, recommendation)
+
+    cycle.set(action=action.name)
+    cycle.emit()
+    if shadow is not None:
+        shadow.submit(shadow_snapshot, action, cycle.fields.get("target_replicas", shadow_snapshot.deployment_replicas),
+                      last_scale_up, now)
+    return action
+
+
+# A last cycle under the lower threshold makes a scale-down, and so the datasets-info probes, likely
+def likely_scale_down(snapshot: ClusterSnapshot, hpa_config: HpaConfig) -> bool:
+    utilization = snapshot.cpu_utilization if snapshot is not None else None
+    return utilization is not None and utilization <= hpa_config.lower_cpu_threshold
+
+
+# The decision of scale_replicas with the pods, metrics and deployment read at the same time. When the last cycle was
+# under the lower threshold the datasets-info probes also start with the pod list instead of after the decision.
+async def scale_replicas_async(engine: AsyncEngine,
+                               cluster_actions: ClusterActions,
+                               hpa_config: HpaConfig,
+                               custom_app_info: CustomAppInfo,
+                               last_scale_up: float,
+                               now: float = None) -> ScalerAction:
+    cycle = new_cycle_record(cluster_actions, hpa_config, engine=ENGINE_ASYNC)
+
+    def probe_pods(pod_ips):
+        return custom_app_info.get_pods_num_datasets(pod_ips)
+
+    prefetch = likely_scale_down(cluster_actions.last_snapshot, hpa_config)
+    snapshot, probes = await engine.get_snapshot(cluster_actions, probe_pods if prefetch else None)
+    cycle.set(probes_prefetched=prefetch)
+    return await engine.call(scale_snapshot, cluster_actions, hpa_config, snapshot,
+                             (lambda pod_ips: probes.result()) if probes is not None else probe_pods,
+                             last_scale_up, now, cycle)
+
+
+def run_scale_replicas(engine: AsyncEngine, cluster_actions: ClusterActions, hpa_config: HpaConfig,
+                       custom_app_info: CustomAppInfo, last_scale_up: float) -> ScalerAction:
+    if engine is None:
+        return scale_replicas(cluster_actions, hpa_config, custom_app_info, last_scale_up)
+    return engine.run(scale_replicas_async(engine, cluster_actions, hpa_config, custom_app_info, last_scale_up))
 
-    log_line("------------------------------------------------")
+
+def new_engine(hpa_config: HpaConfig) -> AsyncEngine:
+    if hpa_config.engine != ENGINE_ASYNC:
+        return None
+    return AsyncEngine(hpa_config.engine_workers)
+
+
+def new_behavior(hpa_config: HpaConfig) -> ScalingBehavior:
+    scale_up = ScalingRules(hpa_config.scale_up_stabilization_s, parse_scaling_policies(hpa_config.scale_up_policies),
+                            hpa_config.scale_up_select)
+    scale_down = ScalingRules(hpa_config.scale_down_stabilization_s,
+                              parse_scaling_policies(hpa_config.scale_down_policies), hpa_config.scale_down_select)
+    if not any([scale_up.stabilization_s, scale_up.policies, scale_up.select != SELECT_MAX,
+                scale_down.stabilization_s, scale_down.policies, scale_down.select != SELECT_MAX]):
+        return None
+    return ScalingBehavior(scale_up, scale_down)
+
+
+def new_shadow_evaluator(hpa_config: HpaConfig, deployment, metrics: HpaMetrics = None) -> ShadowEvaluator:
+    if not hpa_config.shadow_policies:
+        return None
+    policies = []
+    for name, overrides in parse_shadow_policies(hpa_config.shadow_policies).items():
+        policy_config = HpaConfig({**hpa_config.env, **overrides})
+        policies.append(ShadowPolicy(name, policy_config, new_behavior(policy_config)))
+    logger.info("Shadow policies of %s: %s", deployment, ", ".join(p.name for p in policies))
+    return ShadowEvaluator(policies, scale_snapshot, hpa_config, deployment, metrics)
+
+
+def new_cpu_history(hpa_config: HpaConfig) -> CpuHistory:
+    if hpa_config.cpu_aggregation == AGGREGATION_INSTANT:
+        return None
+    return CpuHistory(hpa_config.cpu_aggregation, hpa_config.cpu_window, hpa_config.cpu_ewma_alpha,
+                      hpa_config.cpu_percentile)
+
+
+def new_forecaster(hpa_config: HpaConfig) -> LoadForecaster:
+    if not hpa_config.predictive_scaling:
+        return None
+    return LoadForecaster(hpa_config.forecast_season_s, hpa_config.forecast_slot_s, hpa_config.pod_startup_s)
+
+
+def new_custom_app_info(hpa_config: HpaConfig) -> CustomAppInfo:
+    cache = None
+    if hpa_config.datasets_cache_ttl_s > 0:
+        cache = DatasetsCache(hpa_config.datasets_cache_ttl_s, hpa_config.datasets_cache_size)
+    return CustomAppInfo(DatasetProber(request_timeout_s=hpa_config.probe_timeout_s,
+                                       deadline_s=hpa_config.probe_deadline_s,
+                                       max_workers=hpa_config.probe_workers),
+                         cache)
+
+
+def new_kubelet_usage(hpa_config: HpaConfig, core_api: CoreV1Api, namespace) -> KubeletUsageSource:
+    if hpa_config.cpu_usage_source != CPU_USAGE_KUBELET:
+        return None
+    return KubeletUsageSource(core_api, namespace, hpa_config.kubelet_workers, hpa_config.api_timeout_s)
+
+
+def new_metric_sources(hpa_config: HpaConfig, custom_app_info: CustomAppInfo) -> list[MetricSource]:
+    if not hpa_config.metric_sources:
+        return []
+    return parse_metric_sources(hpa_config.metric_sources, custom_app_info.prober)
+
+
+# One pooled client for every API group, so all requests share the connections and the rate budget
+def new_shared_api_client(hpa_config: HpaConfig) -> BudgetedApiClient:
+    return new_api_client(hpa_config.api_qps, hpa_config.api_burst, hpa_config.api_pool_size,
+                          hpa_config.api_timeout_s, hpa_config.api_max_retries)
+
+
+def new_metrics(hpa_config: HpaConfig) -> HpaMetrics:
+    if hpa_config.metrics_port <= 0:
+        return None
+    metrics = HpaMetrics()
+    MetricsServer(metrics, hpa_config.metrics_port).start()
+    logger.info("Serving /metrics on port %s", hpa_config.metrics_port)
+    return metrics
+
+
+def record_decision(metrics: HpaMetrics, cluster_actions: ClusterActions, hpa_config: HpaConfig,
+                    action: ScalerAction):
+    if metrics is not None:
+        metrics.record_decision(cluster_actions.deployment_web, action.name, [a.name for a in ScalerAction],
+                                cluster_actions.last_snapshot, hpa_config)
+
+
+def new_leader_elector(hpa_config: HpaConfig, api_client, namespace, on_change) -> LeaderElector:
+    if not hpa_config.leader_election:
+        return None
+    identity = os.getenv('POD_NAME', socket.gethostname())
+    elector = LeaderElector(client.CoordinationV1Api(api_client), hpa_config.lease_name, namespace, identity,
+                            hpa_config.lease_duration_s, hpa_config.lease_retry_s, on_change)
+    elector.start()
+    # SIGTERM runs the atexit hooks, the lease is released before the pod goes away
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    atexit.register(elector.stop)
+    return elector
+
+
+def new_state_store(hpa_config: HpaConfig, core_api: CoreV1Api, namespace) -> StateStore:
+    if hpa_config.state_file:
+        store = FileStateStore(hpa_config.state_file, hpa_config.state_save_interval_s)
+    elif hpa_config.state_configmap:
+        store = ConfigMapStateStore(core_api, hpa_config.state_configmap, namespace,
+                                    hpa_config.state_save_interval_s)
+    else:
+        return None
+    store.load()
+    # the windows saved since the last interval are written on the way out
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    atexit.register(store.flush)
+    return store
+
+
+# Scales are written right away, a restart just after one must still see it
+def save_state(state_store: StateStore, key, cluster_actions: ClusterActions, last_scaleup: float,
+               action: ScalerAction):
+    if state_store is not None:
+        state_store.save(key, controller_state(cluster_actions, last_scaleup), force=action != ScalerAction.NOTHING)
+
+
+# A standby only takes snapshots, which keeps its caches, CPU history and forecast warm for a failover
+def standby_cycle(cluster_actions: ClusterActions) -> ScalerAction:
+    cluster_actions.get_snapshot()
+    return ScalerAction.NOTHING
+
+
+def evaluate_target(target: Target, custom_app_info: CustomAppInfo, metrics: HpaMetrics = None,
+                    elector: LeaderElector = None, engine: AsyncEngine = None,
+                    state_store: StateStore = None) -> ScalerAction:
+    if elector is not None:
+        if not elector.is_leader:
+            return standby_cycle(target.cluster_actions)
+        target.last_scaleup = elector.last_scaleup(target.name, target.last_scaleup)
+    action = run_scale_replicas(engine, target.cluster_actions, target.hpa_config, custom_app_info,
+                                target.last_scaleup)
+    if action == ScalerAction.SCALE_UP:
+        target.last_scaleup = time.time()
+        if elector is not None:
+            elector.record_scale_up(target.name, target.last_scaleup)
+    record_decision(metrics, target.cluster_actions, target.hpa_config, action)
+    save_state(state_store, target.name, target.cluster_actions, target.last_scaleup, action)
     return action
 
 
+def load_targets(core_api: CoreV1Api, namespace) -> list[Target]:
+    if os.getenv('HPA_TARGETS_FILE'):
+        return load_targets_file(os.getenv('HPA_TARGETS_FILE'), namespace)
+    return load_targets_configmap(core_api, os.getenv('HPA_TARGETS_CONFIGMAP'), namespace)
+
+
+# Many targets from one process: one API client for all of them and one pod/metrics cache per namespace
+def run_targets(hpa_config: HpaConfig, namespace):
+    api_client = new_shared_api_client(hpa_config)
+    core_api = client.CoreV1Api(api_client)
+    custom_objects_api = client.CustomObjectsApi(api_client)
+    apps_api = client.AppsV1Api(api_client)
+    metrics = new_metrics(hpa_config)
+    if metrics is not None:
+        core_api = InstrumentedApi(core_api, metrics)
+        custom_objects_api = InstrumentedApi(custom_objects_api, metrics)
+        apps_api = InstrumentedApi(apps_api, metrics)
+    targets = load_targets(core_api, namespace)
+    caches: dict[str, NamespaceCache] = {}
+    custom_app_info = new_custom_app_info(hpa_config)
+    for target in targets:
+        target.hpa_config = HpaConfig(target.env())
+        if target.interval_s is None:
+            target.interval_s = target.hpa_config.loop_time_s
+    for target in targets:
+        if target.namespace not in caches:
+            # shared by targets evaluated close together, never older than half the shortest interval
+            ttl_s = min(t.interval_s for t in targets if t.namespace == target.namespace)
+            caches[target.namespace] = NamespaceCache(core_api, custom_objects_api, target.namespace, ttl_s / 2)
+        target.cluster_actions = ClusterActions(core_api, custom_objects_api, apps_api, target.namespace,
+                                                app=target.app, role=target.role, deployment=target.deployment,
+                                                container=target.container,
+                                                namespace_cache=caches[target.namespace],
+                                                cpu_history=new_cpu_history(target.hpa_config),
+                                                forecaster=new_forecaster(target.hpa_config),
+                                                metric_sources=new_metric_sources(target.hpa_config, custom_app_info),
+                                                kubelet_usage=new_kubelet_usage(target.hpa_config, core_api,
+                                                                                target.namespace),
+                                                behavior=new_behavior(target.hpa_config))
+        target.cluster_actions.shadow = new_shadow_evaluator(target.hpa_config, target.deployment, metrics)
+        if metrics is not None:
+            instrument_cluster_actions(target.cluster_actions, metrics)
+    logger.info("Managing %s targets in %s namespaces", len(targets), len(caches))
+    if hpa_config.pod_cache or custom_app_info.cache is not None:
+        monitors = {}
+        for app, role, target_namespace in {(t.app, t.role, t.namespace) for t in targets}:
+            monitors[(app, role, target_namespace)] = pod_api.PodMonitor(
+                app, role, target_namespace, core_api,
+                on_pod_event=custom_app_info.cache.observe_pod if custom_app_info.cache else None)
+            monitors[(app, role, target_namespace)].start()
+        if hpa_config.pod_cache:
+            for target in targets:
+                target.cluster_actions.pod_monitor = monitors[(target.app, target.role, target.namespace)]
+    if metrics is not None:
+        instrument_custom_app_info(custom_app_info, metrics, "all")
+    state_store = new_state_store(hpa_config, core_api, namespace)
+    if state_store is not None:
+        for target in targets:
+            target.last_scaleup = restore_controller_state(target.cluster_actions, state_store.get(target.name))
+    engine = new_engine(hpa_config)
+    scheduler = TargetScheduler(targets,
+                                lambda t: evaluate_target(t, custom_app_info, metrics, elector, engine, state_store),
+                                hpa_config.target_workers, logger.info)
+    # a new leader evaluates every target now instead of after their intervals
+    elector = new_leader_elector(hpa_config, api_client, namespace,
+                                 lambda reason: scheduler.mark_all_due() if reason == LEADERSHIP_ACQUIRED else None)
+    scheduler.run()
+
+
 def main():
     load_config()
+    hpa_config = HpaConfig()
+    setup_logging(hpa_config.log_level, hpa_config.log_sample_every)
+    namespace = get_namespace()
+    if os.getenv('HPA_TARGETS_FILE') or os.getenv('HPA_TARGETS_CONFIGMAP'):
+        run_targets(hpa_config, namespace)
+        return
+    api_client = new_shared_api_client(hpa_config)
+    apps_api = client.AppsV1Api(api_client)
+    core_api = client.CoreV1Api(api_client)
+    standby_pool = None
+    if hpa_config.standby_pool_max > 0:
+        standby_pool = StandbyPool(apps_api, namespace, "web-standby", hpa_config.standby_priority_class,
+                                   hpa_config.standby_pool_min, hpa_config.standby_pool_max,
+                                   hpa_config.standby_pool_window_s)
     # hpaClient: AutoscalingV1Api = client.AutoscalingV1Api(client.ApiClient())
-    cluster_actions = ClusterActions(client.CoreV1Api(),
-                                     client.CustomObjectsApi(),
-                                     client.AppsV1Api(client.ApiClient()),
-                                     get_namespace()
+    custom_app_info = new_custom_app_info(hpa_config)
+    cluster_actions = ClusterActions(core_api,
+                                     client.CustomObjectsApi(api_client),
+                                     apps_api,
+                                     namespace,
+                                     standby_pool,
+                                     cpu_history=new_cpu_history(hpa_config),
+                                     forecaster=new_forecaster(hpa_config),
+                                     metric_sources=new_metric_sources(hpa_config, custom_app_info),
+                                     kubelet_usage=new_kubelet_usage(hpa_config, core_api, namespace),
+                                     behavior=new_behavior(hpa_config)
                                      )
-    hpa_config = HpaConfig()
-    custom_app_info = CustomAppInfo()
+    metrics = new_metrics(hpa_config)
+    cluster_actions.shadow = new_shadow_evaluator(hpa_config, cluster_actions.deployment_web, metrics)
+    if metrics is not None:
+        # the watch monitors below keep the plain clients, their streams would only skew the latencies
+        cluster_actions.core_api_client = InstrumentedApi(cluster_actions.core_api_client, metrics)
+        cluster_actions.custom_objects_api_client = InstrumentedApi(cluster_actions.custom_objects_api_client, metrics)
+        cluster_actions.apps_api_client = InstrumentedApi(apps_api, metrics)
+        instrument_cluster_actions(cluster_actions, metrics)
+        instrument_custom_app_info(custom_app_info, metrics, cluster_actions.deployment_web)
+    evaluation_scheduler = EvaluationScheduler(hpa_config.min_loop_time_s, hpa_config.max_loop_time_s,
+                                               hpa_config.loop_time_s, hpa_config.near_threshold_margin)
+    adaptive = hpa_config.min_loop_time_s < hpa_config.max_loop_time_s
+    if adaptive or hpa_config.pod_cache or custom_app_info.cache is not None:
+        pod_monitor = pod_api.PodMonitor(cluster_actions.app, cluster_actions.role, namespace, core_api,
+                                         on_change=evaluation_scheduler.notify if adaptive else None,
+                                         on_pod_event=custom_app_info.cache.observe_pod if custom_app_info.cache
+                                         else None)
+        pod_monitor.start()
+        if hpa_config.pod_cache:
+            cluster_actions.pod_monitor = pod_monitor
+    if adaptive:
+        deployment_api.DeploymentMonitor(apps_api, cluster_actions.deployment_web, namespace,
+                                         on_change=evaluation_scheduler.notify).start()
+    # a leadership change is acted on right away, not debounced to MIN_LOOP_TIME_S
+    elector = new_leader_elector(hpa_config, api_client, namespace,
+                                 lambda reason: evaluation_scheduler.notify(reason, immediate=True))
+    engine = new_engine(hpa_config)
     last_scaleup = 0  # enables an initial scaleup
+    state_store = new_state_store(hpa_config, core_api, namespace)
+    if state_store is not None:
+        last_scaleup = restore_controller_state(cluster_actions, state_store.get(cluster_actions.deployment_web))
     while True:
-        try:
-            action = scale_replicas(cluster_actions, hpa_config, custom_app_info, last_scaleup)
-            if action == ScalerAction.SCALE_UP:
-                last_scaleup = time.time()
-
-        except Exception as e:
-            log_line(str(e))
-            sys.stderr.write(str(e))
-        time.sleep(hpa_config.loop_time_s)
+        evaluation_scheduler.mark_evaluation()
+        action = ScalerAction.NOTHING
+        if elector is not None and not elector.is_leader:
+            try:
+                standby_cycle(cluster_actions)
+            except Exception:
+                logger.exception("Standby snapshot failed")
+        else:
+            if elector is not None:
+                last_scaleup = elector.last_scaleup(cluster_actions.deployment_web, last_scaleup)
+            try:
+                cluster_actions.maintain_standby_pool()
+            except Exception:
+                logger.exception("Standby pool")
+            try:
+                action = run_scale_replicas(engine, cluster_actions, hpa_config, custom_app_info, last_scaleup)
+                if action == ScalerAction.SCALE_UP:
+                    last_scaleup = time.time()
+                    if elector is not None:
+                        elector.record_scale_up(cluster_actions.deployment_web, last_scaleup)
+
+            except Exception:
+                logger.exception("Scaling cycle failed")
+            record_decision(metrics, cluster_actions, hpa_config, action)
+            save_state(state_store, cluster_actions.deployment_web, cluster_actions, last_scaleup, action)
+        snapshot = cluster_actions.last_snapshot
+        interval_s = evaluation_scheduler.next_interval(action != ScalerAction.NOTHING,
+                                                        snapshot.cpu_utilization if snapshot else None,
+                                                        hpa_config.lower_cpu_threshold,
+                                                        hpa_config.upper_cpu_threshold)
+        reason = evaluation_scheduler.wait(interval_s)
+        logger.info("Next evaluation after %s (interval %ss)", reason, interval_s)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,274 @@
+import functools
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def format_labels(label_names: tuple, label_values: tuple, extra: str = "") -> str:
+    pairs = ['%s="%s"' % (k, str(v).replace('"', "'")) for k, v in zip(label_names, label_values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help_text, label_names: tuple = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.lock = threading.Lock()
+        self.values: dict[tuple, float] = {}
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> list[str]:
+        with self.lock:
+            items = list(self.values.items())
+        return self.header() + [f"{self.name}{format_labels(self.label_names, k)} {v}" for k, v in items]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *label_values, amount: float = 1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, *label_values):
+        with self.lock:
+            self.values[label_values] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, label_names: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, label_names)
+        self.buckets = buckets
+        # per label values: [count per bucket..., +Inf count, sum]
+        self.series: dict[tuple, list] = {}
+
+    def observe(self, value: float, *label_values):
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-1] += value
+
+    def render(self) -> list[str]:
+        with self.lock:
+            items = [(k, list(v)) for k, v in self.series.items()]
+        lines = self.header()
+        for label_values, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                cumulative += count
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{format_labels(self.label_names, label_values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.label_names, label_values)} {series[-1]}")
+            lines.append(f"{self.name}_count{format_labels(self.label_names, label_values)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self.metrics: list[Metric] = []
+
+    def register(self, metric: Metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# The autoscaler metrics. label "deployment" tells the targets of a multi-target controller apart.
+class HpaMetrics:
+
+    def __init__(self):
+        self.registry = MetricsRegistry()
+        r = self.registry
+        self.phase_seconds = r.register(Histogram("hpa_phase_seconds", "Duration of each phase of a scaling cycle",
+                                                  ("deployment", "phase")))
+        self.api_requests = r.register(Counter("hpa_api_requests_total", "Kubernetes API requests",
+                                               ("verb", "resource")))
+        self.api_errors = r.register(Counter("hpa_api_errors_total", "Failed Kubernetes API requests",
+                                             ("verb", "resource", "code")))
+        self.api_seconds = r.register(Histogram("hpa_api_request_seconds", "Kubernetes API request latency",
+                                                ("verb", "resource")))
+        self.probe_outcomes = r.register(Counter("hpa_dataset_probes_total", "Datasets-info probes by outcome",
+                                                 ("outcome",)))
+        self.decisions = r.register(Counter("hpa_decisions_total", "Scaling decisions", ("deployment", "action")))
+        self.last_decision = r.register(Gauge("hpa_last_decision", "1 for the action of the last decision",
+                                              ("deployment", "action")))
+        self.current_replicas = r.register(Gauge("hpa_current_replicas", "Replicas of the deployment spec",
+                                                 ("deployment",)))
+        self.ready_replicas = r.register(Gauge("hpa_ready_replicas", "Ready replicas", ("deployment",)))
+        self.target_replicas = r.register(Gauge("hpa_target_replicas", "Last replicas written", ("deployment",)))
+        self.cpu_usage = r.register(Gauge("hpa_cpu_usage_millicores", "Total CPU usage the decision used",
+                                          ("deployment",)))
+        self.datasets_cache_hit_ratio = r.register(Gauge("hpa_datasets_cache_hit_ratio",
+                                                         "Share of datasets-info lookups answered by the cache"))
+        self.cpu_threshold = r.register(Gauge("hpa_cpu_threshold_millicores", "Computed CPU thresholds",
+                                              ("deployment", "bound")))
+        self.shadow_divergences = r.register(Counter("hpa_shadow_divergences_total",
+                                                     "Cycles where a shadow policy decided otherwise than the live one",
+                                                     ("deployment", "policy")))
+        self.shadow_replica_seconds = r.register(Counter("hpa_shadow_replica_seconds_total",
+                                                         "Projected replica-seconds of each policy",
+                                                         ("deployment", "policy")))
+        self.shadow_over_threshold_seconds = r.register(Counter(
+            "hpa_shadow_over_threshold_seconds_total", "Projected time above the upper threshold of each policy",
+            ("deployment", "policy")))
+
+    def time_phase(self, deployment, phase, fn):
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.phase_seconds.observe(time.perf_counter() - start, deployment, phase)
+        return timed
+
+    def record_decision(self, deployment, action_name: str, all_actions: list[str], snapshot, hpa_config):
+        self.decisions.inc(deployment, action_name)
+        for name in all_actions:
+            self.last_decision.set(1 if name == action_name else 0, deployment, name)
+        if snapshot is None:
+            return
+        self.current_replicas.set(snapshot.deployment_replicas, deployment)
+        self.ready_replicas.set(snapshot.num_replicas_ready, deployment)
+        self.cpu_usage.set(snapshot.total_cpu_m, deployment)
+        total_req = snapshot.requested_cpu_m * snapshot.num_replicas_ready
+        self.cpu_threshold.set(total_req * hpa_config.upper_cpu_threshold, deployment, "upper")
+        self.cpu_threshold.set(total_req * hpa_config.lower_cpu_threshold, deployment, "lower")
+
+
+API_VERBS = ("list", "read", "patch", "create", "delete", "replace", "connect")
+
+
+def api_verb_resource(method_name: str) -> tuple[str, str]:
+    name = method_name.removesuffix("_with_http_info")
+    verb, _, resource = name.partition("_")
+    resource = resource.replace("namespaced_", "").replace("_for_all_namespaces", "")
+    return verb, resource
+
+
+# Wraps a kubernetes *Api object and counts, times and classifies the errors of every request method
+class InstrumentedApi:
+
+    def __init__(self, api, metrics: HpaMetrics):
+        self._api = api
+        self._metrics = metrics
+
+    def __getattr__(self, name):
+        attr = getattr(self._api, name)
+        if not callable(attr) or not name.startswith(API_VERBS):
+            return attr
+        verb, resource = api_verb_resource(name)
+        metrics = self._metrics
+
+        @functools.wraps(attr)
+        def call(*args, **kwargs):
+            if kwargs.get("watch"):
+                verb_label = "watch"
+            else:
+                verb_label = verb
+            metrics.api_requests.inc(verb_label, resource)
+            start = time.perf_counter()
+            try:
+                return attr(*args, **kwargs)
+            except Exception as e:
+                metrics.api_errors.inc(verb_label, resource, str(getattr(e, "status", None) or type(e).__name__))
+                raise
+            finally:
+                if verb_label != "watch":
+                    metrics.api_seconds.observe(time.perf_counter() - start, verb_label, resource)
+        return call
+
+
+# Times the phases of a ClusterActions instance in place, including the calls it makes to itself
+def instrument_cluster_actions(cluster_actions, metrics: HpaMetrics):
+    deployment = cluster_actions.deployment_web
+    for method, phase in [("get_snapshot", "snapshot"), ("get_name_ip_pairs", "pods"),
+                          ("get_pods_usages", "metrics"), ("read_deployment", "deployment"),
+                          ("set_deployment_replicas", "scale"), ("annotate_pods_deletion_cost", "deletion_cost")]:
+        setattr(cluster_actions, method, metrics.time_phase(deployment, phase, getattr(cluster_actions, method)))
+    set_replicas = cluster_actions.set_deployment_replicas
+
+    def set_deployment_replicas(target_replicas, *args, **kwargs):
+        result = set_replicas(target_replicas, *args, **kwargs)
+        metrics.target_replicas.set(target_replicas, deployment)
+        return result
+    cluster_actions.set_deployment_replicas = set_deployment_replicas
+    return cluster_actions
+
+
+def instrument_custom_app_info(custom_app_info, metrics: HpaMetrics, deployment="web"):
+    probe_all = metrics.time_phase(deployment, "probes", custom_app_info.get_pods_num_datasets)
+
+    def get_pods_num_datasets(pod_ips):
+        results = probe_all(pod_ips)
+        for result in results.values():
+            metrics.probe_outcomes.inc(result.outcome.name)
+        if custom_app_info.cache is not None:
+            metrics.datasets_cache_hit_ratio.set(custom_app_info.cache.hit_ratio)
+        return results
+    custom_app_info.get_pods_num_datasets = get_pods_num_datasets
+    return custom_app_info
+
+
+class MetricsServer:
+
+    def __init__(self, metrics: HpaMetrics, port: int, host: str = ""):
+        registry = metrics.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self.server.server_address[1]
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
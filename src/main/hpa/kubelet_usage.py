@@ -0,0 +1,53 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from kubernetes.client import CoreV1Api
+
+from main.api_groups import kubelet_api
+from main.hpa.structured_log import logger
+
+
+# Pod CPU usage from the kubelets instead of metrics-server. The summaries of the nodes hosting our pods are read
+# concurrently and the usage is the rate of the cumulative usageCoreNanoSeconds between two of our own samples,
+# so it is as fresh as the loop. Returns the same {pod: {container: {"cpu": "<n>n"}}} shape as metrics.k8s.io.
+class KubeletUsageSource:
+
+    def __init__(self, core_api: CoreV1Api, namespace, max_workers: int = 8, timeout_s: float = 5):
+        self.core_api = core_api
+        self.namespace = namespace
+        self.timeout_s = timeout_s
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="kubelet")
+        # (pod, container) -> (sample_time_s, usageCoreNanoSeconds) of the previous cycle
+        self.samples: dict[tuple[str, str], tuple[float, int]] = {}
+
+    def get_summaries(self, nodes) -> dict[str, dict]:
+        futures = {node: self.executor.submit(kubelet_api.get_node_summary, self.core_api, node, self.timeout_s)
+                   for node in nodes}
+        summaries = {}
+        for node, future in futures.items():
+            try:
+                summaries[node] = future.result()
+            except Exception as e:
+                logger.warning("Kubelet summary of node %s: %s", node, e)
+        return summaries
+
+    def rate_nano_cores(self, key, sample_time_s, core_ns, nano_cores) -> int:
+        previous = self.samples.get(key)
+        self.samples[key] = (sample_time_s, core_ns)
+        if previous is not None and sample_time_s > previous[0] and core_ns >= previous[1]:
+            return int((core_ns - previous[1]) / (sample_time_s - previous[0]))
+        # first sample or restarted container, the kubelet's own recent rate is the best there is
+        return int(nano_cores or 0)
+
+    def get_pods_usages(self, pod_nodes: dict[str, str]) -> dict[str, dict[str, dict]]:
+        nodes = {node for node in pod_nodes.values() if node}
+        usages = {}
+        for summary in self.get_summaries(nodes).values():
+            counters = kubelet_api.get_containers_cpu_counters(summary, self.namespace, pod_nodes)
+            for pod, containers in counters.items():
+                usages[pod] = {container: {"cpu": f"{self.rate_nano_cores((pod, container), *sample)}n"}
+                               for container, sample in containers.items()}
+        self.samples = {key: sample for key, sample in self.samples.items() if key[0] in pod_nodes}
+        return usages
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,147 @@
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable
+
+from kubernetes.client import CoordinationV1Api, V1Lease, V1LeaseSpec, V1ObjectMeta
+from kubernetes.client.rest import ApiException
+
+from main.api_groups import utils
+from main.hpa.structured_log import logger
+
+# Last scale-up time of every deployment, so a new leader keeps honouring the no scale down period
+LAST_SCALEUP_ANNOTATION = "k8s-hpa/last-scaleup"
+LEADERSHIP_ACQUIRED = "leadership acquired"
+LEADERSHIP_LOST = "leadership lost"
+
+
+# Lease based leader election. Every replica runs it; the holder renews the Lease every retry period and the others
+# take it over once it has not been renewed for lease_duration_s. A leader that cannot renew stops acting after
+# renew_deadline_s, before anyone else may take the lease. The last scale-up times travel in a Lease annotation.
+class LeaderElector:
+
+    def __init__(self, api: CoordinationV1Api, name, namespace, identity, lease_duration_s: float = 10,
+                 retry_period_s: float = 1, on_change: Callable[[str], None] = None,
+                 clock: Callable[[], float] = time.time):
+        self.api = api
+        self.name = name
+        self.namespace = namespace
+        self.identity = identity
+        self.lease_duration_s = lease_duration_s
+        self.renew_deadline_s = lease_duration_s * 2 / 3
+        self.retry_period_s = retry_period_s
+        self.on_change = on_change
+        self.clock = clock
+        self.leader = False
+        self.renewed_at = 0.0
+        self.last_scaleups: dict[str, float] = {}
+        self.lock = threading.RLock()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="leader-election", daemon=True)
+
+    @property
+    def is_leader(self) -> bool:
+        return self.leader and self.clock() - self.renewed_at < self.renew_deadline_s
+
+    def last_scaleup(self, key, default: float = 0) -> float:
+        with self.lock:
+            return self.last_scaleups.get(key, default)
+
+    # Stored right away, a failover just after a scale-up must not scale down
+    def record_scale_up(self, key, when: float):
+        with self.lock:
+            self.last_scaleups[key] = when
+            try:
+                self.try_acquire_or_renew()
+            except Exception as e:
+                # kept in memory, the next renew stores it
+                logger.warning("Lease %s: %s", self.name, e)
+
+    def set_leader(self, leader: bool):
+        if leader == self.leader:
+            return
+        self.leader = leader
+        logger.warning("%s leadership of lease %s", "Acquired" if leader else "Lost", self.name)
+        if self.on_change is not None:
+            self.on_change(LEADERSHIP_ACQUIRED if leader else LEADERSHIP_LOST)
+
+    def load_annotations(self, lease: V1Lease):
+        try:
+            stored = json.loads((lease.metadata.annotations or {}).get(LAST_SCALEUP_ANNOTATION, "{}"))
+        except ValueError:
+            return
+        for key, when in stored.items():
+            self.last_scaleups[key] = max(self.last_scaleups.get(key, 0), float(when))
+
+    def expired(self, spec: V1LeaseSpec, now: float) -> bool:
+        if not spec.holder_identity or spec.renew_time is None:
+            return True
+        duration_s = spec.lease_duration_seconds or self.lease_duration_s
+        return spec.renew_time.timestamp() + duration_s < now
+
+    def try_acquire_or_renew(self) -> bool:
+        with self.lock:
+            now = self.clock()
+            lease = utils.read_or_none(self.api.read_namespaced_lease, self.name, self.namespace)
+            if lease is None:
+                lease = V1Lease(metadata=V1ObjectMeta(name=self.name, namespace=self.namespace), spec=V1LeaseSpec())
+                return self.write(lease, now, create=True)
+            self.load_annotations(lease)
+            if lease.spec.holder_identity != self.identity and not self.expired(lease.spec, now):
+                self.set_leader(False)
+                return False
+            return self.write(lease, now)
+
+    def write(self, lease: V1Lease, now: float, create: bool = False) -> bool:
+        spec = lease.spec
+        now_dt = datetime.fromtimestamp(now, timezone.utc)
+        if spec.holder_identity != self.identity:
+            spec.lease_transitions = (spec.lease_transitions or 0) + (1 if spec.holder_identity else 0)
+            spec.holder_identity = self.identity
+            spec.acquire_time = now_dt
+        spec.renew_time = now_dt
+        spec.lease_duration_seconds = int(self.lease_duration_s)
+        lease.metadata.annotations = dict(lease.metadata.annotations or {})
+        lease.metadata.annotations[LAST_SCALEUP_ANNOTATION] = json.dumps(self.last_scaleups)
+        try:
+            if create:
+                self.api.create_namespaced_lease(self.namespace, lease)
+            else:
+                # carries the resourceVersion read above, a concurrent writer makes it fail with 409
+                self.api.replace_namespaced_lease(self.name, self.namespace, lease)
+        except ApiException as e:
+            if e.status in (409, 422):
+                self.set_leader(False)
+                return False
+            raise
+        self.renewed_at = now
+        self.set_leader(True)
+        return True
+
+    # Gives the lease up on shutdown so a standby takes over on its next retry instead of after the lease expires
+    def release(self):
+        with self.lock:
+            if not self.leader:
+                return
+            lease = utils.read_or_none(self.api.read_namespaced_lease, self.name, self.namespace)
+            if lease is not None and lease.spec.holder_identity == self.identity:
+                lease.spec.holder_identity = None
+                lease.spec.lease_duration_seconds = 1
+                self.api.replace_namespaced_lease(self.name, self.namespace, lease)
+            self.set_leader(False)
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.try_acquire_or_renew()
+            except Exception as e:
+                logger.warning("Lease %s: %s", self.name, e)
+            self.stop_event.wait(self.retry_period_s)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.release()
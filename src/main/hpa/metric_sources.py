@@ -0,0 +1,101 @@
+import json
+import math
+
+from main.hpa.dataset_prober import DatasetProber, ProbeOutcome
+from main.hpa.structured_log import logger
+
+SOURCE_CPU = "cpu"
+SOURCE_POD_JSON = "pod-json"
+
+
+# Average value of a metric over the ready replicas and the value one replica is meant to handle
+class MetricValue:
+
+    def __init__(self, average: float, target: float, samples: int):
+        self.average = average
+        self.target = target
+        self.samples = samples
+
+    # Same rule as the Kubernetes HPA: replicas that bring the average to the target
+    def desired_replicas(self, current_replicas: int) -> int:
+        if self.samples == 0 or self.target <= 0 or current_replicas == 0:
+            return None
+        return math.ceil(current_replicas * self.average / self.target)
+
+    def to_dict(self) -> dict:
+        return {"average": self.average, "target": self.target, "samples": self.samples}
+
+
+class MetricSource:
+    name = None
+
+    def read(self, snapshot) -> MetricValue:
+        raise NotImplementedError
+
+
+# CPU from metrics.k8s.io, already in the snapshot. The target is a utilization of the requested CPU
+class CpuMetricSource(MetricSource):
+
+    def __init__(self, target_utilization: float, name: str = SOURCE_CPU):
+        self.name = name
+        self.target_utilization = target_utilization
+
+    def read(self, snapshot) -> MetricValue:
+        ready = snapshot.num_replicas_ready
+        return MetricValue(snapshot.total_cpu_m / ready if ready else 0,
+                           snapshot.requested_cpu_m * self.target_utilization, ready)
+
+
+# A number from a JSON endpoint of every pod (latency, queue depth...), e.g. field "queue.depth" of /admin/metrics.
+# Pods that do not answer in time are left out of the average.
+class PodJsonMetricSource(MetricSource):
+
+    def __init__(self, name: str, path: str, field: str, target: float, prober: DatasetProber):
+        self.name = name
+        self.path = path
+        self.field = field.split(".")
+        self.target = target
+        self.prober = prober
+
+    def value(self, doc) -> float:
+        for key in self.field:
+            doc = doc[key]
+        return float(doc)
+
+    def read(self, snapshot) -> MetricValue:
+        responses = self.prober.get_json_all([ip for _, ip in snapshot.name_ip_pairs], self.path)
+        values = []
+        for ip, (outcome, doc, detail) in responses.items():
+            if outcome == ProbeOutcome.OK:
+                try:
+                    values.append(self.value(doc))
+                    continue
+                except (KeyError, TypeError, ValueError) as e:
+                    detail = f"missing or invalid {e}"
+            logger.warning("Metric %s of %s: %s %s", self.name, ip, outcome.name, detail)
+        return MetricValue(sum(values) / len(values) if values else 0, self.target, len(values))
+
+
+def parse_metric_sources(text: str, prober: DatasetProber) -> list[MetricSource]:
+    sources = []
+    for spec in json.loads(text):
+        source_type = spec.get("type", SOURCE_POD_JSON)
+        if source_type == SOURCE_CPU:
+            sources.append(CpuMetricSource(float(spec["target"]), spec.get("name", SOURCE_CPU)))
+        elif source_type == SOURCE_POD_JSON:
+            sources.append(PodJsonMetricSource(spec["name"], spec.get("path", "/admin/metrics"), spec["field"],
+                                               float(spec["target"]), prober))
+        else:
+            raise ValueError(f"Unknown metric source type {source_type}")
+    return sources
+
+
+# Reads every source, a failing source is skipped for this cycle
+def read_metric_sources(sources: list[MetricSource], snapshot) -> dict[str, MetricValue]:
+    values = {}
+    for source in sources:
+        try:
+            values[source.name] = source.read(snapshot)
+        except Exception:
+            logger.exception("Metric source %s", source.name)
+    return values
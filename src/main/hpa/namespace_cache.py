@@ -0,0 +1,50 @@
+import threading
+import time
+
+from kubernetes.client import CoreV1Api, CustomObjectsApi
+
+from main.api_groups import custom_objects_api, pod_api
+
+
+# Pods and pod metrics of one namespace, listed at most once per ttl_s and shared by every target of the namespace.
+# Targets select their own pods from it by label.
+class NamespaceCache:
+
+    def __init__(self, core_api_c: CoreV1Api, custom_objects_api_c: CustomObjectsApi, namespace, ttl_s: float):
+        self.core_api_client = core_api_c
+        self.custom_objects_api_client = custom_objects_api_c
+        self.namespace = namespace
+        self.ttl_s = ttl_s
+        self.pods_decode_counter = pod_api.DecodeCounter()
+        self.lock = threading.Lock()
+        self.pods = []
+        self.pods_time = None
+        self.usages = {}
+        self.usages_time = None
+
+    def is_fresh(self, t, now) -> bool:
+        return t is not None and now - t < self.ttl_s
+
+    def get_pods(self):
+        with self.lock:
+            now = time.monotonic()
+            if not self.is_fresh(self.pods_time, now):
+                self.pods = pod_api.list_namespaced_pods(self.core_api_client, self.namespace,
+                                                         field_selector="status.phase=Running",
+                                                         counter=self.pods_decode_counter)
+                self.pods_time = now
+            return self.pods
+
+    def get_ready_pods(self, app_name, role, container_name):
+        return [pod for pod in self.get_pods()
+                if pod_api.check_pod_label(pod, "app", app_name)
+                and pod_api.check_pod_label(pod, "role", role)
+                and pod_api.is_pod_serving(pod, container_name)]
+
+    def get_pods_usages(self) -> dict[str, dict[str, dict]]:
+        with self.lock:
+            now = time.monotonic()
+            if not self.is_fresh(self.usages_time, now):
+                self.usages = custom_objects_api.get_pods_usages(self.custom_objects_api_client, self.namespace)
+                self.usages_time = now
+            return self.usages
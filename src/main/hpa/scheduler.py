@@ -0,0 +1,76 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from main.hpa.structured_log import logger
+from main.hpa.targets import Target
+
+
+# Evaluates every target on its own interval over a shared worker pool. A target is never evaluated twice at the
+# same time; a slow target only delays its own next evaluation.
+class TargetScheduler:
+
+    def __init__(self, targets: list[Target], evaluate: Callable[[Target], object], max_workers: int,
+                 log: Callable[[str], None] = logger.info, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self.targets = targets
+        self.evaluate = evaluate
+        self.log = log
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="target")
+        self.lock = threading.Lock()
+        self.next_due: dict[str, float] = {t.name: 0.0 for t in targets}
+        self.running: set[str] = set()
+        self.rerun: set[str] = set()  # marked due while running
+        self.stop_event = threading.Event()
+        self.wake_event = threading.Event()
+
+    def run_target(self, target: Target):
+        start = self.clock()
+        try:
+            target.last_action = self.evaluate(target)
+        except Exception as e:
+            self.log(f"Target {target.name}: {e}")
+        finally:
+            end = self.clock()
+            target.record_latency(end - start)
+            self.log(f"Target {target.name}: decision {getattr(target.last_action, 'name', None)} "
+                     f"in {(end - start) * 1000:.1f}ms (max {target.max_latency_s * 1000:.1f}ms)")
+            with self.lock:
+                self.next_due[target.name] = end if target.name in self.rerun else end + target.interval_s
+                self.running.discard(target.name)
+                self.rerun.discard(target.name)
+
+    # Submits the due targets and returns the time until the next one is due
+    def run_once(self, now: float = None) -> float:
+        now = self.clock() if now is None else now
+        wait_s = None
+        with self.lock:
+            for target in self.targets:
+                if target.name in self.running:
+                    continue
+                due = self.next_due[target.name]
+                if due <= now:
+                    self.running.add(target.name)
+                    self.executor.submit(self.run_target, target)
+                else:
+                    wait_s = due - now if wait_s is None else min(wait_s, due - now)
+        return wait_s if wait_s is not None else 1.0
+
+    # Every target is evaluated right away instead of on its interval, e.g. when this replica becomes the leader
+    def mark_all_due(self):
+        with self.lock:
+            for target in self.targets:
+                self.next_due[target.name] = 0.0
+            self.rerun.update(self.running)
+        self.wake_event.set()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            self.wake_event.wait(min(self.run_once(), 1.0))
+            self.wake_event.clear()
+
+    def stop(self):
+        self.stop_event.set()
+        self.wake_event.set()
+        self.executor.shutdown(wait=True)
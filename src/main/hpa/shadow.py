@@ -0,0 +1,178 @@
+import copy
+import json
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
+
+from main.hpa.behavior import ScalingBehavior
+from main.hpa.dataset_prober import ProbeOutcome, ProbeResult
+from main.hpa.instrumentation import HpaMetrics
+from main.hpa.structured_log import CycleRecord, logger
+
+LIVE_POLICY = "live"
+# pods the live cycle did not probe: not empty, so a shadow scale-down in step mode takes a single pod
+ASSUMED_PROBE = ProbeResult(ProbeOutcome.OK, 1)
+
+
+# {"name": {"ENV_VAR": "value", ...}, ...}, each policy overrides some settings of the live configuration
+def parse_shadow_policies(text: str) -> dict[str, dict[str, str]]:
+    policies = json.loads(text)
+    if not isinstance(policies, dict):
+        raise ValueError("SHADOW_POLICIES must be a JSON object of policy name to settings")
+    return {name: {key: str(value) for key, value in overrides.items()} for name, overrides in policies.items()}
+
+
+# Fields of a shadow decision, kept instead of logged
+class ShadowCycle(CycleRecord):
+
+    def emit(self, message: str = "cycle"):
+        pass
+
+
+# The ClusterActions writes of scale_snapshot, recorded instead of sent
+class ShadowClusterActions:
+
+    def __init__(self, deployment, behavior=None):
+        self.deployment_web = deployment
+        self.shadow = None
+        self.behavior = behavior
+        self.replicas_set: int = None
+        self.deletion_costs: dict[str, int] = {}
+
+    def set_deployment_replicas(self, target_replicas, resource_version: str = None):
+        self.replicas_set = target_replicas
+        return resource_version
+
+    def annotate_pods_deletion_cost(self, costs: dict[str, int]) -> None:
+        self.deletion_costs = costs
+
+    def record_scale_up(self, replicas_added: int):
+        pass
+
+
+class PolicyStats:
+
+    def __init__(self):
+        self.evaluations = 0
+        self.divergences = 0
+        self.replica_s = 0.0
+        self.over_threshold_s = 0.0
+        self.last_action: str = None
+        self.last_target_replicas: int = None
+
+    def to_dict(self) -> dict:
+        return {"evaluations": self.evaluations, "divergences": self.divergences,
+                "replica_minutes": round(self.replica_s / 60, 2),
+                "over_threshold_minutes": round(self.over_threshold_s / 60, 2)}
+
+
+class ShadowPolicy:
+
+    def __init__(self, name: str, hpa_config, behavior: ScalingBehavior = None):
+        self.name = name
+        self.hpa_config = hpa_config
+        self.behavior = behavior  # with its own recommendation history
+        self.last_scale_up = 0.0  # of its own decisions
+        self.stats = PolicyStats()
+
+
+# Runs alternative policies on the inputs of every live cycle, on its own thread once the live decision is written.
+# A policy sees the live state: its projection is the replicas it would have set in each cycle, charged for the time
+# until the next one, and the time the measured load would have been above its upper threshold with them. The live
+# policy is projected the same way under the name "live" for comparison.
+class ShadowEvaluator:
+
+    def __init__(self, policies: list[ShadowPolicy], decide: Callable, live_hpa_config, deployment="web",
+                 metrics: HpaMetrics = None):
+        self.policies = policies
+        self.decide = decide  # scale_snapshot
+        self.live = ShadowPolicy(LIVE_POLICY, live_hpa_config)
+        self.deployment = deployment
+        self.metrics = metrics
+        self.probes: dict[str, ProbeResult] = {}  # last known of every pod
+        self.last_time: float = None
+        self.last_decisions: dict[str, dict] = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shadow")
+
+    # Wraps the live probe_pods to keep its results for the shadow decisions
+    def record_probes(self, probe_pods: Callable[[list[str]], dict[str, ProbeResult]]):
+        def recording(pod_ips):
+            results = probe_pods(pod_ips)
+            self.probes = {**self.probes, **results}
+            return results
+        return recording
+
+    # Called with the snapshot as it was before the live decision
+    def submit(self, snapshot, live_action, live_target_replicas: int, last_scale_up: float,
+               now: float = None) -> Future:
+        now = time.time() if now is None else now
+        return self.executor.submit(self.evaluate, snapshot, live_action, live_target_replicas, last_scale_up, now)
+
+    def evaluate(self, snapshot, live_action, live_target_replicas: int, last_scale_up: float, now: float) -> dict:
+        try:
+            with self.lock:
+                return self.evaluate_policies(snapshot, live_action, live_target_replicas, last_scale_up, now)
+        except Exception:
+            logger.exception("Shadow evaluation failed")
+            return {}
+
+    def evaluate_policies(self, snapshot, live_action, live_target_replicas, last_scale_up, now) -> dict:
+        dt = now - self.last_time if self.last_time is not None else 0.0
+        self.last_time = now
+        ips = [ip for _, ip in snapshot.name_ip_pairs]
+        self.probes = {ip: self.probes[ip] for ip in ips if ip in self.probes}
+        probes = dict(self.probes)
+
+        self.project(self.live, snapshot, dt)
+        self.live.stats.last_action = live_action.name
+        self.live.stats.last_target_replicas = live_target_replicas
+        decisions = {}
+        for policy in self.policies:
+            self.project(policy, snapshot, dt)
+            cluster_actions = ShadowClusterActions(self.deployment, policy.behavior)
+            cycle = ShadowCycle()
+            action = self.decide(cluster_actions, policy.hpa_config, copy.copy(snapshot),
+                                 lambda pod_ips: {ip: probes.get(ip, ASSUMED_PROBE) for ip in pod_ips},
+                                 max(policy.last_scale_up, last_scale_up), now, cycle)
+            if action.name == "SCALE_UP":
+                policy.last_scale_up = now
+            target_replicas = cluster_actions.replicas_set
+            if target_replicas is None:
+                target_replicas = snapshot.deployment_replicas
+            diverged = action != live_action or target_replicas != live_target_replicas
+            policy.stats.evaluations += 1
+            policy.stats.divergences += diverged
+            policy.stats.last_action = action.name
+            policy.stats.last_target_replicas = target_replicas
+            decisions[policy.name] = {"action": action.name, "target_replicas": target_replicas,
+                                      "diverged": diverged, "victims": cycle.fields.get("victims")}
+            if diverged and self.metrics is not None:
+                self.metrics.shadow_divergences.inc(self.deployment, policy.name)
+        self.live.stats.evaluations += 1
+        self.last_decisions = decisions
+        logger.info("shadow", extra={"fields": {"deployment": self.deployment, "live_action": live_action.name,
+                                                "live_target_replicas": live_target_replicas,
+                                                "policies": decisions}})
+        return decisions
+
+    # Charges the replicas the policy chose last cycle for the time since, and the time the load measured now was
+    # above its upper threshold with them
+    def project(self, policy: ShadowPolicy, snapshot, dt: float):
+        replicas = policy.stats.last_target_replicas
+        if replicas is None or dt <= 0:
+            return
+        over = 0.0
+        capacity_m = snapshot.requested_cpu_m * replicas * policy.hpa_config.upper_cpu_threshold
+        if snapshot.raw_total_cpu_m > capacity_m:
+            over = dt
+        policy.stats.replica_s += replicas * dt
+        policy.stats.over_threshold_s += over
+        if self.metrics is not None:
+            self.metrics.shadow_replica_seconds.inc(self.deployment, policy.name, amount=replicas * dt)
+            self.metrics.shadow_over_threshold_seconds.inc(self.deployment, policy.name, amount=over)
+
+    def stats(self) -> dict[str, dict]:
+        with self.lock:
+            return {p.name: p.stats.to_dict() for p in [self.live] + self.policies}
@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+import argparse
+import bisect
+import csv
+import json
+import math
+import os
+import random
+
+from kubernetes.client import V1Deployment, V1DeploymentSpec, V1LabelSelector, V1ObjectMeta, V1PodTemplateSpec
+from kubernetes.client.rest import ApiException
+
+from main.hpa.cpu_history import CpuHistory
+from main.hpa.dataset_prober import ProbeOutcome, ProbeResult
+from main.hpa.forecast import LoadForecaster
+from main.hpa.hpa_main import ClusterSnapshot, HpaConfig, ScalerAction, new_behavior, new_cpu_history, \
+    scale_replicas
+from main.hpa.metric_sources import CpuMetricSource, MetricSource, parse_metric_sources, read_metric_sources
+from main.hpa.structured_log import muted
+
+
+class VirtualClock:
+
+    def __init__(self, start: float = 0.0):
+        self.now = start
+
+    def time(self) -> float:
+        return self.now
+
+    def advance(self, dt: float):
+        self.now += dt
+
+
+# Total CPU demand of the deployment over time, linearly interpolated between samples
+class LoadTrace:
+
+    def __init__(self, samples: list[tuple[float, float]]):
+        self.samples = sorted(samples)
+        self.times = [t for t, _ in self.samples]
+
+    @property
+    def start(self) -> float:
+        return self.times[0]
+
+    @property
+    def end(self) -> float:
+        return self.times[-1]
+
+    def demand(self, t: float) -> float:
+        i = bisect.bisect_right(self.times, t)
+        if i == 0:
+            return self.samples[0][1]
+        if i == len(self.samples):
+            return self.samples[-1][1]
+        (t0, v0), (t1, v1) = self.samples[i - 1], self.samples[i]
+        return v0 + (v1 - v0) * (t - t0) / (t1 - t0)
+
+    # CSV rows of timestamp_s,total_cpu_m; a header row is skipped
+    @staticmethod
+    def from_csv(path) -> "LoadTrace":
+        samples = []
+        with open(path) as f:
+            for row in csv.reader(f):
+                try:
+                    samples.append((float(row[0]), float(row[1])))
+                except (ValueError, IndexError):
+                    continue
+        return LoadTrace(samples)
+
+    # Daily sine around base_cpu_m with gaussian noise
+    @staticmethod
+    def synthetic(days: float, step_s: float, base_cpu_m: float, amplitude_cpu_m: float, noise: float = 0.05,
+                  seed: int = 0) -> "LoadTrace":
+        rnd = random.Random(seed)
+        samples = []
+        for i in range(int(days * 86400 / step_s) + 1):
+            t = i * step_s
+            v = base_cpu_m + amplitude_cpu_m * math.sin(2 * math.pi * (t / 86400 - 0.25))
+            samples.append((t, max(0.0, v * (1 + rnd.gauss(0, noise)))))
+        return LoadTrace(samples)
+
+
+class SimulatedPod:
+
+    def __init__(self, name, ip, created_at: float, ready_at: float):
+        self.name = name
+        self.ip = ip
+        self.created_at = created_at
+        self.ready_at = ready_at
+        self.busy_until = created_at
+        self.deletion_cost = None
+
+    def is_ready(self, now) -> bool:
+        return now >= self.ready_at
+
+
+# Implements the ClusterActions surface used by scale_replicas over simulated pods. Demand is split evenly between
+# ready pods; a pod keeps its datasets until it has been under idle_utilization for dataset_idle_s. The samples go
+# through the CPU history, forecast and metric sources like those of ClusterActions.build_snapshot.
+class SimulatedCluster:
+
+    def __init__(self, clock: VirtualClock, trace: LoadTrace, requested_cpu_m: int, initial_replicas: int,
+                 pod_startup_s: float, dataset_idle_s: float = 600, idle_utilization: float = 0.2,
+                 datasets_per_pod: int = 5, forecaster: LoadForecaster = None, cpu_history: CpuHistory = None,
+                 metric_sources: list[MetricSource] = None):
+        self.clock = clock
+        self.trace = trace
+        self.requested_cpu_m = requested_cpu_m
+        self.pod_startup_s = pod_startup_s
+        self.dataset_idle_s = dataset_idle_s
+        self.idle_utilization = idle_utilization
+        self.datasets_per_pod = datasets_per_pod
+        self.forecaster = forecaster
+        self.cpu_history = cpu_history
+        self.metric_sources = metric_sources if metric_sources is not None else []
+        self.deployment_web = "web"
+        self.shadow = None
+        self.behavior = None
+        self.pods: list[SimulatedPod] = []
+        self.pod_seq = 0
+        self.resource_version = 1
+        for _ in range(initial_replicas):
+            self.add_pod(ready_at=clock.now)
+
+    def add_pod(self, ready_at: float):
+        self.pod_seq += 1
+        seq = self.pod_seq
+        self.pods.append(SimulatedPod(f"web-{seq}", f"10.{seq // 65536 % 256}.{seq // 256 % 256}.{seq % 256}",
+                                      self.clock.now, ready_at))
+
+    @property
+    def deployment_replicas(self) -> int:
+        return len(self.pods)
+
+    def ready_pods(self) -> list[SimulatedPod]:
+        return [p for p in self.pods if p.is_ready(self.clock.now)]
+
+    def pod_cpu_m(self) -> float:
+        ready = self.ready_pods()
+        return self.trace.demand(self.clock.now) / len(ready) if ready else 0.0
+
+    # Advances the dataset state of the pods, called on every simulation step
+    def observe(self):
+        if self.pod_cpu_m() >= self.idle_utilization * self.requested_cpu_m:
+            for p in self.ready_pods():
+                p.busy_until = self.clock.now + self.dataset_idle_s
+
+    def num_datasets(self, pod: SimulatedPod) -> int:
+        if not pod.is_ready(self.clock.now) or self.clock.now >= pod.busy_until:
+            return 0
+        return self.datasets_per_pod
+
+    def get_snapshot(self) -> ClusterSnapshot:
+        ready = self.ready_pods()
+        cpu_m = self.pod_cpu_m()
+        pods_cpu_m = {p.name: cpu_m for p in ready}
+        raw_total_cpu_m = cpu_m * len(ready)
+        total_cpu_m = raw_total_cpu_m
+        if self.cpu_history is not None:
+            self.cpu_history.record(pods_cpu_m)
+            pods_cpu_m = self.cpu_history.pods_cpu_m()
+            total_cpu_m = self.cpu_history.total_cpu_m()
+        snapshot = ClusterSnapshot([(p.name, p.ip) for p in ready], total_cpu_m, self.deployment_replicas,
+                                   self.requested_cpu_m, str(self.resource_version), pods_cpu_m, raw_total_cpu_m)
+        if self.forecaster is not None:
+            self.forecaster.record(self.clock.now, snapshot.raw_total_cpu_m)
+            snapshot.predicted_cpu_m = self.forecaster.predicted_cpu_m()
+        if self.metric_sources:
+            snapshot.metrics = read_metric_sources(self.metric_sources, snapshot)
+        return snapshot
+
+    def read_deployment(self) -> V1Deployment:
+        return V1Deployment(metadata=V1ObjectMeta(name=self.deployment_web,
+                                                  resource_version=str(self.resource_version)),
+                            spec=V1DeploymentSpec(replicas=self.deployment_replicas, selector=V1LabelSelector(),
+                                                  template=V1PodTemplateSpec()))
+
+    def set_deployment_replicas(self, target_replicas, resource_version: str = None):
+        if resource_version is not None and resource_version != str(self.resource_version):
+            # what the API server answers to the failed 'test' precondition
+            raise ApiException(status=422, reason=f"resource version {resource_version} != {self.resource_version}")
+        while len(self.pods) < target_replicas:
+            self.add_pod(ready_at=self.clock.now + self.pod_startup_s)
+        if len(self.pods) > target_replicas:
+            # ReplicaSet victim order: lowest deletion cost, then not ready, then newest
+            ordered = sorted(self.pods, key=lambda p: (p.deletion_cost if p.deletion_cost is not None else 0,
+                                                       p.is_ready(self.clock.now), -p.created_at))
+            self.pods = ordered[len(self.pods) - target_replicas:]
+        self.resource_version += 1
+        return str(self.resource_version)
+
+    def annotate_pod_deletion_cost(self, name: str, cost: int) -> None:
+        for p in self.pods:
+            if p.name == name:
+                p.deletion_cost = cost
+
+    def annotate_pods_deletion_cost(self, costs: dict[str, int]) -> None:
+        for p in self.pods:
+            if p.name in costs:
+                p.deletion_cost = costs[p.name]
+
+    # no standby pool is simulated
+    def record_scale_up(self, replicas_added: int):
+        pass
+
+
+class SimulatedAppInfo:
+
+    def __init__(self, cluster: SimulatedCluster):
+        self.cluster = cluster
+
+    def get_pods_num_datasets(self, pod_ips: list[str]) -> dict[str, ProbeResult]:
+        by_ip = {p.ip: p for p in self.cluster.pods}
+        results = {}
+        for ip in pod_ips:
+            if ip in by_ip:
+                results[ip] = ProbeResult(ProbeOutcome.OK, self.cluster.num_datasets(by_ip[ip]))
+            else:
+                results[ip] = ProbeResult(ProbeOutcome.CONNECTION_ERROR, detail="pod gone")
+        return results
+
+
+class SimulationReport:
+
+    def __init__(self):
+        self.duration_s = 0.0
+        self.replica_minutes = 0.0
+        self.time_over_upper_s = 0.0
+        self.evaluations = 0
+        self.scale_ups = 0
+        self.scale_downs = 0
+        self.max_replicas = 0
+
+    @property
+    def scale_events(self) -> int:
+        return self.scale_ups + self.scale_downs
+
+    def to_dict(self) -> dict:
+        return {
+            "duration_s": self.duration_s,
+            "replica_minutes": round(self.replica_minutes, 2),
+            "time_over_upper_s": self.time_over_upper_s,
+            "scale_events": self.scale_events,
+            "scale_ups": self.scale_ups,
+            "scale_downs": self.scale_downs,
+            "evaluations": self.evaluations,
+            "max_replicas": self.max_replicas,
+        }
+
+
+# Only the cpu sources can be simulated, the others read endpoints of real pods
+def simulated_metric_sources(hpa_config: HpaConfig) -> list[MetricSource]:
+    if not hpa_config.metric_sources:
+        return []
+    sources = parse_metric_sources(hpa_config.metric_sources, None)
+    unsupported = [s.name for s in sources if not isinstance(s, CpuMetricSource)]
+    if unsupported:
+        raise ValueError(f"Metric sources {unsupported} cannot be simulated, only the cpu type can")
+    return sources
+
+
+# Replays a trace against scale_replicas on a virtual clock. The cluster is integrated every step_s and the
+# controller evaluated every loop_time_s of the config.
+class Simulation:
+
+    def __init__(self, hpa_config: HpaConfig, trace: LoadTrace, requested_cpu_m: int, step_s: float = 10,
+                 pod_startup_s: float = None, dataset_idle_s: float = 600):
+        self.hpa_config = hpa_config
+        self.trace = trace
+        self.step_s = step_s
+        self.clock = VirtualClock(trace.start)
+        forecaster = None
+        if hpa_config.predictive_scaling:
+            forecaster = LoadForecaster(hpa_config.forecast_season_s, hpa_config.forecast_slot_s,
+                                        hpa_config.pod_startup_s)
+        self.cluster = SimulatedCluster(self.clock, trace, requested_cpu_m, hpa_config.min_replicas,
+                                        pod_startup_s if pod_startup_s is not None else hpa_config.pod_startup_s,
+                                        dataset_idle_s, forecaster=forecaster,
+                                        cpu_history=new_cpu_history(hpa_config),
+                                        metric_sources=simulated_metric_sources(hpa_config))
+        self.cluster.behavior = new_behavior(hpa_config)
+        self.app_info = SimulatedAppInfo(self.cluster)
+
+    def run(self) -> SimulationReport:
+        report = SimulationReport()
+        last_scale_up = 0
+        next_evaluation = self.clock.now
+        with muted():
+            while self.clock.now < self.trace.end:
+                if self.clock.now >= next_evaluation:
+                    action = scale_replicas(self.cluster, self.hpa_config, self.app_info, last_scale_up,
+                                            now=self.clock.now)
+                    report.evaluations += 1
+                    if action == ScalerAction.SCALE_UP:
+                        last_scale_up = self.clock.now
+                        report.scale_ups += 1
+                    elif action == ScalerAction.SCALE_DOWN:
+                        report.scale_downs += 1
+                    next_evaluation = self.clock.now + self.hpa_config.loop_time_s
+                self.cluster.observe()
+                ready = len(self.cluster.ready_pods())
+                capacity_m = ready * self.cluster.requested_cpu_m * self.hpa_config.upper_cpu_threshold
+                if self.trace.demand(self.clock.now) > capacity_m:
+                    report.time_over_upper_s += self.step_s
+                report.replica_minutes += self.cluster.deployment_replicas * self.step_s / 60
+                report.max_replicas = max(report.max_replicas, self.cluster.deployment_replicas)
+                self.clock.advance(self.step_s)
+        report.duration_s = self.clock.now - self.trace.start
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a CPU load trace against the scaling policy")
+    parser.add_argument("--trace", help="CSV of timestamp_s,total_cpu_m. A synthetic daily trace if omitted")
+    parser.add_argument("--days", type=float, default=7, help="length of the synthetic trace")
+    parser.add_argument("--base-cpu-m", type=float, default=2000)
+    parser.add_argument("--amplitude-cpu-m", type=float, default=1500)
+    parser.add_argument("--requested-cpu-m", type=int, default=500, help="CPU request of one pod")
+    parser.add_argument("--step-s", type=float, default=10)
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE",
+                        help="HpaConfig setting, e.g. --set UPPER_CPU_THRESHOLD=0.8. Overrides the environment")
+    args = parser.parse_args()
+
+    env = {"MIN_REPLICAS": "2", "MAX_REPLICAS": "20", "UPPER_CPU_THRESHOLD": "0.7", "LOWER_CPU_THRESHOLD": "0.4",
+           "LOOP_TIME_S": "90", "NO_SCALE_DOWN_PERIOD": "300"}
+    env.update(os.environ)
+    env.update(dict(kv.split("=", 1) for kv in args.set))
+    if args.trace:
+        trace = LoadTrace.from_csv(args.trace)
+    else:
+        trace = LoadTrace.synthetic(args.days, 60, args.base_cpu_m, args.amplitude_cpu_m)
+    report = Simulation(HpaConfig(env), trace, args.requested_cpu_m, args.step_s).run()
+    print(json.dumps(report.to_dict(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import time
+from collections import deque
+
+from kubernetes.client import AppsV1Api, V1Container, V1Deployment, V1DeploymentSpec, V1LabelSelector, \
+    V1ObjectMeta, V1PodSpec, V1PodTemplateSpec, V1ResourceRequirements
+
+from main.api_groups import deployment_api
+
+PAUSE_IMAGE = "registry.k8s.io/pause:3.9"
+
+
+# Keeps a deployment of low-priority pause pods that hold warm node capacity. When the web deployment scales up
+# and the cluster is full, the scheduler preempts one placeholder and the new web pod takes its place instead of
+# waiting for a node to be provisioned. The PriorityClass must exist and have a lower value than the web pods.
+class StandbyPool:
+
+    def __init__(self, apps_api_c: AppsV1Api, namespace, name, priority_class, min_size, max_size, window_s):
+        self.apps_api_client = apps_api_c
+        self.namespace = namespace
+        self.name = name
+        self.priority_class = priority_class
+        self.min_size = min_size
+        self.max_size = max_size
+        self.window_s = window_s
+        self.size = None
+        self.available = 0
+        self.scale_ups: deque[tuple[float, int]] = deque()  # (time, replicas added)
+        self.scale_ups_total = 0  # replicas added, and those that found a placeholder
+        self.warm_scale_ups = 0
+
+    def placeholder_deployment(self, size, resource_requests: dict[str, str]) -> V1Deployment:
+        labels = {"app": self.name, "role": "standby"}
+        container = V1Container(name="pause", image=PAUSE_IMAGE,
+                                resources=V1ResourceRequirements(requests=resource_requests))
+        return V1Deployment(
+            metadata=V1ObjectMeta(name=self.name, namespace=self.namespace, labels=labels),
+            spec=V1DeploymentSpec(
+                replicas=size,
+                selector=V1LabelSelector(match_labels=labels),
+                template=V1PodTemplateSpec(
+                    metadata=V1ObjectMeta(labels=labels),
+                    spec=V1PodSpec(containers=[container], priority_class_name=self.priority_class,
+                                   termination_grace_period_seconds=0))))
+
+    # Placeholders request the same resources as one web pod, so each preemption frees room for exactly one replica
+    def ensure(self, resource_requests: dict[str, str]):
+        deployments = deployment_api.get_deployment_by_name(self.apps_api_client, self.name, self.namespace)
+        if len(deployments) == 0:
+            self.size = self.min_size
+            deployment_api.create_deployment(self.apps_api_client, self.namespace,
+                                             self.placeholder_deployment(self.size, resource_requests))
+        else:
+            self.size = deployments[0].spec.replicas
+
+    def refresh(self):
+        self.available = deployment_api.get_deployment_available_replicas(self.apps_api_client, self.name,
+                                                                          self.namespace)
+
+    def record_scale_up(self, replicas_added: int = 1, now: float = None):
+        now = time.time() if now is None else now
+        self.scale_ups.append((now, replicas_added))
+        self.scale_ups_total += replicas_added
+        warm = min(self.available, replicas_added)
+        self.warm_scale_ups += warm
+        self.available -= warm
+
+    def to_state(self) -> dict:
+        return {"scale_ups": list(self.scale_ups)}
+
+    def restore(self, state: dict):
+        self.scale_ups.extend((t, replicas_added) for t, replicas_added in state.get("scale_ups", []))
+
+    def desired_size(self, now: float = None) -> int:
+        now = time.time() if now is None else now
+        while self.scale_ups and now - self.scale_ups[0][0] > self.window_s:
+            self.scale_ups.popleft()
+        # As many placeholders as replicas added in the last window, so a repeat burst lands on warm capacity
+        return max(self.min_size, min(self.max_size, sum(added for _, added in self.scale_ups)))
+
+    def resize(self, now: float = None) -> int:
+        desired = self.desired_size(now)
+        if desired != self.size:
+            deployment_api.set_deployment_replicas(self.apps_api_client, self.name, self.namespace, desired)
+            self.size = desired
+        return self.size
+
+    @property
+    def warm_hit_ratio(self) -> float:
+        if self.scale_ups_total == 0:
+            return 0.0
+        return self.warm_scale_ups / self.scale_ups_total
@@ -0,0 +1,163 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Callable
+
+from kubernetes.client import CoreV1Api, V1ConfigMap, V1ObjectMeta
+from kubernetes.client.rest import ApiException
+
+from main.api_groups import utils
+from main.hpa.structured_log import logger
+
+STATE_VERSION = 1
+CONFIGMAP_KEY = "state.json"
+# ClusterActions attributes whose state is kept
+COMPONENTS = ("behavior", "cpu_history", "forecaster", "standby_pool")
+
+
+# Controller state of every deployment (last scale-up, recommendation windows, scale events, CPU history and
+# forecast), kept in memory and written as one compact JSON document: right away after a scale and otherwise at most
+# once per save interval. A restarted controller loads it before its first cycle and decides as if it never stopped.
+# A failed write keeps the state dirty for the next save.
+class StateStore:
+
+    def __init__(self, save_interval_s: float = 30, clock: Callable[[], float] = time.time):
+        self.save_interval_s = save_interval_s
+        self.clock = clock
+        self.states: dict[str, dict] = {}
+        self.saved_at = None
+        self.dirty = False
+        self.lock = threading.Lock()
+
+    def read(self) -> str:
+        raise NotImplementedError
+
+    def write(self, text: str):
+        raise NotImplementedError
+
+    # Starts empty when nothing was stored or it cannot be read
+    def load(self) -> dict[str, dict]:
+        start = time.perf_counter()
+        with self.lock:
+            try:
+                text = self.read()
+                doc = json.loads(text) if text else {}
+            except Exception as e:
+                logger.warning("State store %s not loaded: %s", self, e)
+                return {}
+            if doc and doc.get("version") != STATE_VERSION:
+                logger.warning("State store %s has version %s, expected %s", self, doc.get("version"), STATE_VERSION)
+                return {}
+            self.states = doc.get("deployments", {})
+            logger.info("Loaded the state of %s deployments from %s in %.1fms", len(self.states), self,
+                        (time.perf_counter() - start) * 1000)
+            return dict(self.states)
+
+    def get(self, key) -> dict:
+        with self.lock:
+            return self.states.get(key, {})
+
+    def save(self, key, state: dict, force: bool = False):
+        with self.lock:
+            self.states[key] = state
+            self.dirty = True
+            now = self.clock()
+            if force or self.saved_at is None or now - self.saved_at >= self.save_interval_s:
+                self.flush_locked(now)
+
+    def flush(self):
+        with self.lock:
+            if self.dirty:
+                self.flush_locked(self.clock())
+
+    def flush_locked(self, now: float):
+        text = json.dumps({"version": STATE_VERSION, "saved_at": now, "deployments": self.states},
+                          separators=(",", ":"))
+        try:
+            self.write(text)
+        except Exception as e:
+            logger.warning("State store %s not saved: %s", self, e)
+            return
+        self.saved_at = now
+        self.dirty = False
+
+
+# Replaced atomically, a crash during a write leaves the previous version
+class FileStateStore(StateStore):
+
+    def __init__(self, path, save_interval_s: float = 30, clock: Callable[[], float] = time.time):
+        super().__init__(save_interval_s, clock)
+        self.path = path
+
+    def __str__(self):
+        return self.path
+
+    def read(self) -> str:
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path) as f:
+            return f.read()
+
+    def write(self, text: str):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".state-")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(text)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+# Survives the controller pod being rescheduled and is shared by the leader election replicas. Needs get/create/update
+# on `configmaps`.
+class ConfigMapStateStore(StateStore):
+
+    def __init__(self, core_api: CoreV1Api, name, namespace, save_interval_s: float = 30,
+                 clock: Callable[[], float] = time.time):
+        super().__init__(save_interval_s, clock)
+        self.core_api = core_api
+        self.name = name
+        self.namespace = namespace
+
+    def __str__(self):
+        return f"configmap {self.namespace}/{self.name}"
+
+    def read(self) -> str:
+        config_map = utils.read_or_none(self.core_api.read_namespaced_config_map, self.name, self.namespace)
+        if config_map is None:
+            return None
+        return (config_map.data or {}).get(CONFIGMAP_KEY)
+
+    def write(self, text: str):
+        body = V1ConfigMap(metadata=V1ObjectMeta(name=self.name, namespace=self.namespace),
+                           data={CONFIGMAP_KEY: text})
+        try:
+            self.core_api.replace_namespaced_config_map(self.name, self.namespace, body)
+        except ApiException as e:
+            if e.status != 404:
+                raise
+            self.core_api.create_namespaced_config_map(self.namespace, body)
+
+
+def controller_state(cluster_actions, last_scaleup: float) -> dict:
+    state = {"last_scaleup": last_scaleup}
+    for name in COMPONENTS:
+        component = getattr(cluster_actions, name, None)
+        if component is not None:
+            state[name] = component.to_state()
+    return state
+
+
+# Returns the stored last scale-up time, 0 when there is none
+def restore_controller_state(cluster_actions, state: dict) -> float:
+    for name in COMPONENTS:
+        component = getattr(cluster_actions, name, None)
+        if component is not None and name in state:
+            component.restore(state[name])
+    return float(state.get("last_scaleup", 0))
@@ -0,0 +1,126 @@
+import atexit
+import contextlib
+import json
+import logging
+import queue
+import signal
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+LOGGER_NAME = "hpa"
+logger = logging.getLogger(LOGGER_NAME)
+
+# extra= for per-pod lines, which are dropped by the sampling filter
+SAMPLED = {"sampled": True}
+
+
+# One JSON object per line. Structured fields are passed as extra={"fields": {...}}
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {"ts": round(record.created, 3), "level": record.levelname, "logger": record.name,
+                 "msg": record.getMessage()}
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        return json.dumps(entry, default=str, separators=(",", ":"))
+
+
+# Keeps one in every `every` sampled records. Records that are not sampled always pass
+class SamplingFilter(logging.Filter):
+
+    def __init__(self, every: int = 1):
+        super().__init__()
+        self.every = max(1, every)
+        self.seen = 0
+        self.lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.every == 1 or not getattr(record, "sampled", False):
+            return True
+        with self.lock:
+            self.seen += 1
+            return self.seen % self.every == 1
+
+
+# StreamHandler without the flush after every record
+class BufferedStreamHandler(logging.StreamHandler):
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            self.stream.write(self.format(record) + self.terminator)
+        except Exception:
+            self.handleError(record)
+
+
+# Writes from its own thread and flushes once each time the queue drains, so a burst of records costs one flush
+class BatchingQueueListener(QueueListener):
+
+    def dequeue(self, block: bool):
+        if block and self.queue.empty():
+            for handler in self.handlers:
+                handler.flush()
+        return self.queue.get(block)
+
+    def stop(self):
+        if self._thread is not None:
+            super().stop()
+
+
+def set_level(level) -> None:
+    logger.setLevel(level.upper() if isinstance(level, str) else level)
+
+
+# Silences the controller logger for the duration, for callers that run whole cycles and only want their results
+@contextlib.contextmanager
+def muted():
+    level = logger.level
+    set_level(logging.CRITICAL + 1)
+    try:
+        yield
+    finally:
+        set_level(level)
+
+
+# SIGUSR1 switches between DEBUG and the configured level without restarting the controller
+def toggle_debug(configured_level):
+    def handler(signum=None, frame=None):
+        set_level(configured_level if logger.level == logging.DEBUG else logging.DEBUG)
+        logger.warning("Log level set to %s", logging.getLevelName(logger.level))
+    return handler
+
+
+def setup_logging(level: str = "INFO", sample_every: int = 1, stream=None) -> BatchingQueueListener:
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(sample_every))
+    output = BufferedStreamHandler(stream if stream is not None else sys.stdout)
+    output.setFormatter(JsonFormatter())
+    listener = BatchingQueueListener(log_queue, output)
+    listener.start()
+    atexit.register(listener.stop)
+    # third party libraries only log warnings, the controller logs at the configured level
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(logging.WARNING)
+    set_level(level)
+    if hasattr(signal, "SIGUSR1") and threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGUSR1, toggle_debug(logger.level))
+    return listener
+
+
+# Collects the fields of one scaling cycle and logs them as a single record
+class CycleRecord:
+
+    def __init__(self, **fields):
+        self.start = time.perf_counter()
+        self.fields = dict(fields)
+
+    def set(self, **fields):
+        self.fields.update(fields)
+
+    def emit(self, message: str = "cycle"):
+        self.fields["duration_ms"] = round((time.perf_counter() - self.start) * 1000, 1)
+        logger.info(message, extra={"fields": self.fields})
@@ -0,0 +1,68 @@
+import json
+import os
+
+from kubernetes.client import CoreV1Api
+
+from main.api_groups import utils
+
+
+# One autoscaled workload. config holds the same keys as the environment (MIN_REPLICAS, LOOP_TIME_S, ...);
+# keys missing from a target fall back to the process environment.
+class Target:
+
+    def __init__(self, name, namespace, deployment, app, role, container, config: dict, interval_s: float = None):
+        self.name = name
+        self.namespace = namespace
+        self.deployment = deployment
+        self.app = app
+        self.role = role
+        self.container = container
+        self.config = config
+        self.interval_s = interval_s
+        # runtime state, filled in by the controller
+        self.cluster_actions = None
+        self.hpa_config = None
+        self.last_scaleup = 0
+        self.last_action = None
+        self.last_latency_s = None
+        self.max_latency_s = 0.0
+        self.evaluations = 0
+
+    def env(self) -> dict:
+        return {**os.environ, **{k: str(v) for k, v in self.config.items()}}
+
+    def record_latency(self, latency_s: float):
+        self.last_latency_s = latency_s
+        self.max_latency_s = max(self.max_latency_s, latency_s)
+        self.evaluations += 1
+
+
+def parse_targets(doc: dict, default_namespace) -> list[Target]:
+    targets = []
+    for t in doc.get("targets", []):
+        deployment = t["deployment"]
+        targets.append(Target(name=t.get("name", deployment),
+                              namespace=t.get("namespace", default_namespace),
+                              deployment=deployment,
+                              app=t.get("app", deployment),
+                              role=t.get("role", "web"),
+                              container=t.get("container", deployment),
+                              config=t.get("config", {}),
+                              interval_s=t.get("interval_s")))
+    names = [t.name for t in targets]
+    if len(names) != len(set(names)):
+        raise ValueError(f"Duplicated target names in {names}")
+    return targets
+
+
+def load_targets_file(path, default_namespace) -> list[Target]:
+    with open(path) as f:
+        return parse_targets(json.load(f), default_namespace)
+
+
+# The ConfigMap holds the same JSON document as the targets file under the given key
+def load_targets_configmap(core_api_client: CoreV1Api, name, namespace, key="targets.json") -> list[Target]:
+    config_map = utils.read_or_none(core_api_client.read_namespaced_config_map, name, namespace)
+    if config_map is None or key not in (config_map.data or {}):
+        raise ValueError(f"ConfigMap {namespace}/{name} has no {key}")
+    return parse_targets(json.loads(config_map.data[key]), namespace)
@@ -0,0 +1,74 @@
+import math
+from datetime import datetime, timezone
+
+from main.hpa.dataset_prober import ProbeResult
+
+# pod-deletion-cost of the pods we remove, every other pod gets at least 1
+VICTIM_COST = 0
+# pods we know nothing about are removed last
+UNKNOWN_COST = 1_000_000_000
+
+
+def idle_s(last_time_access: str, now: float) -> float:
+    if not last_time_access:
+        return math.inf
+    try:
+        accessed = datetime.fromisoformat(last_time_access.replace("Z", "+00:00"))
+    except ValueError:
+        return math.inf
+    if accessed.tzinfo is None:
+        accessed = accessed.replace(tzinfo=timezone.utc)
+    return max(0.0, now - accessed.timestamp())
+
+
+class PodScore:
+
+    def __init__(self, name: str, cost: int, probe: ProbeResult, cpu_m: float):
+        self.name = name
+        self.cost = cost
+        self.probe = probe
+        self.cpu_m = cpu_m
+
+    @property
+    def empty(self) -> bool:
+        return self.probe.ok and self.probe.num_datasets == 0
+
+    def __repr__(self):
+        return f"PodScore({self.name}, cost={self.cost})"
+
+
+# What losing a pod costs: its datasets, worth up to twice as much when they were just accessed (the value halves
+# every access_half_life_s of idleness), plus the CPU it is using, i.e. the work that would move to the others.
+class VictimRanker:
+
+    def __init__(self, dataset_cost: float = 100, access_half_life_s: float = 600, cpu_cost: float = 1):
+        self.dataset_cost = dataset_cost
+        self.access_half_life_s = access_half_life_s
+        self.cpu_cost = cpu_cost
+
+    def cost(self, probe: ProbeResult, cpu_m: float, now: float) -> int:
+        if not probe.ok:
+            return UNKNOWN_COST
+        recency = 0.0
+        if self.access_half_life_s > 0:
+            recency = 2 ** (-idle_s(probe.last_time_access, now) / self.access_half_life_s)
+        cost = 1 + probe.num_datasets * self.dataset_cost * (1 + recency) + cpu_m * self.cpu_cost
+        return min(UNKNOWN_COST - 1, int(cost))
+
+    # Cheapest first; pods whose probe failed rank last at UNKNOWN_COST and are never selected as victims
+    def rank(self, name_ip_pairs: list[tuple[str, str]], probes: dict[str, ProbeResult],
+             pods_cpu_m: dict[str, float], now: float) -> list[PodScore]:
+        scores = [PodScore(name, self.cost(probes[ip], pods_cpu_m.get(name, 0), now), probes[ip],
+                           pods_cpu_m.get(name, 0))
+                  for name, ip in name_ip_pairs]
+        return sorted(scores, key=lambda s: s.cost)
+
+
+# In one step: every empty pod up to max_to_kill, or when no pod is empty the cheapest one. Proportional scaling
+# already knows how many pods it needs to remove and takes the max_to_kill cheapest.
+def select_victims(ranked: list[PodScore], max_to_kill: int, proportional: bool) -> list[PodScore]:
+    candidates = [s for s in ranked if s.probe.ok]
+    if proportional:
+        return candidates[:max_to_kill]
+    empty = [s for s in candidates if s.empty]
+    return empty[:max_to_kill] if empty else candidates[:min(1, max_to_kill)]
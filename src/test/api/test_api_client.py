@@ -0,0 +1,95 @@
+from kubernetes import client
+
+from main.api_groups.api_client import BudgetedApiClient, RateBudget, RetryPolicy
+
+
+class TestApiClient:
+
+    def test_reads_leave_tokens_for_writes(self):
+        now = [0.0]
+        budget = RateBudget(qps=1, burst=4, write_reserve=2, clock=lambda: now[0])
+
+        assert budget.try_acquire(write=False) == 0
+        assert budget.try_acquire(write=False) == 0
+        assert budget.try_acquire(write=False) > 0
+        assert budget.try_acquire(write=True) == 0
+        assert budget.try_acquire(write=True) == 0
+        assert budget.try_acquire(write=True) > 0
+
+        now[0] = 1.0
+        assert budget.try_acquire(write=True) == 0
+
+    def test_reads_wait_while_a_write_is_queued(self):
+        budget = RateBudget(qps=1, burst=10, write_reserve=0, clock=lambda: 0.0)
+        budget.writers_waiting = 1
+
+        assert budget.try_acquire(write=False) > 0
+        assert budget.try_acquire(write=True) == 0
+
+    def test_reads_proceed_with_a_burst_of_one(self):
+        now = [0.0]
+        budget = RateBudget(qps=5, burst=1, clock=lambda: now[0])
+
+        assert budget.try_acquire(write=False) == 0
+        assert budget.try_acquire(write=False) > 0
+        now[0] = 0.2
+        assert budget.try_acquire(write=False) == 0
+
+    def test_retry_delay_honours_retry_after(self):
+        policy = RetryPolicy(max_retries=3, base_delay_s=0.1, max_delay_s=5)
+
+        assert 0 <= policy.delay_s(0) <= 0.1
+        assert 0 <= policy.delay_s(10) <= 5
+        assert policy.delay_s(0, "2") >= 2
+
+    def test_retries_throttled_requests(self):
+        rest = RestClientStub([429, 503, 200])
+        delays = []
+        api = BudgetedApiClient(client.Configuration(), RateBudget(100, 10), RetryPolicy(4), (1, 10), delays.append)
+        api.rest_client = rest
+
+        response = api.call_api("PATCH", "https://k8s/apis/apps/v1/namespaces/ns/deployments/web/scale")
+
+        assert response.status == 200
+        assert len(delays) == 2
+        assert delays[0] >= 1  # Retry-After of the 429
+        assert rest.timeouts == [(1, 10)] * 3
+
+    def test_gives_up_after_max_retries(self):
+        rest = RestClientStub([500, 500, 500])
+        api = BudgetedApiClient(client.Configuration(), None, RetryPolicy(1), (1, 10), lambda s: None)
+        api.rest_client = rest
+
+        assert api.call_api("GET", "https://k8s/api/v1/namespaces/ns/pods").status == 500
+        assert len(rest.timeouts) == 2
+
+    def test_watch_is_not_retried_nor_timed_out(self):
+        rest = RestClientStub([503])
+        api = BudgetedApiClient(client.Configuration(), RateBudget(100, 10), RetryPolicy(4), (1, 10), lambda s: None)
+        api.rest_client = rest
+
+        assert api.call_api("GET", "https://k8s/api/v1/namespaces/ns/pods?watch=true").status == 503
+        assert rest.timeouts == [None]
+
+
+class ResponseStub:
+
+    def __init__(self, status):
+        self.status = status
+
+    def getheader(self, name, default=None):
+        return "1" if name == "Retry-After" and self.status == 429 else default
+
+    def read(self):
+        return b""
+
+
+class RestClientStub:
+
+    def __init__(self, statuses):
+        self.statuses = list(statuses)
+        self.timeouts = []
+
+    def request(self, method, url, headers=None, body=None, post_params=None, _request_timeout=None):
+        self.timeouts.append(_request_timeout)
+        return ResponseStub(self.statuses.pop(0))
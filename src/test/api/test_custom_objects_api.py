@@ -0,0 +1,52 @@
+from main.api_groups import custom_objects_api
+from main.hpa.hpa_main import ClusterActions
+
+
+class TestCustomObjectsApi:
+
+    def test_get_pods_usages(self):
+        client_stub = CustomObjectsApiClientStub([
+            pod_metrics("pod_a", {"web": "1000000n", "sidecar": "5n"}),
+            pod_metrics("pod_b", {"web": "2000000n"}),
+        ])
+        usages = custom_objects_api.get_pods_usages(client_stub, "my_namespace", "app=my_app,role=web")
+
+        assert usages["pod_a"]["web"] == {"cpu": "1000000n"}
+        assert usages["pod_b"]["web"] == {"cpu": "2000000n"}
+        assert client_stub.calls == [("my_namespace", "app=my_app,role=web")]
+
+    def test_total_cpu_usage_lists_metrics_once(self):
+        pods = [(f"pod_{i}", f"ip_{i}") for i in range(50)]
+        client_stub = CustomObjectsApiClientStub([pod_metrics(name, {"web": "2000000n"}) for name, _ in pods])
+        cluster_actions = ClusterActions(None, client_stub, None, "my_namespace")
+
+        total_cpu_m = cluster_actions.get_total_cpu_usage(pods)
+
+        assert total_cpu_m == 100
+        assert len(client_stub.calls) == 1
+
+    def test_missing_pod_metrics_count_as_zero(self):
+        client_stub = CustomObjectsApiClientStub([pod_metrics("pod_a", {"web": "3000000n"})])
+        cluster_actions = ClusterActions(None, client_stub, None, "my_namespace")
+
+        assert cluster_actions.get_total_cpu_usage([("pod_a", "ip_a"), ("pod_b", "ip_b")]) == 3
+
+
+class CustomObjectsApiClientStub:
+
+    def __init__(self, items: list[dict]):
+        self.items = items
+        self.calls = []
+
+    def list_namespaced_custom_object(self, group, version, namespace, plural, label_selector=None, **kwargs):
+        self.calls.append((namespace, label_selector))
+        return {"items": self.items}
+
+
+def pod_metrics(name, containers_cpu: dict[str, str], labels=None):
+    if labels is None:
+        labels = {"app": "my_app", "role": "web"}
+    return {
+        "metadata": {"name": name, "labels": labels},
+        "containers": [{"name": c, "usage": {"cpu": cpu}} for c, cpu in containers_cpu.items()]
+    }
@@ -0,0 +1,61 @@
+from kubernetes.client import V1ObjectMeta, V1Scale, V1ScaleSpec
+from kubernetes.client.rest import ApiException
+
+from main.api_groups import deployment_api, service_api
+
+
+class TestDeploymentApi:
+
+    def test_set_replicas_with_resource_version_precondition(self):
+        apps_stub = AppsApiClientStub()
+
+        rv = deployment_api.set_deployment_replicas(apps_stub, "web", "my_namespace", 4, resource_version="10")
+
+        assert apps_stub.patches == [[
+            {'op': 'test', 'path': '/metadata/resourceVersion', 'value': "10"},
+            {'op': 'replace', 'path': '/spec/replicas', 'value': 4}
+        ]]
+        assert rv == "11"
+
+    def test_set_replicas_without_precondition(self):
+        apps_stub = AppsApiClientStub()
+
+        deployment_api.set_deployment_replicas(apps_stub, "web", "my_namespace", 2)
+
+        assert apps_stub.patches == [[{'op': 'replace', 'path': '/spec/replicas', 'value': 2}]]
+
+    def test_missing_deployment(self):
+        apps_stub = AppsApiClientStub()
+
+        assert deployment_api.get_deployment_by_name(apps_stub, "other", "my_namespace") == []
+        assert deployment_api.get_deployment_replicas(apps_stub, "other", "my_namespace") == 0
+
+    def test_service_read_by_name(self):
+        core_stub = CoreApiClientStub()
+
+        assert service_api.get_service_ip_by_name(core_stub, "web", "my_namespace") is None
+        assert core_stub.reads == [("web", "my_namespace")]
+
+
+class AppsApiClientStub:
+
+    def __init__(self):
+        self.patches = []
+
+    def read_namespaced_deployment(self, name, namespace, **kwargs):
+        raise ApiException(status=404, reason="Not Found")
+
+    def patch_namespaced_deployment_scale(self, name, namespace, body, **kwargs):
+        self.patches.append(body)
+        return V1Scale(metadata=V1ObjectMeta(name=name, resource_version="11"),
+                       spec=V1ScaleSpec(replicas=body[-1]["value"]))
+
+
+class CoreApiClientStub:
+
+    def __init__(self):
+        self.reads = []
+
+    def read_namespaced_service(self, name, namespace, **kwargs):
+        self.reads.append((name, namespace))
+        raise ApiException(status=404, reason="Not Found")
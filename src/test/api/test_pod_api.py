@@ -1,4 +1,6 @@
-from kubernetes.client import V1ObjectMeta, V1Pod, V1PodList, V1PodStatus, V1PodCondition, V1ContainerStatus
+from kubernetes.client import V1ObjectMeta, V1Pod, V1PodList, V1PodStatus, V1PodCondition, V1ContainerStatus, \
+    V1ListMeta
+from kubernetes.client.rest import ApiException
 
 from main.api_groups import pod_api
 from main.api_groups.pod_api import PodMonitor
@@ -51,6 +53,78 @@ class TestPodApi:
         res = pod_api.get_ready_pods(client_stub, "my_app", "web", namespace, container_name="web")
         assert len(res) == 2
 
+    def test_get_ready_pods_namespaced(self):
+        namespace = "my_namespace"
+        labels = {"app": "my_app", "role": "web"}
+        containers_readiness = {"web": True, "other": False}
+        pods: list[V1Pod] = [
+            pod(namespace=namespace, labels=labels, containers_readiness=containers_readiness),
+            pod(namespace=namespace, labels=labels, containers_readiness=containers_readiness),
+            pod(namespace=namespace, labels=labels, containers_readiness={"web": False, "other": True}),
+            pod(namespace=namespace, labels=labels, containers_readiness=containers_readiness, phase="Pending"),
+            pod(namespace=namespace, labels={"app": "my_app", "role": "worker"}, containers_readiness=containers_readiness),
+            pod(namespace="other", labels=labels, containers_readiness=containers_readiness),
+        ]
+        client_stub = CoreApiClientStub(pods)
+        counter = pod_api.DecodeCounter()
+
+        res = pod_api.get_ready_pods_namespaced(client_stub, "my_app", "web", namespace, "web", counter)
+
+        assert len(res) == 2
+        assert counter.list_calls == 1
+        assert counter.pods_decoded == 3
+
+    def test_pod_monitor_follows_readiness(self):
+        changes = []
+        events = []
+        monitor = PodMonitor("my_app", "web", "my_namespace", WatchApiStub([watched_pod("a", "ip_a", "1")], "5"),
+                             on_change=changes.append, on_pod_event=lambda t, p: events.append((t, p.metadata.uid)))
+        monitor.watcher = WatchStub([[
+            {"type": "ADDED", "object": watched_pod("b", "ip_b", "6")},
+            {"type": "MODIFIED", "object": watched_pod("a", "ip_a", "7", ready=False)},
+            {"type": "BOOKMARK", "raw_object": {"metadata": {"resourceVersion": "9"}}},
+        ]])
+        monitor.watch_once()
+        before = monitor.snapshot
+        monitor.watcher = WatchStub([[{"type": "DELETED", "object": watched_pod("b", "ip_b", "10")}]])
+        monitor.watch_once()
+
+        assert before.ip_addrs == {"ip_b"}
+        assert [p.metadata.name for p in before.ready_pods("web")] == ["b"]
+        assert monitor.ip_addrs == frozenset()
+        assert changes == ["pod a ready", "pod b ready", "pod a not ready", "pod b deleted"]
+        assert events == [("ADDED", "a"), ("ADDED", "b"), ("MODIFIED", "a"), ("DELETED", "b")]
+        assert monitor.client.list_calls == 1
+        # the second watch resumed from the bookmark
+        assert monitor.watcher.resource_versions == ["9"]
+        assert monitor.resource_version == "10"
+
+    def test_pod_monitor_lists_again_on_gone(self):
+        events = []
+        api = WatchApiStub([watched_pod("a", "ip_a", "1"), watched_pod("b", "ip_b", "2")], "5")
+        monitor = PodMonitor("my_app", "web", "my_namespace", api,
+                             on_pod_event=lambda t, p: events.append((t, p.metadata.uid)))
+        monitor.watcher = WatchStub([ApiException(status=410)])
+        monitor.watch_once()
+        api.pods = [watched_pod("b", "ip_b", "8"), watched_pod("c", "ip_c", "9")]
+        monitor.watcher = WatchStub([[]])
+        monitor.watch_once()
+
+        assert api.list_calls == 2
+        assert events[2:] == [("DELETED", "a"), ("MODIFIED", "b"), ("ADDED", "c")]
+        assert monitor.ip_addrs == {"ip_b", "ip_c"}
+        assert monitor.ready_pods("web") is not None
+
+    def test_pod_monitor_not_synced_after_failure(self):
+        monitor = PodMonitor("my_app", "web", "my_namespace", WatchApiStub([watched_pod("a", "ip_a", "1")], "5"))
+        monitor.stop_event.set()  # no retry delay
+        monitor.watcher = WatchStub([ConnectionError("reset")])
+        monitor.watch_once()
+
+        assert monitor.ready_pods("web") is None
+        assert monitor.resource_version is None
+
+
 class CoreApiClientStub:
 
     def __init__(self, pl: list[V1Pod]):
@@ -59,8 +133,19 @@ class CoreApiClientStub:
     def list_pod_for_all_namespaces(self, **kwargs):
         return V1PodList(items=self.pod_list)
 
+    def list_namespaced_pod(self, namespace, label_selector=None, field_selector=None, **kwargs):
+        selected = [p for p in self.pod_list if p.metadata.namespace == namespace]
+        for term in (label_selector or "").split(","):
+            if term:
+                k, v = term.split("=")
+                selected = [p for p in selected if p.metadata.labels.get(k) == v]
+        if field_selector == "status.phase=Running":
+            selected = [p for p in selected if p.status.phase == "Running"]
+        return V1PodList(items=selected)
 
-def pod(namespace="default", labels=None, ready_status: bool=True, containers_readiness: dict[str,bool]={}):
+
+def pod(namespace="default", labels=None, ready_status: bool=True, containers_readiness: dict[str,bool]={},
+        phase="Running"):
     if labels is None:
         labels = {}
     p = V1Pod()
@@ -74,6 +159,44 @@ def pod(namespace="default", labels=None, ready_status: bool=True, containers_re
     for c in containers_readiness.keys():
         css.append(V1ContainerStatus(name=c, restart_count=0, ready=containers_readiness[c], image="registro-local:5000/jetty-ex:latest", image_id="feature01"))
 
-    p.status = V1PodStatus(conditions=[pod_condition], container_statuses=css)
+    p.status = V1PodStatus(conditions=[pod_condition], container_statuses=css, phase=phase)
 
     return p
+
+
+class WatchApiStub:
+
+    def __init__(self, pods: list[V1Pod], resource_version: str):
+        self.pods = pods
+        self.resource_version = resource_version
+        self.list_calls = 0
+
+    def list_namespaced_pod(self, namespace, label_selector=None, **kwargs):
+        self.list_calls += 1
+        return V1PodList(metadata=V1ListMeta(resource_version=self.resource_version), items=list(self.pods))
+
+
+class WatchStub:
+
+    def __init__(self, streams: list):
+        self.streams = streams
+        self.resource_versions = []
+
+    def stream(self, func, *args, resource_version=None, **kwargs):
+        self.resource_versions.append(resource_version)
+        events = self.streams.pop(0)
+        if isinstance(events, Exception):
+            raise events
+        yield from events
+
+    def stop(self):
+        pass
+
+
+def watched_pod(uid, ip, resource_version, ready=True) -> V1Pod:
+    return V1Pod(metadata=V1ObjectMeta(name=uid, uid=uid, namespace="my_namespace", resource_version=resource_version,
+                                       labels={"app": "my_app", "role": "web"}),
+                 status=V1PodStatus(phase="Running", pod_ip=ip,
+                                    conditions=[V1PodCondition(type="Ready", status=str(ready))],
+                                    container_statuses=[V1ContainerStatus(name="web", ready=ready, restart_count=0,
+                                                                          image="web", image_id="web")]))
@@ -0,0 +1,31 @@
+from benchmarks import bench_hpa
+
+
+class TestBenchHpa:
+
+    def test_run_records_api_volume(self):
+        results = bench_hpa.run([10, 20], ["get_ready_pods", "get_ready_pods_namespaced", "get_pods_usages"],
+                                noise_factor=2, repeat=1)
+        by_case = {(r["case"], r["pods"]): r for r in results["results"]}
+
+        assert by_case[("get_ready_pods", 10)]["objects_decoded"] == 30
+        assert by_case[("get_ready_pods_namespaced", 10)]["objects_decoded"] == 10
+        assert by_case[("get_pods_usages", 20)]["api_calls"] == 1
+        assert all(r["wall_s"] > 0 and r["peak_memory_kib"] > 0 for r in results["results"])
+
+    def test_scale_replicas_cycle_api_calls(self):
+        result = bench_hpa.measure("scale_replicas", 10, noise_factor=0, repeat=1)
+
+        # pods, metrics, deployment and the scale patch
+        assert result["api_calls"] == 4
+
+    def test_compare_detects_regressions(self):
+        baseline = {"results": [{"case": "scale_replicas", "pods": 10, "wall_s": 0.010, "api_calls": 4,
+                                 "objects_decoded": 22}]}
+        slower = {"results": [{"case": "scale_replicas", "pods": 10, "wall_s": 0.020, "api_calls": 5,
+                               "objects_decoded": 22}]}
+        similar = {"results": [{"case": "scale_replicas", "pods": 10, "wall_s": 0.011, "api_calls": 4,
+                                "objects_decoded": 22}]}
+
+        assert len(bench_hpa.compare(baseline, slower, tolerance=0.25)) == 2
+        assert bench_hpa.compare(baseline, similar, tolerance=0.25) == []
@@ -0,0 +1,132 @@
+import threading
+import time
+
+import pytest
+from kubernetes.client import V1Container, V1Deployment, V1DeploymentSpec, V1LabelSelector, V1ObjectMeta, \
+    V1PodSpec, V1PodTemplateSpec, V1ResourceRequirements
+
+from main.hpa.async_engine import AsyncEngine
+from main.hpa.dataset_prober import ProbeOutcome, ProbeResult
+from main.hpa.hpa_main import ClusterActions, ClusterSnapshot, HpaConfig, ScalerAction, scale_replicas, \
+    scale_replicas_async
+
+ENV = {"MIN_REPLICAS": "2", "MAX_REPLICAS": "6", "UPPER_CPU_THRESHOLD": "0.7", "LOWER_CPU_THRESHOLD": "0.4",
+       "LOOP_TIME_S": "90", "NO_SCALE_DOWN_PERIOD": "300"}
+DELAY_S = 0.05
+
+
+class TestAsyncEngine:
+
+    @classmethod
+    def setup_class(cls):
+        cls.engine = AsyncEngine(8)
+
+    @classmethod
+    def teardown_class(cls):
+        cls.engine.stop()
+
+    @pytest.mark.parametrize("cpu_m, datasets, mode", [
+        (90, {}, "step"),
+        (55, {}, "step"),
+        (10, {"ip-0": 3, "ip-1": 0, "ip-2": 1, "ip-3": 0}, "step"),
+        (10, {"ip-0": 3, "ip-1": 2, "ip-2": 1, "ip-3": 5}, "step"),
+        (10, {"ip-0": 3, "ip-1": 2, "ip-3": 5}, "proportional"),
+        (200, {}, "proportional"),
+    ])
+    def test_same_decision_as_sync(self, cpu_m, datasets, mode):
+        hpa_config = HpaConfig({**ENV, "SCALING_MODE": mode})
+        sync_cluster = FakeClusterActions(4, cpu_m)
+        async_cluster = FakeClusterActions(4, cpu_m)
+
+        sync_action = scale_replicas(sync_cluster, hpa_config, AppInfoStub(datasets), 0, now=1000)
+        async_action = self.engine.run(scale_replicas_async(self.engine, async_cluster, hpa_config,
+                                                            AppInfoStub(datasets), 0, now=1000))
+
+        assert async_action == sync_action
+        assert async_cluster.replicas_set == sync_cluster.replicas_set
+        assert async_cluster.deletion_costs == sync_cluster.deletion_costs
+        assert vars(async_cluster.last_snapshot) == vars(sync_cluster.last_snapshot)
+
+    def test_reads_run_concurrently(self):
+        cluster_actions = FakeClusterActions(4, 55, delay_s=DELAY_S)
+
+        start = time.perf_counter()
+        snapshot, probes = self.engine.run(self.engine.get_snapshot(cluster_actions))
+
+        # one after another the reads take 4 * DELAY_S
+        assert time.perf_counter() - start < 3 * DELAY_S
+        assert snapshot.num_replicas_ready == 4 and snapshot.requested_cpu_m == 100
+        assert probes is None
+
+    def test_probes_start_with_the_pod_list(self):
+        cluster_actions = FakeClusterActions(4, 10, delay_s=DELAY_S)
+        cluster_actions.last_snapshot = ClusterSnapshot([("pod-0", "ip-0")], 10, 4, 100)
+        app_info = AppInfoStub({"ip-0": 1, "ip-1": 0, "ip-2": 1, "ip-3": 1})
+
+        action = self.engine.run(scale_replicas_async(self.engine, cluster_actions, HpaConfig(ENV), app_info, 0))
+
+        assert action == ScalerAction.SCALE_DOWN
+        assert cluster_actions.deletion_costs["pod-1"] == 0
+        # probed while the deployment was still being read
+        assert app_info.probed_at < cluster_actions.deployment_read_at
+        assert app_info.calls == 1
+
+    def test_kubelet_usage_waits_for_the_pods(self):
+        cluster_actions = FakeClusterActions(4, 55, delay_s=DELAY_S)
+        cluster_actions.kubelet_usage = object()
+
+        self.engine.run(self.engine.get_snapshot(cluster_actions))
+
+        assert cluster_actions.usages_read_at >= cluster_actions.pods_read_at
+
+
+class FakeClusterActions(ClusterActions):
+
+    def __init__(self, num_pods, cpu_m, delay_s=0.0):
+        super().__init__(None, None, None, "my_namespace")
+        self.pods = [(f"pod-{i}", f"ip-{i}") for i in range(num_pods)]
+        self.cpu_m = cpu_m
+        self.delay_s = delay_s
+        self.replicas_set = None
+        self.pods_read_at = self.usages_read_at = self.deployment_read_at = None
+
+    def get_name_ip_pairs(self) -> list[tuple[str, str]]:
+        time.sleep(self.delay_s)
+        self.pods_read_at = time.perf_counter()
+        return self.pods
+
+    def get_pods_usages(self) -> dict[str, dict[str, dict]]:
+        time.sleep(self.delay_s)
+        self.usages_read_at = time.perf_counter()
+        return {name: {"web": {"cpu": f"{(self.cpu_m + i) * 1000000}n"}} for i, (name, _) in enumerate(self.pods)}
+
+    def read_deployment(self):
+        time.sleep(self.delay_s * 2)
+        self.deployment_read_at = time.perf_counter()
+        container = V1Container(name="web", resources=V1ResourceRequirements(requests={"cpu": "100m"}))
+        return V1Deployment(metadata=V1ObjectMeta(name="web", resource_version="1"),
+                            spec=V1DeploymentSpec(replicas=len(self.pods), selector=V1LabelSelector(),
+                                                  template=V1PodTemplateSpec(spec=V1PodSpec(containers=[container]))))
+
+    def set_deployment_replicas(self, target_replicas, resource_version: str = None):
+        self.replicas_set = target_replicas
+        return str(int(resource_version) + 1)
+
+    def annotate_pod_deletion_cost(self, name: str, cost: int) -> None:
+        self.deletion_costs[name] = cost
+
+
+class AppInfoStub:
+
+    def __init__(self, pod_ip_datasets: dict[str, int]):
+        self.pod_ip_datasets = pod_ip_datasets
+        self.calls = 0
+        self.probed_at = None
+        self.lock = threading.Lock()
+
+    def get_pods_num_datasets(self, pod_ips: list[str]) -> dict[str, ProbeResult]:
+        with self.lock:
+            self.calls += 1
+            self.probed_at = time.perf_counter()
+        return {ip: ProbeResult(ProbeOutcome.OK, self.pod_ip_datasets[ip]) if ip in self.pod_ip_datasets
+                else ProbeResult(ProbeOutcome.CONNECTION_ERROR) for ip in pod_ips}
@@ -0,0 +1,66 @@
+import pytest
+
+from main.hpa.behavior import POLICY_PERCENT, POLICY_PODS, SELECT_DISABLED, SELECT_MIN, ScalingBehavior, \
+    ScalingPolicy, ScalingRules, WindowExtreme, parse_scaling_policies
+
+
+class TestBehavior:
+
+    def test_window_extreme(self):
+        window = WindowExtreme(60, maximum=True)
+        for t, value in [(0, 5), (10, 3), (20, 4), (30, 2)]:
+            window.add(t, value)
+
+        assert window.value(30) == 5
+        assert window.value(65) == 4
+        # only the values that can still become the maximum are kept
+        assert [v for _, v in window.entries] == [4, 2]
+        assert window.value(200) is None
+
+    def test_scale_down_stabilization(self):
+        behavior = ScalingBehavior(ScalingRules(), ScalingRules(stabilization_s=300))
+
+        assert behavior.apply(0, 6, 6) == 6
+        assert behavior.apply(100, 6, 3) == 6
+        assert behavior.apply(200, 6, 4) == 6
+        assert behavior.apply(301, 6, 3) == 4
+        assert behavior.apply(302, 6, 8) == 8
+
+    def test_scale_up_stabilization(self):
+        behavior = ScalingBehavior(ScalingRules(stabilization_s=60), ScalingRules())
+
+        assert behavior.apply(0, 4, 4) == 4
+        assert behavior.apply(30, 4, 8) == 4
+        assert behavior.apply(61, 4, 8) == 8
+
+    def test_pods_per_period(self):
+        behavior = ScalingBehavior(ScalingRules(policies=[ScalingPolicy(POLICY_PODS, 2, 60)]), ScalingRules())
+
+        assert behavior.apply(0, 4, 10) == 6
+        behavior.record_scale(0, 4, 6)
+        assert behavior.apply(30, 6, 10) == 6
+        assert behavior.apply(61, 6, 10) == 8
+
+    def test_select_policy(self):
+        policies = [ScalingPolicy(POLICY_PODS, 4, 60), ScalingPolicy(POLICY_PERCENT, 100, 60)]
+
+        assert ScalingBehavior(ScalingRules(policies=policies), ScalingRules()).apply(0, 2, 20) == 6
+        assert ScalingBehavior(ScalingRules(policies=policies, select=SELECT_MIN), ScalingRules()).apply(0, 2, 20) == 4
+        assert ScalingBehavior(ScalingRules(select=SELECT_DISABLED), ScalingRules()).apply(0, 2, 20) == 2
+
+    def test_percent_scale_down(self):
+        behavior = ScalingBehavior(ScalingRules(), ScalingRules(policies=[ScalingPolicy(POLICY_PERCENT, 50, 60)]))
+
+        assert behavior.apply(0, 8, 2) == 4
+        behavior.record_scale(0, 8, 4)
+        # still 50% of the 8 replicas at the start of the period
+        assert behavior.apply(30, 4, 2) == 4
+        assert behavior.apply(61, 4, 1) == 2
+
+    def test_parse_scaling_policies(self):
+        policies = parse_scaling_policies('[{"type": "Percent", "value": 10, "periodSeconds": 60}]')
+
+        assert (policies[0].type, policies[0].value, policies[0].period_s) == (POLICY_PERCENT, 10, 60)
+        assert parse_scaling_policies("") == []
+        with pytest.raises(ValueError):
+            parse_scaling_policies('[{"type": "Replicas", "value": 10, "periodSeconds": 60}]')
@@ -0,0 +1,45 @@
+import pytest
+
+from main.hpa.cpu_history import CpuHistory, RingBuffer
+
+
+class TestCpuHistory:
+
+    def test_ring_buffer_keeps_last_values(self):
+        buffer = RingBuffer(3)
+        for v in [1, 2, 3, 4, 5]:
+            buffer.append(v)
+
+        assert buffer.values() == [3, 4, 5]
+        assert buffer.last() == 5
+        assert buffer.max() == 5
+        assert len(buffer) == 3
+
+    def test_aggregations(self):
+        samples = [100, 300, 100]
+        expected = {"instant": 100, "max": 300, "percentile": 300, "ewma": 150}
+        for aggregation, value in expected.items():
+            history = CpuHistory(aggregation, window=3, ewma_alpha=0.5, percentile=90)
+            for v in samples:
+                history.record({"pod_a": v})
+            assert history.total_cpu_m() == value, aggregation
+
+    def test_spike_is_smoothed(self):
+        history = CpuHistory("ewma", window=5, ewma_alpha=0.25)
+        for v in [50, 50, 50, 250]:
+            history.record({"pod_a": v, "pod_b": 50})
+
+        assert history.total_cpu_m() == 150
+        assert history.pods_cpu_m() == {"pod_a": 100, "pod_b": 50}
+
+    def test_gone_pods_are_evicted(self):
+        history = CpuHistory("max", window=5)
+        history.record({"pod_a": 100, "pod_b": 50})
+        history.record({"pod_b": 70})
+
+        assert set(history.buffers) == {"pod_b"}
+        assert history.total_cpu_m() == 70
+
+    def test_unknown_aggregation(self):
+        with pytest.raises(ValueError):
+            CpuHistory("median", window=5)
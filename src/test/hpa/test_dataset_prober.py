@@ -0,0 +1,66 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from main.hpa.dataset_prober import DatasetProber, ProbeOutcome
+
+
+class TestDatasetProber:
+
+    def test_probe_all_outcomes(self):
+        server = start_server({
+            "/ok/admin/datasets-info": (200, json.dumps({"numDataSets": 3, "lastTimeAccess": "2023-07-16T10:00:00"}), 0),
+            "/bad/admin/datasets-info": (200, "not json", 0),
+            "/error/admin/datasets-info": (500, "", 0),
+            "/hung/admin/datasets-info": (200, json.dumps({"numDataSets": 0}), 2),
+        })
+        port = server.server_address[1]
+        try:
+            probers = {name: DatasetProber(port=port, path=f"/{name}/admin/datasets-info", request_timeout_s=0.5,
+                                           deadline_s=1) for name in ["ok", "bad", "error", "hung"]}
+
+            assert probers["ok"].probe("127.0.0.1").num_datasets == 3
+            assert probers["ok"].probe("127.0.0.1").last_time_access == "2023-07-16T10:00:00"
+            assert probers["bad"].probe("127.0.0.1").outcome == ProbeOutcome.BAD_RESPONSE
+            assert probers["error"].probe("127.0.0.1").outcome == ProbeOutcome.HTTP_ERROR
+            assert probers["hung"].probe("127.0.0.1").outcome == ProbeOutcome.TIMEOUT
+        finally:
+            server.shutdown()
+
+    def test_probe_all_is_concurrent_and_bounded_by_deadline(self):
+        server = start_server({"/admin/datasets-info": (200, json.dumps({"numDataSets": 1}), 0.3)})
+        port = server.server_address[1]
+        try:
+            prober = DatasetProber(port=port, request_timeout_s=2, deadline_s=1, max_workers=8)
+            start = time.monotonic()
+            results = prober.probe_all(["127.0.0.1", "localhost"])
+            elapsed = time.monotonic() - start
+
+            assert all(r.ok for r in results.values())
+            assert elapsed < 0.6
+
+            prober = DatasetProber(port=port, request_timeout_s=2, deadline_s=0.1)
+            results = prober.probe_all(["127.0.0.1"])
+            assert results["127.0.0.1"].outcome == ProbeOutcome.DEADLINE_EXCEEDED
+        finally:
+            server.shutdown()
+
+
+def start_server(routes: dict[str, tuple[int, str, float]]) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            status, body, delay = routes.get(self.path, (404, "", 0))
+            time.sleep(delay)
+            self.send_response(status)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body.encode())
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
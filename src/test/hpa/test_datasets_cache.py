@@ -0,0 +1,108 @@
+from kubernetes.client import V1ContainerStatus, V1ObjectMeta, V1Pod, V1PodStatus
+
+from main.hpa.dataset_prober import ProbeOutcome, ProbeResult
+from main.hpa.datasets_cache import DatasetsCache
+from main.hpa.hpa_main import CustomAppInfo
+
+
+class TestDatasetsCache:
+
+    def test_only_stale_pods_are_probed_and_304_refreshes(self):
+        now = [0.0]
+        cache = DatasetsCache(ttl_s=30, clock=lambda: now[0])
+        prober = ProberStub({"ip1": 2, "ip2": 0})
+        app_info = CustomAppInfo(prober, cache)
+
+        assert app_info.get_pods_num_datasets(["ip1", "ip2"])["ip1"].num_datasets == 2
+        assert app_info.get_pods_num_datasets(["ip1", "ip2"])["ip2"].num_datasets == 0
+        assert prober.calls == [{"ip1": None, "ip2": None}]
+
+        now[0] = 31
+        prober.not_modified = {"ip1"}
+        results = app_info.get_pods_num_datasets(["ip1", "ip2"])
+
+        assert prober.calls[-1] == {"ip1": "etag-ip1", "ip2": "etag-ip2"}
+        assert results["ip1"].num_datasets == 2
+        assert cache.stats()["revalidated"] == 1
+        assert cache.hits == 2 and cache.misses == 4
+
+    def test_304_after_eviction_probes_again(self):
+        now = [0.0]
+        cache = DatasetsCache(ttl_s=30, clock=lambda: now[0])
+        prober = ProberStub({"ip1": 2})
+        app_info = CustomAppInfo(prober, cache)
+        app_info.get_pods_num_datasets(["ip1"])
+
+        now[0] = 31
+        prober.not_modified = {"ip1"}
+        # the pod restarts while its conditional probe is in flight
+        prober.on_probe = lambda: cache.invalidate(ip="ip1")
+        results = app_info.get_pods_num_datasets(["ip1"])
+
+        assert prober.calls[1:] == [{"ip1": "etag-ip1"}, {}]
+        assert results["ip1"].ok and results["ip1"].num_datasets == 2
+
+    def test_failures_are_not_cached(self):
+        cache = DatasetsCache(ttl_s=30, clock=lambda: 0.0)
+        prober = ProberStub({})
+        app_info = CustomAppInfo(prober, cache)
+
+        assert not app_info.get_pods_num_datasets(["ip1"])["ip1"].ok
+        app_info.get_pods_num_datasets(["ip1"])
+        assert len(prober.calls) == 2
+
+    def test_pod_events_invalidate(self):
+        cache = DatasetsCache(ttl_s=30, clock=lambda: 0.0)
+        cache.observe_pod("ADDED", pod("uid-a", "ip1", 0))
+        cache.update("ip1", ProbeResult(ProbeOutcome.OK, 3))
+        assert cache.lookup("ip1")[0].num_datasets == 3
+
+        cache.observe_pod("MODIFIED", pod("uid-a", "ip1", 1))  # restarted
+        assert cache.lookup("ip1") == (None, None)
+
+        cache.update("ip1", ProbeResult(ProbeOutcome.OK, 3))
+        cache.observe_pod("DELETED", pod("uid-a", "ip1", 1))
+        cache.observe_pod("ADDED", pod("uid-b", "ip1", 0))  # new pod on the same ip
+        assert cache.lookup("ip1") == (None, None)
+        assert cache.invalidations == 2
+
+    def test_bounded_size_drops_least_recently_used(self):
+        cache = DatasetsCache(ttl_s=30, max_size=2, clock=lambda: 0.0)
+        cache.update("ip1", ProbeResult(ProbeOutcome.OK, 1))
+        cache.update("ip2", ProbeResult(ProbeOutcome.OK, 2))
+        cache.lookup("ip1")
+        cache.update("ip3", ProbeResult(ProbeOutcome.OK, 3))
+
+        assert cache.lookup("ip2")[0] is None
+        assert cache.lookup("ip1")[0].num_datasets == 1
+
+
+def pod(uid, ip, restarts) -> V1Pod:
+    return V1Pod(metadata=V1ObjectMeta(name=uid, uid=uid),
+                 status=V1PodStatus(pod_ip=ip, container_statuses=[
+                     V1ContainerStatus(name="web", ready=True, restart_count=restarts, image="web", image_id="web")]))
+
+
+class ProberStub:
+
+    def __init__(self, datasets: dict[str, int]):
+        self.datasets = datasets
+        self.not_modified = set()
+        self.on_probe = None
+        self.calls = []
+
+    def probe_all(self, pod_ips, etags=None):
+        etags = etags or {}
+        self.calls.append(dict(etags))
+        if self.on_probe is not None:
+            self.on_probe()
+            self.on_probe = None
+        results = {}
+        for ip in pod_ips:
+            if ip in self.not_modified and etags.get(ip):
+                results[ip] = ProbeResult(ProbeOutcome.NOT_MODIFIED, etag=f"etag-{ip}")
+            elif ip in self.datasets:
+                results[ip] = ProbeResult(ProbeOutcome.OK, self.datasets[ip], etag=f"etag-{ip}")
+            else:
+                results[ip] = ProbeResult(ProbeOutcome.CONNECTION_ERROR)
+        return results
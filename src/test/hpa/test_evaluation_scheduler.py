@@ -0,0 +1,63 @@
+import threading
+import time
+
+from main.hpa.evaluation_scheduler import EvaluationScheduler
+from main.hpa.leader_election import LEADERSHIP_ACQUIRED, LeaderElector
+
+
+class TestEvaluationScheduler:
+    lower_cpu_thr = 0.4
+    upper_cpu_thr = 0.7
+
+    def test_interval_adapts_to_load(self):
+        scheduler = EvaluationScheduler(min_interval_s=10, max_interval_s=300, base_interval_s=90)
+
+        assert scheduler.next_interval(False, 0.68, self.lower_cpu_thr, self.upper_cpu_thr) == 10
+        assert scheduler.next_interval(False, 0.55, self.lower_cpu_thr, self.upper_cpu_thr) == 20
+        assert scheduler.next_interval(False, 0.55, self.lower_cpu_thr, self.upper_cpu_thr) == 40
+        for _ in range(10):
+            scheduler.next_interval(False, 0.55, self.lower_cpu_thr, self.upper_cpu_thr)
+        assert scheduler.interval_s == 300
+        assert scheduler.next_interval(True, 0.9, self.lower_cpu_thr, self.upper_cpu_thr) == 90
+
+    def test_event_wakes_up_before_the_interval(self):
+        scheduler = EvaluationScheduler(min_interval_s=0.05, max_interval_s=60, base_interval_s=60)
+        scheduler.mark_evaluation()
+        threading.Timer(0.1, scheduler.notify, args=["pod web-1 ready"]).start()
+
+        start = time.monotonic()
+        reason = scheduler.wait(60)
+
+        assert reason == "pod web-1 ready"
+        assert time.monotonic() - start < 5
+        assert scheduler.wakeups == 1
+
+    def test_events_are_debounced_to_min_interval(self):
+        scheduler = EvaluationScheduler(min_interval_s=0.3, max_interval_s=60, base_interval_s=60)
+        scheduler.mark_evaluation()
+        scheduler.notify("pod web-1 ready")
+
+        start = time.monotonic()
+        scheduler.wait(60)
+
+        assert time.monotonic() - start >= 0.25
+
+    def test_failover_is_not_debounced(self):
+        # MIN_LOOP_TIME_S and MAX_LOOP_TIME_S default to LOOP_TIME_S
+        scheduler = EvaluationScheduler(min_interval_s=90, max_interval_s=90, base_interval_s=90)
+        elector = LeaderElector(None, "hpa", "ns", "b",
+                                on_change=lambda reason: scheduler.notify(reason, immediate=True))
+        scheduler.mark_evaluation()
+        threading.Timer(0.1, elector.set_leader, args=[True]).start()
+
+        start = time.monotonic()
+        reason = scheduler.wait()
+
+        assert reason == LEADERSHIP_ACQUIRED
+        assert time.monotonic() - start < 1
+
+    def test_timer(self):
+        scheduler = EvaluationScheduler(min_interval_s=0.01, max_interval_s=1, base_interval_s=0.05)
+        scheduler.mark_evaluation()
+
+        assert scheduler.wait() == "timer"
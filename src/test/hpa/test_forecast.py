@@ -0,0 +1,35 @@
+import math
+
+from main.hpa.forecast import HoltWinters, LoadForecaster
+
+
+def daily_load(slot, season_length=24):
+    return 1000 + 500 * math.sin(2 * math.pi * slot / season_length)
+
+
+class TestForecast:
+
+    def test_holt_winters_learns_the_season(self):
+        model = HoltWinters(24)
+        for slot in range(24 * 5):
+            model.update(daily_load(slot))
+
+        assert model.ready
+        for h in [1, 3, 6]:
+            expected = daily_load(24 * 5 + h - 1)
+            assert abs(model.forecast(h) - expected) < 50
+
+    def test_no_forecast_before_a_full_season(self):
+        forecaster = LoadForecaster(season_s=24 * 60, slot_s=60, horizon_s=180)
+        for t in range(0, 20 * 60, 30):
+            forecaster.record(t, daily_load(t // 60))
+
+        assert forecaster.predicted_cpu_m() is None
+
+    def test_forecast_one_startup_ahead(self):
+        forecaster = LoadForecaster(season_s=24 * 60, slot_s=60, horizon_s=180)
+        for t in range(0, 24 * 60 * 5, 20):
+            forecaster.record(t, daily_load(t // 60))
+
+        now_slot = 24 * 5 - 1
+        assert abs(forecaster.predicted_cpu_m() - daily_load(now_slot + 3)) < 50
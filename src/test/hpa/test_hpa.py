@@ -1,6 +1,13 @@
 import time
 
-from main.hpa.hpa_main import scale_replicas, ScalerAction
+import pytest
+from kubernetes.client import V1Deployment, V1DeploymentSpec, V1LabelSelector, V1ObjectMeta, V1PodTemplateSpec
+from kubernetes.client.rest import ApiException
+
+from main.hpa.behavior import POLICY_PERCENT, ScalingBehavior, ScalingPolicy, ScalingRules
+from main.hpa.dataset_prober import ProbeResult, ProbeOutcome
+from main.hpa.hpa_main import scale_replicas, ScalerAction, ClusterSnapshot
+from main.hpa.metric_sources import MetricValue
 
 
 class TestHpa:
@@ -26,6 +33,7 @@ class TestHpa:
 
         assert action == ScalerAction.SCALE_UP
         assert cluster_actions.get_replicas_set() == deployment_replicas + 1
+        assert cluster_actions.resource_versions_used == ["1"]
 
     def test_do_nothing_between_thresholds(self):
         requested_deployment_cpu = 100
@@ -71,6 +79,197 @@ class TestHpa:
         assert len(pods_to_delete) == 1
         assert pods_to_delete == {"pod_b"}
 
+    def test_scale_down_skips_failed_probes(self):
+        requested_deployment_cpu = 100
+        deployment_replicas = 3
+
+        ready_replicas: list[tuple[str, str]] = [
+            ("pod_a", "ip_a"),
+            ("pod_b", "ip_b"),
+            ("pod_c", "ip_c")
+        ]
+
+        custom_info = CustomInfoStub({"ip_a": 4, "ip_c": 0})  # ip_b does not answer
+
+        total_cpu_usage = requested_deployment_cpu * (self.lower_cpu_thr / 2) * len(ready_replicas)
+        hpa_config = HpaConfigStub(self.min_replicas, self.max_replicas, self.upper_cpu_thr, self.lower_cpu_thr,
+                                   self.loop_time, self.no_scale_period)
+        cluster_actions = ClusterActionsStub(self.namespace, requested_deployment_cpu, deployment_replicas,
+                                             ready_replicas, total_cpu_usage)
+        action = scale_replicas(cluster_actions, hpa_config, custom_info, 0)
+
+        assert action == ScalerAction.SCALE_DOWN
+        assert cluster_actions.get_pods_to_delete() == ["pod_c"]
+
+    def test_scale_down_cheapest_pod_when_none_is_empty(self):
+        requested_deployment_cpu = 100
+        deployment_replicas = 3
+        ready_replicas: list[tuple[str, str]] = [("pod_a", "ip_a"), ("pod_b", "ip_b"), ("pod_c", "ip_c")]
+        custom_info = CustomInfoStub({"ip_a": 3, "ip_b": 1, "ip_c": 55})
+
+        total_cpu_usage = requested_deployment_cpu * (self.lower_cpu_thr / 2) * len(ready_replicas)
+        hpa_config = HpaConfigStub(self.min_replicas, self.max_replicas, self.upper_cpu_thr, self.lower_cpu_thr,
+                                   self.loop_time, self.no_scale_period)
+        cluster_actions = ClusterActionsStub(self.namespace, requested_deployment_cpu, deployment_replicas,
+                                             ready_replicas, total_cpu_usage)
+        action = scale_replicas(cluster_actions, hpa_config, custom_info, 0)
+
+        assert action == ScalerAction.SCALE_DOWN
+        assert cluster_actions.get_replicas_set() == 2
+        assert cluster_actions.get_pods_to_delete() == ["pod_b"]
+        assert cluster_actions.deletion_costs == {"pod_a": 301, "pod_b": 0, "pod_c": 5501}
+
+    def test_proportional_scale_up_in_one_step(self):
+        requested_deployment_cpu = 100
+        deployment_replicas = 3
+        max_replicas = 20
+        ready_replicas: list[tuple[str, str]] = dummy_pod_name_ip_pairs(deployment_replicas)
+        total_cpu_usage = 1100  # 20 replicas at the middle of the thresholds: 1100 / (100 * 0.55)
+
+        hpa_config = HpaConfigStub(self.min_replicas, max_replicas, self.upper_cpu_thr, self.lower_cpu_thr,
+                                   self.loop_time, self.no_scale_period)
+        hpa_config.sm = "proportional"
+        cluster_actions = ClusterActionsStub(self.namespace, requested_deployment_cpu, deployment_replicas,
+                                             ready_replicas, total_cpu_usage)
+        action = scale_replicas(cluster_actions, hpa_config, None, 0)
+
+        assert action == ScalerAction.SCALE_UP
+        assert cluster_actions.get_replicas_set() == 20
+        assert cluster_actions.replicas_updates == 1
+        assert cluster_actions.replicas_added == 17
+        # what the replicas gauge reports after the cycle
+        assert cluster_actions.last_snapshot.deployment_replicas == 20
+
+    def test_proportional_scale_down_with_one_replica_update(self):
+        requested_deployment_cpu = 100
+        deployment_replicas = 6
+        ready_replicas: list[tuple[str, str]] = dummy_pod_name_ip_pairs(deployment_replicas)
+        custom_info = CustomInfoStub({ip: 0 for _, ip in ready_replicas})
+        total_cpu_usage = 150  # 3 replicas at the middle of the thresholds
+
+        hpa_config = HpaConfigStub(self.min_replicas, self.max_replicas + 5, self.upper_cpu_thr, self.lower_cpu_thr,
+                                   self.loop_time, self.no_scale_period)
+        hpa_config.sm = "proportional"
+        cluster_actions = ClusterActionsStub(self.namespace, requested_deployment_cpu, deployment_replicas,
+                                             ready_replicas, total_cpu_usage)
+        action = scale_replicas(cluster_actions, hpa_config, custom_info, 0)
+
+        assert action == ScalerAction.SCALE_DOWN
+        assert cluster_actions.get_replicas_set() == 3
+        assert len(cluster_actions.get_pods_to_delete()) == 3
+        assert cluster_actions.replicas_updates == 1
+
+    def test_behavior_limits_proportional_scaling(self):
+        requested_deployment_cpu = 100
+        deployment_replicas = 6
+        ready_replicas: list[tuple[str, str]] = dummy_pod_name_ip_pairs(deployment_replicas)
+        custom_info = CustomInfoStub({ip: 0 for _, ip in ready_replicas})
+
+        hpa_config = HpaConfigStub(self.min_replicas, 20, self.upper_cpu_thr, self.lower_cpu_thr,
+                                   self.loop_time, self.no_scale_period)
+        hpa_config.sm = "proportional"
+        cluster_actions = ClusterActionsStub(self.namespace, requested_deployment_cpu, deployment_replicas,
+                                             ready_replicas, 1100)
+        cluster_actions.behavior = ScalingBehavior(ScalingRules(policies=[ScalingPolicy(POLICY_PERCENT, 50, 60)]),
+                                                   ScalingRules(stabilization_s=300))
+        action = scale_replicas(cluster_actions, hpa_config, None, 0, now=1000)
+
+        assert action == ScalerAction.SCALE_UP
+        assert cluster_actions.get_replicas_set() == 9
+
+        # the load drops right away, the scale-down waits for the stabilization window
+        cluster_actions.total_cpu_usage = 150
+        action = scale_replicas(cluster_actions, hpa_config, custom_info, 0, now=1090)
+
+        assert action == ScalerAction.NOTHING
+        assert cluster_actions.replicas_updates == 1
+
+    def test_behavior_records_the_step_scale_down(self):
+        ready_replicas: list[tuple[str, str]] = dummy_pod_name_ip_pairs(5)
+        # a single pod without datasets, step mode removes only that one
+        custom_info = CustomInfoStub({"0": 2, "1": 0, "2": 3, "3": 1, "4": 2})
+
+        hpa_config = HpaConfigStub(self.min_replicas, self.max_replicas, self.upper_cpu_thr, self.lower_cpu_thr,
+                                   self.loop_time, self.no_scale_period)
+        cluster_actions = ClusterActionsStub(self.namespace, 100, 5, ready_replicas, 50)
+        cluster_actions.behavior = ScalingBehavior(ScalingRules(stabilization_s=120), ScalingRules(stabilization_s=300))
+        action = scale_replicas(cluster_actions, hpa_config, custom_info, 0, now=1000)
+
+        assert action == ScalerAction.SCALE_DOWN
+        assert cluster_actions.get_replicas_set() == 4
+        # the windows hold the replicas scaled to, not the minimum the step could have gone to
+        assert cluster_actions.behavior.up_window.value(1000) == 4
+        assert cluster_actions.behavior.down_window.value(1000) == 4
+
+    def test_predictive_scale_up_before_the_ramp(self):
+        requested_deployment_cpu = 100
+        deployment_replicas = 2
+        ready_replicas: list[tuple[str, str]] = dummy_pod_name_ip_pairs(deployment_replicas)
+        mid_range_threshold = (self.upper_cpu_thr + self.lower_cpu_thr) / 2
+        total_cpu_usage = mid_range_threshold * requested_deployment_cpu * len(ready_replicas)
+
+        hpa_config = HpaConfigStub(self.min_replicas, self.max_replicas, self.upper_cpu_thr, self.lower_cpu_thr,
+                                   self.loop_time, self.no_scale_period)
+        cluster_actions = ClusterActionsStub(self.namespace, requested_deployment_cpu, deployment_replicas,
+                                             ready_replicas, total_cpu_usage)
+        cluster_actions.predicted_cpu_m = 270  # needs 4 replicas under the upper threshold
+        action = scale_replicas(cluster_actions, hpa_config, None, 0)
+
+        assert action == ScalerAction.SCALE_UP
+        assert cluster_actions.get_replicas_set() == 4
+
+    def test_predicted_floor_limits_scale_down(self):
+        requested_deployment_cpu = 100
+        deployment_replicas = 5
+        ready_replicas: list[tuple[str, str]] = dummy_pod_name_ip_pairs(deployment_replicas)
+        custom_info = CustomInfoStub({ip: 0 for _, ip in ready_replicas})
+        total_cpu_usage = 50
+
+        hpa_config = HpaConfigStub(self.min_replicas, self.max_replicas, self.upper_cpu_thr, self.lower_cpu_thr,
+                                   self.loop_time, self.no_scale_period)
+        cluster_actions = ClusterActionsStub(self.namespace, requested_deployment_cpu, deployment_replicas,
+                                             ready_replicas, total_cpu_usage)
+        cluster_actions.predicted_cpu_m = 280  # floor of 4 replicas
+        action = scale_replicas(cluster_actions, hpa_config, custom_info, 0)
+
+        assert action == ScalerAction.SCALE_DOWN
+        assert cluster_actions.get_replicas_set() == 4
+
+    def test_metric_source_scales_up_with_cpu_in_range(self):
+        requested_deployment_cpu = 100
+        deployment_replicas = 2
+        ready_replicas: list[tuple[str, str]] = dummy_pod_name_ip_pairs(deployment_replicas)
+        mid_range_threshold = (self.upper_cpu_thr + self.lower_cpu_thr) / 2
+        total_cpu_usage = mid_range_threshold * requested_deployment_cpu * len(ready_replicas)
+
+        hpa_config = HpaConfigStub(self.min_replicas, self.max_replicas, self.upper_cpu_thr, self.lower_cpu_thr,
+                                   self.loop_time, self.no_scale_period)
+        cluster_actions = ClusterActionsStub(self.namespace, requested_deployment_cpu, deployment_replicas,
+                                             ready_replicas, total_cpu_usage)
+        cluster_actions.metrics = {"latency": MetricValue(average=450, target=200, samples=2),
+                                   "queue": MetricValue(average=5, target=10, samples=2)}
+        action = scale_replicas(cluster_actions, hpa_config, None, 0)
+
+        assert action == ScalerAction.SCALE_UP
+        assert cluster_actions.get_replicas_set() == 5
+
+    def test_metric_source_limits_scale_down(self):
+        requested_deployment_cpu = 100
+        deployment_replicas = 5
+        ready_replicas: list[tuple[str, str]] = dummy_pod_name_ip_pairs(deployment_replicas)
+        custom_info = CustomInfoStub({ip: 0 for _, ip in ready_replicas})
+        total_cpu_usage = 50
+
+        hpa_config = HpaConfigStub(self.min_replicas, self.max_replicas, self.upper_cpu_thr, self.lower_cpu_thr,
+                                   self.loop_time, self.no_scale_period)
+        cluster_actions = ClusterActionsStub(self.namespace, requested_deployment_cpu, deployment_replicas,
+                                             ready_replicas, total_cpu_usage)
+        cluster_actions.metrics = {"queue": MetricValue(average=8, target=10, samples=5)}
+        action = scale_replicas(cluster_actions, hpa_config, custom_info, 0)
+
+        assert action == ScalerAction.SCALE_DOWN
+        assert cluster_actions.get_replicas_set() == 4
+
     def test_do_nothing_pods_not_ready(self):
         requested_deployment_cpu = 100
         deployment_replicas = 3
@@ -130,6 +329,20 @@ class TestHpa:
         assert action == ScalerAction.NOTHING
 
 
+    @pytest.mark.parametrize("replicas_now, action, updates", [
+        (3, ScalerAction.SCALE_UP, 2),  # a status update changed the resourceVersion
+        (5, ScalerAction.NOTHING, 1),  # someone else scaled the deployment
+    ])
+    def test_resource_version_conflict(self, replicas_now, action, updates):
+        hpa_config = HpaConfigStub(self.min_replicas, self.max_replicas, self.upper_cpu_thr, self.lower_cpu_thr,
+                                   self.loop_time, self.no_scale_period)
+        cluster_actions = ConflictingClusterActionsStub(self.namespace, 100, 3, dummy_pod_name_ip_pairs(3), 300)
+        cluster_actions.replicas_now = replicas_now
+
+        assert scale_replicas(cluster_actions, hpa_config, None, 0) == action
+        assert cluster_actions.replicas_updates == updates
+        assert cluster_actions.resource_versions_used[-1] == ("7" if updates == 2 else "1")
+
     def run_hpa(self,
                 deployment_replicas,
                 loop_time,
@@ -156,6 +369,16 @@ class CustomInfoStub:
     def get_pod_num_datasets(self, pod_ip):
         return self.pod_ip_datasets.get(pod_ip)
 
+    def get_pods_num_datasets(self, pod_ips: list[str]) -> dict[str, ProbeResult]:
+        results = {}
+        for ip in pod_ips:
+            num_ds = self.pod_ip_datasets.get(ip)
+            if num_ds is None:
+                results[ip] = ProbeResult(ProbeOutcome.CONNECTION_ERROR)
+            else:
+                results[ip] = ProbeResult(ProbeOutcome.OK, num_ds)
+        return results
+
 
 class HpaConfigStub:
 
@@ -166,6 +389,10 @@ class HpaConfigStub:
         self.lct = lower_cpu_thr  # 0.4
         self.lts = loop_time  # 90 segundos es lo que tarda en estar ready un pod de web
         self.nsdp = no_scale_period
+        self.sm = "step"
+        self.dc = 100
+        self.ahl = 600
+        self.cc = 1
 
     @property
     def no_scale_down_period_s(self):
@@ -187,10 +414,26 @@ class HpaConfigStub:
     def min_replicas(self) -> int:
         return self.mir
 
+    @property
+    def dataset_cost(self) -> float:
+        return self.dc
+
+    @property
+    def access_half_life_s(self) -> float:
+        return self.ahl
+
+    @property
+    def cpu_cost(self) -> float:
+        return self.cc
+
     @property
     def max_replicas(self) -> int:
         return self.mar
 
+    @property
+    def scaling_mode(self) -> str:
+        return self.sm
+
 
 def dummy_pod_name_ip_pairs(num):
     a = []
@@ -220,6 +463,13 @@ class ClusterActionsStub:
         self.ready_replicas = ready_replicas
         self.total_cpu_usage = total_cpu_usage
         self.pods_to_delete = []
+        self.resource_versions_used = []
+        self.replicas_updates = 0
+        self.predicted_cpu_m = None
+        self.metrics = {}
+        self.last_snapshot = None
+        self.shadow = None
+        self.behavior = None
 
     def get_requested_deployment_cpu(self):
         return self.requested_deployment_cpu
@@ -227,8 +477,11 @@ class ClusterActionsStub:
     def get_replicas_set(self):
         return self.replicas_set
 
-    def set_deployment_replicas(self, target_replicas):
+    def set_deployment_replicas(self, target_replicas, resource_version: str = None):
         self.replicas_set = target_replicas
+        self.replicas_updates += 1
+        self.resource_versions_used.append(resource_version)
+        return str(int(resource_version) + 1)
 
     def get_deployment_replicas(self):
         return self.deployment_replicas
@@ -239,9 +492,44 @@ class ClusterActionsStub:
     def get_total_cpu_usage(self, name_ip_pairs: list[tuple[str, str]]) -> float:
         return self.total_cpu_usage
 
+    def get_snapshot(self) -> ClusterSnapshot:
+        snapshot = ClusterSnapshot(self.ready_replicas, self.total_cpu_usage, self.deployment_replicas,
+                                   self.requested_deployment_cpu, "1")
+        snapshot.predicted_cpu_m = self.predicted_cpu_m
+        snapshot.metrics = self.metrics
+        self.last_snapshot = snapshot
+        return snapshot
+
     def get_pods_to_delete(self):
         return self.pods_to_delete
 
     def annotate_pod_deletion_cost(self, name: str, cost: int) -> None:
         if cost == 0:
             self.pods_to_delete.append(name)
+
+    def record_scale_up(self, replicas_added: int):
+        self.replicas_added = replicas_added
+
+    def annotate_pods_deletion_cost(self, costs: dict[str, int]) -> None:
+        self.deletion_costs = costs
+        for name, cost in costs.items():
+            self.annotate_pod_deletion_cost(name, cost)
+
+
+# Its first replicas write fails the resourceVersion precondition
+class ConflictingClusterActionsStub(ClusterActionsStub):
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.replicas_now = self.deployment_replicas
+
+    def set_deployment_replicas(self, target_replicas, resource_version: str = None):
+        super().set_deployment_replicas(target_replicas, resource_version)
+        if self.replicas_updates == 1:
+            raise ApiException(status=422, reason="Unprocessable Entity")
+        return str(int(resource_version) + 1)
+
+    def read_deployment(self):
+        return V1Deployment(metadata=V1ObjectMeta(name="web", resource_version="7"),
+                            spec=V1DeploymentSpec(replicas=self.replicas_now, selector=V1LabelSelector(),
+                                                  template=V1PodTemplateSpec()))
@@ -0,0 +1,55 @@
+import urllib.request
+
+import pytest
+from kubernetes.client import ApiException
+
+from main.hpa.instrumentation import HpaMetrics, InstrumentedApi, MetricsServer, api_verb_resource
+
+
+class AppsApiStub:
+
+    def read_namespaced_deployment(self, name, namespace):
+        return {"name": name}
+
+    def patch_namespaced_deployment_scale(self, name, namespace, body):
+        raise ApiException(status=409)
+
+
+class TestInstrumentation:
+
+    def test_api_verb_resource(self):
+        assert api_verb_resource("list_namespaced_pod") == ("list", "pod")
+        assert api_verb_resource("list_pod_for_all_namespaces") == ("list", "pod")
+        assert api_verb_resource("patch_namespaced_deployment_scale_with_http_info") == ("patch", "deployment_scale")
+
+    def test_instrumented_api_counts_requests_and_errors(self):
+        metrics = HpaMetrics()
+        api = InstrumentedApi(AppsApiStub(), metrics)
+
+        assert api.read_namespaced_deployment("web", "ns") == {"name": "web"}
+        api.read_namespaced_deployment("web", "ns")
+        with pytest.raises(ApiException):
+            api.patch_namespaced_deployment_scale("web", "ns", {})
+
+        assert metrics.api_requests.values[("read", "deployment")] == 2
+        assert metrics.api_requests.values[("patch", "deployment_scale")] == 1
+        assert metrics.api_errors.values[("patch", "deployment_scale", "409")] == 1
+        assert api.read_namespaced_deployment.__name__ == "read_namespaced_deployment"
+
+    def test_metrics_endpoint(self):
+        metrics = HpaMetrics()
+        metrics.phase_seconds.observe(0.02, "web", "pods")
+        metrics.phase_seconds.observe(7, "web", "pods")
+        metrics.target_replicas.set(4, "web")
+        server = MetricsServer(metrics, 0, "127.0.0.1")
+        server.start()
+        try:
+            body = urllib.request.urlopen(f"http://127.0.0.1:{server.port}/metrics", timeout=5).read().decode()
+        finally:
+            server.stop()
+
+        assert "# TYPE hpa_phase_seconds histogram" in body
+        assert 'hpa_phase_seconds_bucket{deployment="web",phase="pods",le="0.025"} 1' in body
+        assert 'hpa_phase_seconds_bucket{deployment="web",phase="pods",le="+Inf"} 2' in body
+        assert 'hpa_phase_seconds_count{deployment="web",phase="pods"} 2' in body
+        assert 'hpa_target_replicas{deployment="web"} 4' in body
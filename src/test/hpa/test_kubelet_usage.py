@@ -0,0 +1,70 @@
+import json
+
+from main.hpa.kubelet_usage import KubeletUsageSource
+
+
+class TestKubeletUsage:
+
+    def test_rates_from_cumulative_counters_of_our_nodes_only(self):
+        core_api = NodeProxyStub()
+        core_api.summaries = {
+            "node-1": summary([("web-1", "ns", "2024-01-01T00:00:00Z", 10_000_000_000, 300_000_000),
+                               ("other-1", "ns", "2024-01-01T00:00:00Z", 50_000_000_000, 900_000_000)]),
+            "node-2": summary([("web-2", "ns", "2024-01-01T00:00:00Z", 20_000_000_000, 100_000_000)]),
+            "node-3": summary([("web-9", "ns", "2024-01-01T00:00:00Z", 1, 1)]),
+        }
+        source = KubeletUsageSource(core_api, "ns", max_workers=2)
+        pod_nodes = {"web-1": "node-1", "web-2": "node-2"}
+
+        usages = source.get_pods_usages(pod_nodes)
+
+        assert sorted(core_api.nodes_read) == ["node-1", "node-2"]
+        assert usages == {"web-1": {"web": {"cpu": "300000000n"}}, "web-2": {"web": {"cpu": "100000000n"}}}
+
+        # 5s later: web-1 used 2.5 cores-seconds (500m), web-2 restarted and falls back to the kubelet rate
+        core_api.summaries = {
+            "node-1": summary([("web-1", "ns", "2024-01-01T00:00:05Z", 12_500_000_000, 400_000_000)]),
+            "node-2": summary([("web-2", "ns", "2024-01-01T00:00:05Z", 1_000_000_000, 200_000_000)]),
+        }
+        usages = source.get_pods_usages(pod_nodes)
+
+        assert usages["web-1"]["web"]["cpu"] == "500000000n"
+        assert usages["web-2"]["web"]["cpu"] == "200000000n"
+        source.close()
+
+    def test_failed_node_is_skipped(self):
+        core_api = NodeProxyStub()
+        core_api.summaries = {"node-1": summary([("web-1", "ns", "2024-01-01T00:00:00Z", 1, 300)])}
+        source = KubeletUsageSource(core_api, "ns")
+
+        usages = source.get_pods_usages({"web-1": "node-1", "web-2": "node-down"})
+
+        assert usages == {"web-1": {"web": {"cpu": "300n"}}}
+        source.close()
+
+
+def summary(pods):
+    return {"pods": [{"podRef": {"name": name, "namespace": ns, "uid": name},
+                      "containers": [{"name": "web", "cpu": {"time": t, "usageCoreNanoSeconds": core_ns,
+                                                             "usageNanoCores": nano_cores}}]}
+                     for name, ns, t, core_ns, nano_cores in pods]}
+
+
+class RawResponse:
+
+    def __init__(self, doc):
+        self.data = json.dumps(doc).encode()
+
+
+class NodeProxyStub:
+
+    def __init__(self):
+        self.summaries = {}
+        self.nodes_read = []
+
+    def connect_get_node_proxy_with_path(self, name, path, _preload_content=True, _request_timeout=None):
+        assert path == "stats/summary" and not _preload_content
+        self.nodes_read.append(name)
+        if name not in self.summaries:
+            raise ConnectionError(f"node {name} unreachable")
+        return RawResponse(self.summaries[name])
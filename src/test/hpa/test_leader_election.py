@@ -0,0 +1,84 @@
+import copy
+
+from kubernetes.client.rest import ApiException
+
+from main.hpa.leader_election import LeaderElector
+
+
+class TestLeaderElection:
+
+    def test_one_leader_and_failover_after_expiry(self):
+        api = LeaseApiStub()
+        now = [1000.0]
+        changes = []
+        a = LeaderElector(api, "hpa", "ns", "a", lease_duration_s=10, clock=lambda: now[0], on_change=changes.append)
+        b = LeaderElector(api, "hpa", "ns", "b", lease_duration_s=10, clock=lambda: now[0])
+
+        assert a.try_acquire_or_renew()
+        assert not b.try_acquire_or_renew()
+        assert a.is_leader and not b.is_leader
+        assert changes == ["leadership acquired"]
+
+        # a stops renewing: it stops acting before b may take over
+        now[0] += 7
+        assert not a.is_leader
+        assert not b.try_acquire_or_renew()
+        now[0] += 4
+        assert b.try_acquire_or_renew()
+        assert api.lease.spec.holder_identity == "b"
+        assert api.lease.spec.lease_transitions == 1
+        assert not a.try_acquire_or_renew()
+
+    def test_new_leader_inherits_last_scaleup(self):
+        api = LeaseApiStub()
+        now = [1000.0]
+        a = LeaderElector(api, "hpa", "ns", "a", clock=lambda: now[0])
+        b = LeaderElector(api, "hpa", "ns", "b", clock=lambda: now[0])
+        a.try_acquire_or_renew()
+        a.record_scale_up("web", 999.0)
+
+        b.try_acquire_or_renew()  # standby, reads the lease
+        assert b.last_scaleup("web") == 999.0
+
+        a.release()
+        assert b.try_acquire_or_renew()
+        assert b.last_scaleup("web") == 999.0
+        assert b.last_scaleup("other") == 0
+
+    def test_conflicting_write_loses(self):
+        api = LeaseApiStub()
+        a = LeaderElector(api, "hpa", "ns", "a", clock=lambda: 1000.0)
+        a.try_acquire_or_renew()
+        api.fail_next_replace = True
+
+        assert not a.try_acquire_or_renew()
+        assert not a.is_leader
+
+
+class LeaseApiStub:
+
+    def __init__(self):
+        self.lease = None
+        self.version = 0
+        self.fail_next_replace = False
+
+    def read_namespaced_lease(self, name, namespace):
+        if self.lease is None:
+            raise ApiException(status=404)
+        return copy.deepcopy(self.lease)
+
+    def create_namespaced_lease(self, namespace, body):
+        if self.lease is not None:
+            raise ApiException(status=409)
+        self.store(body)
+
+    def replace_namespaced_lease(self, name, namespace, body):
+        if self.fail_next_replace or body.metadata.resource_version != str(self.version):
+            self.fail_next_replace = False
+            raise ApiException(status=409)
+        self.store(body)
+
+    def store(self, body):
+        self.version += 1
+        self.lease = copy.deepcopy(body)
+        self.lease.metadata.resource_version = str(self.version)
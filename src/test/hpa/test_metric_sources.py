@@ -0,0 +1,56 @@
+import pytest
+
+from main.hpa.dataset_prober import ProbeOutcome
+from main.hpa.hpa_main import ClusterSnapshot
+from main.hpa.metric_sources import CpuMetricSource, MetricValue, PodJsonMetricSource, parse_metric_sources
+
+
+class TestMetricSources:
+
+    def test_desired_replicas(self):
+        assert MetricValue(average=300, target=200, samples=4).desired_replicas(4) == 6
+        assert MetricValue(average=100, target=200, samples=4).desired_replicas(4) == 2
+        assert MetricValue(average=0, target=200, samples=0).desired_replicas(4) is None
+
+    def test_cpu_source(self):
+        snapshot = ClusterSnapshot([("web-1", "10.0.0.1"), ("web-2", "10.0.0.2")], 180, 2, 100)
+
+        value = CpuMetricSource(0.6).read(snapshot)
+
+        assert value.average == 90
+        assert value.target == 60
+        assert value.desired_replicas(2) == 3
+
+    def test_pod_json_source_averages_the_answering_pods(self):
+        prober = JsonProberStub({"10.0.0.1": {"queue": {"depth": 12}},
+                                 "10.0.0.2": {"queue": {"depth": 8}},
+                                 "10.0.0.3": None})
+        snapshot = ClusterSnapshot([("web-1", "10.0.0.1"), ("web-2", "10.0.0.2"), ("web-3", "10.0.0.3")], 0, 3, 100)
+
+        value = PodJsonMetricSource("queue", "/admin/metrics", "queue.depth", 5, prober).read(snapshot)
+
+        assert prober.paths == ["/admin/metrics"]
+        assert value.average == 10
+        assert value.samples == 2
+        assert value.desired_replicas(3) == 6
+
+    def test_parse_metric_sources(self):
+        sources = parse_metric_sources('[{"type": "cpu", "target": 0.6},'
+                                       ' {"name": "latency", "field": "latencyP99Ms", "target": 200}]', None)
+
+        assert [s.name for s in sources] == ["cpu", "latency"]
+        assert sources[1].path == "/admin/metrics"
+        with pytest.raises(ValueError):
+            parse_metric_sources('[{"type": "prometheus", "target": 1}]', None)
+
+
+class JsonProberStub:
+
+    def __init__(self, docs: dict):
+        self.docs = docs
+        self.paths = []
+
+    def get_json_all(self, pod_ips, path):
+        self.paths.append(path)
+        return {ip: (ProbeOutcome.OK, self.docs[ip], "") if self.docs[ip] is not None
+                else (ProbeOutcome.TIMEOUT, None, "timed out") for ip in pod_ips}
@@ -0,0 +1,123 @@
+import threading
+import time
+
+from kubernetes.client import V1ContainerStatus, V1ObjectMeta, V1Pod, V1PodCondition, V1PodStatus
+
+from main.hpa.namespace_cache import NamespaceCache
+from main.hpa.scheduler import TargetScheduler
+from main.hpa.targets import Target, parse_targets
+
+
+class TestScheduler:
+
+    def test_parse_targets(self):
+        doc = {"targets": [
+            {"deployment": "web", "app": "my_app", "config": {"MIN_REPLICAS": 2}},
+            {"name": "api", "namespace": "other", "deployment": "api", "role": "api", "interval_s": 30},
+        ]}
+        targets = parse_targets(doc, "my_namespace")
+
+        assert [(t.name, t.namespace, t.app, t.role, t.container) for t in targets] == [
+            ("web", "my_namespace", "my_app", "web", "web"),
+            ("api", "other", "api", "api", "api")
+        ]
+        assert targets[0].env()["MIN_REPLICAS"] == "2"
+        assert targets[1].interval_s == 30
+
+    def test_targets_run_on_independent_intervals(self):
+        fast = target("fast", 10)
+        slow = target("slow", 100)
+        evaluated = []
+        done = threading.Semaphore(0)
+
+        def evaluate(t):
+            evaluated.append(t.name)
+            done.release()
+
+        clock = [0.0]
+        scheduler = TargetScheduler([fast, slow], evaluate, max_workers=2, log=lambda line: None,
+                                    clock=lambda: clock[0])
+        scheduler.run_once()
+        done.acquire(), done.acquire()
+        while scheduler.running:
+            pass
+
+        clock[0] = 5
+        assert scheduler.run_once() == 5
+        clock[0] = 10
+        scheduler.run_once()
+        done.acquire()
+        scheduler.stop()
+
+        assert sorted(evaluated[:2]) == ["fast", "slow"]
+        assert evaluated[2:] == ["fast"]
+        assert fast.evaluations == 2 and fast.last_latency_s is not None
+
+    def test_mark_all_due_on_failover(self):
+        web = target("web", 90)
+        evaluations = threading.Semaphore(0)
+        scheduler = TargetScheduler([web], lambda t: evaluations.release(), max_workers=1, log=lambda line: None)
+        threading.Thread(target=scheduler.run, daemon=True).start()
+        assert evaluations.acquire(timeout=5)
+        while scheduler.running:
+            time.sleep(0.01)
+
+        start = time.monotonic()
+        scheduler.mark_all_due()
+
+        assert evaluations.acquire(timeout=5)
+        assert time.monotonic() - start < 1
+        scheduler.stop()
+
+    def test_namespace_cache_is_shared(self):
+        core_stub = CountingStub()
+        custom_stub = CountingStub()
+        cache = NamespaceCache(core_stub, custom_stub, "my_namespace", ttl_s=60)
+
+        cache.get_ready_pods("my_app", "web", "web")
+        cache.get_ready_pods("other_app", "web", "web")
+        cache.get_pods_usages()
+        cache.get_pods_usages()
+
+        assert core_stub.calls == 1
+        assert custom_stub.calls == 1
+
+    def test_namespace_cache_skips_unlabeled_pods(self):
+        unlabeled = V1Pod(metadata=V1ObjectMeta(name="sidecar"))
+        web = serving_pod("web-0", {"app": "my_app", "role": "web"})
+        cache = NamespaceCache(CountingStub([unlabeled, web]), CountingStub(), "my_namespace", ttl_s=60)
+
+        assert cache.get_ready_pods("my_app", "web", "web") == [web]
+        assert cache.get_ready_pods("other_app", "web", "web") == []
+
+
+def target(name, interval_s) -> Target:
+    return Target(name, "my_namespace", name, name, "web", name, {}, interval_s)
+
+
+def serving_pod(name, labels) -> V1Pod:
+    status = V1PodStatus(conditions=[V1PodCondition(type="Ready", status="True")],
+                         container_statuses=[V1ContainerStatus(name="web", ready=True, image="web", image_id="",
+                                                               restart_count=0)])
+    return V1Pod(metadata=V1ObjectMeta(name=name, labels=labels), status=status)
+
+
+class CountingStub:
+
+    def __init__(self, pods=None):
+        self.calls = 0
+        self.pods = pods or []
+
+    def list_namespaced_pod(self, namespace, **kwargs):
+        self.calls += 1
+        return ItemsStub(self.pods)
+
+    def list_namespaced_custom_object(self, group, version, namespace, plural, **kwargs):
+        self.calls += 1
+        return {"items": []}
+
+
+class ItemsStub:
+
+    def __init__(self, items):
+        self.items = items
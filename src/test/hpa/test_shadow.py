@@ -0,0 +1,103 @@
+import pytest
+
+from main.hpa.dataset_prober import ProbeOutcome, ProbeResult
+from main.hpa.hpa_main import ClusterSnapshot, HpaConfig, ScalerAction, new_shadow_evaluator, scale_replicas
+from main.hpa.shadow import parse_shadow_policies
+
+ENV = {"MIN_REPLICAS": "2", "MAX_REPLICAS": "6", "UPPER_CPU_THRESHOLD": "0.7", "LOWER_CPU_THRESHOLD": "0.4",
+       "LOOP_TIME_S": "60", "NO_SCALE_DOWN_PERIOD": "300"}
+
+
+class TestShadow:
+
+    def test_divergences_and_projections(self):
+        hpa_config = HpaConfig({**ENV, "SHADOW_POLICIES": '{"tight": {"UPPER_CPU_THRESHOLD": 0.5}, '
+                                                          '"proportional": {"SCALING_MODE": "proportional"}}'})
+        cluster_actions = ClusterActionsStub(4, 270)
+        cluster_actions.shadow = new_shadow_evaluator(hpa_config, "web")
+
+        for now in [1000, 1060]:
+            assert scale_replicas(cluster_actions, hpa_config, None, 0, now=now) == ScalerAction.NOTHING
+        wait(cluster_actions.shadow)
+        stats = cluster_actions.shadow.stats()
+
+        assert cluster_actions.replicas_updates == 0
+        assert stats["tight"]["divergences"] == 2 and stats["proportional"]["divergences"] == 0
+        assert cluster_actions.shadow.policies[0].stats.last_target_replicas == 5
+        # 60s at 5 replicas, with 270m over 50% of 500m
+        assert stats["tight"]["replica_minutes"] == 5 and stats["tight"]["over_threshold_minutes"] == 1
+        assert stats["live"]["replica_minutes"] == 4 and stats["live"]["over_threshold_minutes"] == 0
+
+    def test_scale_down_reuses_the_live_probes(self):
+        hpa_config = HpaConfig({**ENV, "SHADOW_POLICIES": '{"floor": {"MIN_REPLICAS": 4}, '
+                                                          '"proportional": {"SCALING_MODE": "proportional"}}'})
+        cluster_actions = ClusterActionsStub(4, 40)
+        cluster_actions.shadow = new_shadow_evaluator(hpa_config, "web")
+        app_info = AppInfoStub({"ip-0": 3, "ip-1": 0, "ip-2": 55, "ip-3": 0})
+
+        assert scale_replicas(cluster_actions, hpa_config, app_info, 0, now=1000) == ScalerAction.SCALE_DOWN
+        decisions = wait(cluster_actions.shadow)
+
+        assert app_info.calls == 1
+        assert cluster_actions.replicas_updates == 1
+        assert decisions["floor"] == {"action": "NOTHING", "target_replicas": 4, "diverged": True, "victims": None}
+        assert decisions["proportional"]["victims"] == ["pod-1", "pod-3"]
+        assert not decisions["proportional"]["diverged"]
+
+    def test_shadow_scale_down_without_live_probes(self):
+        hpa_config = HpaConfig({**ENV, "SHADOW_POLICIES": '{"eager": {"NO_SCALE_DOWN_PERIOD": 0}}'})
+        cluster_actions = ClusterActionsStub(4, 40)
+        cluster_actions.shadow = new_shadow_evaluator(hpa_config, "web")
+
+        # the live policy is still in its no scale down period and probes nothing
+        assert scale_replicas(cluster_actions, hpa_config, None, 900, now=1000) == ScalerAction.NOTHING
+        decisions = wait(cluster_actions.shadow)
+
+        # unknown pods are assumed to hold datasets, step mode removes one
+        assert decisions["eager"]["action"] == "SCALE_DOWN" and decisions["eager"]["target_replicas"] == 3
+
+    def test_policies_must_be_an_object(self):
+        with pytest.raises(ValueError):
+            parse_shadow_policies('[{"UPPER_CPU_THRESHOLD": 0.5}]')
+
+
+def wait(shadow) -> dict:
+    # the single shadow thread runs the evaluations in order
+    return shadow.executor.submit(lambda: shadow.last_decisions).result()
+
+
+class ClusterActionsStub:
+
+    def __init__(self, replicas, total_cpu_m):
+        self.deployment_web = "web"
+        self.shadow = None
+        self.behavior = None
+        self.pairs = [(f"pod-{i}", f"ip-{i}") for i in range(replicas)]
+        self.replicas = replicas
+        self.total_cpu_m = total_cpu_m
+        self.replicas_updates = 0
+
+    def get_snapshot(self) -> ClusterSnapshot:
+        return ClusterSnapshot(self.pairs, self.total_cpu_m, self.replicas, 100, "1",
+                               {name: self.total_cpu_m / len(self.pairs) for name, _ in self.pairs})
+
+    def set_deployment_replicas(self, target_replicas, resource_version: str = None):
+        self.replicas_updates += 1
+        return str(int(resource_version) + 1)
+
+    def record_scale_up(self, replicas_added: int):
+        pass
+
+    def annotate_pods_deletion_cost(self, costs: dict[str, int]) -> None:
+        pass
+
+
+class AppInfoStub:
+
+    def __init__(self, pod_ip_datasets: dict[str, int]):
+        self.pod_ip_datasets = pod_ip_datasets
+        self.calls = 0
+
+    def get_pods_num_datasets(self, pod_ips: list[str]) -> dict[str, ProbeResult]:
+        self.calls += 1
+        return {ip: ProbeResult(ProbeOutcome.OK, self.pod_ip_datasets[ip]) for ip in pod_ips}
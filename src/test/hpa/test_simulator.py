@@ -0,0 +1,61 @@
+import pytest
+
+from main.hpa.hpa_main import HpaConfig
+from main.hpa.simulator import LoadTrace, Simulation
+
+ENV = {"MIN_REPLICAS": "2", "MAX_REPLICAS": "10", "UPPER_CPU_THRESHOLD": "0.7", "LOWER_CPU_THRESHOLD": "0.4",
+       "LOOP_TIME_S": "90", "NO_SCALE_DOWN_PERIOD": "300"}
+
+
+class TestSimulator:
+
+    def test_trace_interpolation(self):
+        trace = LoadTrace([(0, 100), (100, 300)])
+
+        assert trace.demand(-10) == 100
+        assert trace.demand(50) == 200
+        assert trace.demand(1000) == 300
+
+    def test_flat_load_converges(self):
+        trace = LoadTrace([(0, 1000), (3 * 3600, 1000)])
+        report = Simulation(HpaConfig(ENV), trace, requested_cpu_m=250, pod_startup_s=60).run()
+
+        # 1000m at 250m per pod stays under 70% with 6 pods
+        assert report.max_replicas == 6
+        assert report.scale_ups == 4
+        assert report.scale_downs == 0
+        assert report.time_over_upper_s > 0
+        assert report.evaluations == 3 * 3600 // 90
+
+    def test_proportional_mode_reacts_faster(self):
+        trace = LoadTrace([(0, 200), (600, 200), (660, 1500), (4 * 3600, 1500)])
+        step = Simulation(HpaConfig(ENV), trace, requested_cpu_m=250, pod_startup_s=120).run()
+        proportional = Simulation(HpaConfig({**ENV, "SCALING_MODE": "proportional"}), trace, requested_cpu_m=250,
+                                  pod_startup_s=120).run()
+
+        assert proportional.time_over_upper_s < step.time_over_upper_s
+        assert proportional.scale_ups < step.scale_ups
+
+    def test_low_load_scales_down_idle_pods(self):
+        trace = LoadTrace([(0, 1500), (3600, 1500), (3660, 100), (4 * 3600, 100)])
+        report = Simulation(HpaConfig(ENV), trace, requested_cpu_m=250, pod_startup_s=60, dataset_idle_s=300).run()
+
+        assert report.scale_downs > 0
+        assert report.to_dict()["scale_events"] == report.scale_ups + report.scale_downs
+
+    def test_cpu_aggregation_and_metric_sources_are_simulated(self):
+        trace = LoadTrace([(0, 1500), (3600, 1500), (3660, 100), (4 * 3600, 100)])
+        instant = Simulation(HpaConfig(ENV), trace, requested_cpu_m=250, pod_startup_s=60, dataset_idle_s=300).run()
+        smoothed = Simulation(HpaConfig({**ENV, "CPU_AGGREGATION": "max", "CPU_WINDOW": "20"}), trace,
+                              requested_cpu_m=250, pod_startup_s=60, dataset_idle_s=300).run()
+        floored = Simulation(HpaConfig({**ENV, "METRIC_SOURCES": '[{"type": "cpu", "target": 0.05}]'}), trace,
+                             requested_cpu_m=250, pod_startup_s=60, dataset_idle_s=300).run()
+
+        # the max of the window holds the replicas up after the load drops
+        assert smoothed.replica_minutes > instant.replica_minutes
+        assert floored.replica_minutes > instant.replica_minutes
+
+    def test_pod_metric_sources_are_rejected(self):
+        env = {**ENV, "METRIC_SOURCES": '[{"name": "latency", "field": "latencyP99Ms", "target": 200}]'}
+        with pytest.raises(ValueError):
+            Simulation(HpaConfig(env), LoadTrace([(0, 100), (60, 100)]), requested_cpu_m=250)
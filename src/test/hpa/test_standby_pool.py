@@ -0,0 +1,75 @@
+from kubernetes.client import V1Deployment, V1DeploymentStatus
+from kubernetes.client.rest import ApiException
+
+from main.hpa.standby_pool import StandbyPool
+
+
+class TestStandbyPool:
+    namespace = "my_namespace"
+
+    def test_creates_placeholder_deployment(self):
+        apps_stub = AppsApiClientStub()
+        pool = StandbyPool(apps_stub, self.namespace, "web-standby", "hpa-standby", 1, 4, 600)
+
+        pool.ensure({"cpu": "500m"})
+
+        created = apps_stub.deployments["web-standby"]
+        pod_spec = created.spec.template.spec
+        assert created.spec.replicas == 1
+        assert pod_spec.priority_class_name == "hpa-standby"
+        assert pod_spec.containers[0].resources.requests == {"cpu": "500m"}
+
+    def test_resize_follows_recent_scale_ups(self):
+        apps_stub = AppsApiClientStub()
+        pool = StandbyPool(apps_stub, self.namespace, "web-standby", "hpa-standby", 1, 3, 600)
+        pool.ensure({"cpu": "500m"})
+
+        for t in [0, 10, 20, 30, 40]:
+            pool.record_scale_up(now=t)
+
+        assert pool.resize(now=50) == 3
+        assert apps_stub.replicas_set == 3
+        assert pool.resize(now=1000) == 1
+        assert apps_stub.replicas_set == 1
+
+    def test_pool_is_sized_from_replicas_added(self):
+        apps_stub = AppsApiClientStub()
+        pool = StandbyPool(apps_stub, self.namespace, "web-standby", "hpa-standby", 1, 10, 600)
+        pool.ensure({"cpu": "500m"})
+
+        # a single proportional scale-up from 3 to 12 replicas
+        pool.record_scale_up(9, now=0)
+
+        assert pool.resize(now=10) == 9
+
+    def test_warm_hit_ratio(self):
+        apps_stub = AppsApiClientStub()
+        pool = StandbyPool(apps_stub, self.namespace, "web-standby", "hpa-standby", 1, 3, 600)
+        pool.ensure({"cpu": "500m"})
+        apps_stub.deployments["web-standby"].status = V1DeploymentStatus(available_replicas=1)
+
+        pool.refresh()
+        pool.record_scale_up(now=0)
+        pool.record_scale_up(now=1)
+
+        assert pool.warm_hit_ratio == 0.5
+
+
+class AppsApiClientStub:
+
+    def __init__(self):
+        self.deployments: dict[str, V1Deployment] = {}
+        self.replicas_set = None
+
+    def read_namespaced_deployment(self, name, namespace, **kwargs):
+        if name not in self.deployments:
+            raise ApiException(status=404, reason="Not Found")
+        return self.deployments[name]
+
+    def create_namespaced_deployment(self, namespace, body, **kwargs):
+        self.deployments[body.metadata.name] = body
+        return body
+
+    def patch_namespaced_deployment_scale(self, name, namespace, body, **kwargs):
+        self.replicas_set = body[-1]["value"]
+        self.deployments[name].spec.replicas = self.replicas_set
@@ -0,0 +1,163 @@
+import json
+
+from kubernetes.client import V1Container, V1Deployment, V1DeploymentSpec, V1LabelSelector, V1ObjectMeta, \
+    V1PodSpec, V1PodTemplateSpec, V1ResourceRequirements
+from kubernetes.client.rest import ApiException
+
+from main.hpa.cpu_history import AGGREGATION_MAX, CpuHistory
+from main.hpa.dataset_prober import ProbeOutcome, ProbeResult
+from main.hpa.forecast import LoadForecaster
+from main.hpa.hpa_main import ClusterActions, HpaConfig, ScalerAction, new_behavior, new_cpu_history, \
+    scale_replicas
+from main.hpa.state_store import CONFIGMAP_KEY, ConfigMapStateStore, FileStateStore, controller_state, \
+    restore_controller_state
+
+ENV = {"MIN_REPLICAS": "2", "MAX_REPLICAS": "6", "UPPER_CPU_THRESHOLD": "0.7", "LOWER_CPU_THRESHOLD": "0.4",
+       "LOOP_TIME_S": "60", "NO_SCALE_DOWN_PERIOD": "300", "CPU_AGGREGATION": "max",
+       "SCALE_DOWN_STABILIZATION_S": "600"}
+
+
+class TestStateStore:
+
+    def test_restart_continues_with_the_same_decisions(self, tmp_path):
+        hpa_config = HpaConfig(ENV)
+        running = FakeClusterActions(hpa_config, 4)
+        running.cpu_m = 90
+        last_scaleup = 0
+        assert scale_replicas(running, hpa_config, AppInfoStub(), last_scaleup, now=1000) == ScalerAction.SCALE_UP
+        last_scaleup = 1000
+        FileStateStore(str(tmp_path / "state.json")).save("web", controller_state(running, last_scaleup), force=True)
+
+        store = FileStateStore(str(tmp_path / "state.json"))
+        store.load()
+        restarted = FakeClusterActions(hpa_config, 5)
+        restored_scaleup = restore_controller_state(restarted, store.get("web"))
+        cold = FakeClusterActions(hpa_config, 5)
+
+        actions = []
+        for cluster_actions, scaleup in [(running, last_scaleup), (restarted, restored_scaleup), (cold, 0)]:
+            cluster_actions.cpu_m = 10
+            actions.append(scale_replicas(cluster_actions, hpa_config, AppInfoStub(), scaleup, now=1400))
+
+        assert restored_scaleup == 1000
+        assert actions[1] == actions[0] and restarted.replicas == running.replicas
+        # without the CPU history and the recommendation window the low sample alone scales down
+        assert actions[2] == ScalerAction.SCALE_DOWN
+
+    def test_saves_are_throttled_except_scales(self, tmp_path):
+        now = [0.0]
+        path = str(tmp_path / "state.json")
+        store = FileStateStore(path, save_interval_s=30, clock=lambda: now[0])
+
+        store.save("web", {"last_scaleup": 0})
+        now[0] = 10
+        store.save("web", {"last_scaleup": 1})
+        assert saved(path)["web"] == {"last_scaleup": 0}
+        store.save("web", {"last_scaleup": 10}, force=True)
+        assert saved(path)["web"] == {"last_scaleup": 10}
+        now[0] = 20
+        store.save("api", {"last_scaleup": 0})
+        store.flush()
+        assert set(saved(path)) == {"web", "api"}
+        # compact, no spaces
+        with open(path) as f:
+            assert " " not in f.read()
+
+    def test_unreadable_state_starts_empty(self, tmp_path):
+        path = tmp_path / "state.json"
+        path.write_text("{not json")
+        assert FileStateStore(str(path)).load() == {}
+        path.write_text(json.dumps({"version": 99, "deployments": {"web": {"last_scaleup": 5}}}))
+        assert FileStateStore(str(path)).load() == {}
+        assert FileStateStore(str(tmp_path / "missing.json")).load() == {}
+
+    def test_configmap_store(self):
+        core_api = ConfigMapApiStub()
+        store = ConfigMapStateStore(core_api, "k8s-hpa-state", "ns")
+        assert store.load() == {}
+
+        store.save("web", {"last_scaleup": 7}, force=True)
+        store.save("web", {"last_scaleup": 8}, force=True)
+
+        assert core_api.calls == ["replace", "create", "replace"]
+        assert ConfigMapStateStore(core_api, "k8s-hpa-state", "ns").load() == {"web": {"last_scaleup": 8}}
+
+    def test_component_states_follow_the_config(self):
+        history = CpuHistory(AGGREGATION_MAX, 5)
+        for cpu_m in [50, 90, 10, 20]:
+            history.record({"pod-0": cpu_m})
+        smaller = CpuHistory(AGGREGATION_MAX, 2)
+        smaller.restore(json.loads(json.dumps(history.to_state())))
+        assert smaller.pods_cpu_m() == {"pod-0": 20}
+
+        forecaster = LoadForecaster(season_s=600, slot_s=300, horizon_s=300)
+        for now in [0, 300, 600, 900]:
+            forecaster.record(now, 100)
+        same = LoadForecaster(season_s=600, slot_s=300, horizon_s=300)
+        same.restore(json.loads(json.dumps(forecaster.to_state())))
+        assert same.predicted_cpu_m() == forecaster.predicted_cpu_m()
+        other_season = LoadForecaster(season_s=900, slot_s=300, horizon_s=300)
+        other_season.restore(forecaster.to_state())
+        assert other_season.predicted_cpu_m() is None
+
+
+def saved(path) -> dict:
+    with open(path) as f:
+        return json.load(f)["deployments"]
+
+
+class FakeClusterActions(ClusterActions):
+
+    def __init__(self, hpa_config, replicas):
+        super().__init__(None, None, None, "my_namespace", cpu_history=new_cpu_history(hpa_config),
+                         behavior=new_behavior(hpa_config))
+        self.replicas = replicas
+        self.cpu_m = 0
+
+    def get_name_ip_pairs(self) -> list[tuple[str, str]]:
+        return [(f"pod-{i}", f"ip-{i}") for i in range(self.replicas)]
+
+    def get_pods_usages(self) -> dict[str, dict[str, dict]]:
+        return {f"pod-{i}": {"web": {"cpu": f"{self.cpu_m * 1000000}n"}} for i in range(self.replicas)}
+
+    def read_deployment(self):
+        container = V1Container(name="web", resources=V1ResourceRequirements(requests={"cpu": "100m"}))
+        return V1Deployment(metadata=V1ObjectMeta(name="web", resource_version="1"),
+                            spec=V1DeploymentSpec(replicas=self.replicas, selector=V1LabelSelector(),
+                                                  template=V1PodTemplateSpec(spec=V1PodSpec(containers=[container]))))
+
+    def set_deployment_replicas(self, target_replicas, resource_version: str = None):
+        self.replicas = target_replicas
+        return str(int(resource_version) + 1)
+
+    def annotate_pod_deletion_cost(self, name: str, cost: int) -> None:
+        self.deletion_costs[name] = cost
+
+
+class AppInfoStub:
+
+    def get_pods_num_datasets(self, pod_ips: list[str]) -> dict[str, ProbeResult]:
+        return {ip: ProbeResult(ProbeOutcome.OK, 0) for ip in pod_ips}
+
+
+class ConfigMapApiStub:
+
+    def __init__(self):
+        self.config_map = None
+        self.calls = []
+
+    def read_namespaced_config_map(self, name, namespace):
+        if self.config_map is None:
+            raise ApiException(status=404)
+        return self.config_map
+
+    def replace_namespaced_config_map(self, name, namespace, body):
+        self.calls.append("replace")
+        if self.config_map is None:
+            raise ApiException(status=404)
+        self.config_map = body
+
+    def create_namespaced_config_map(self, namespace, body):
+        self.calls.append("create")
+        assert CONFIGMAP_KEY in body.data
+        self.config_map = body
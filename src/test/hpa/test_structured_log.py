@@ -0,0 +1,67 @@
+import io
+import json
+import logging
+
+from main.hpa.structured_log import SAMPLED, CycleRecord, logger, muted, set_level, setup_logging
+
+
+class TestStructuredLog:
+
+    def teardown_method(self):
+        logging.getLogger().handlers = []
+        set_level(logging.NOTSET)
+
+    def read_records(self, listener, stream):
+        listener.stop()
+        return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+    def test_cycle_is_one_json_record(self):
+        stream = io.StringIO()
+        listener = setup_logging("INFO", stream=stream)
+        cycle = CycleRecord(deployment="web", min_replicas=1)
+        cycle.set(cpu_total_m=1200, action="SCALE_UP")
+        cycle.emit()
+        logger.debug("CPU for pod %s: %sm", "web-1", 300, extra=SAMPLED)
+
+        records = self.read_records(listener, stream)
+
+        assert len(records) == 1
+        assert records[0]["msg"] == "cycle"
+        assert records[0]["level"] == "INFO"
+        assert records[0]["deployment"] == "web"
+        assert records[0]["cpu_total_m"] == 1200
+        assert "duration_ms" in records[0]
+
+    def test_per_pod_lines_are_sampled(self):
+        stream = io.StringIO()
+        listener = setup_logging("DEBUG", sample_every=10, stream=stream)
+        for i in range(100):
+            logger.debug("CPU for pod web-%s", i, extra=SAMPLED)
+        logger.warning("not sampled")
+
+        records = self.read_records(listener, stream)
+
+        assert len([r for r in records if r["msg"].startswith("CPU for pod")]) == 10
+        assert records[-1]["msg"] == "not sampled"
+
+    def test_level_changes_at_runtime(self):
+        stream = io.StringIO()
+        listener = setup_logging("INFO", stream=stream)
+        logger.debug("hidden")
+        set_level("DEBUG")
+        logger.debug("shown")
+
+        records = self.read_records(listener, stream)
+
+        assert [r["msg"] for r in records] == ["shown"]
+
+    def test_muted_restores_the_level(self):
+        stream = io.StringIO()
+        listener = setup_logging("INFO", stream=stream)
+        with muted():
+            logger.warning("hidden")
+        logger.info("shown")
+
+        records = self.read_records(listener, stream)
+
+        assert [r["msg"] for r in records] == ["shown"]
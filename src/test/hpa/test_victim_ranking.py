@@ -0,0 +1,42 @@
+from datetime import datetime, timezone
+
+from main.hpa.dataset_prober import ProbeOutcome, ProbeResult
+from main.hpa.victim_ranking import UNKNOWN_COST, VictimRanker, idle_s, select_victims
+
+NOW = datetime(2024, 1, 1, 12, 0, 0, tzinfo=timezone.utc).timestamp()
+
+
+class TestVictimRanking:
+
+    def test_idle_time(self):
+        assert idle_s("2024-01-01T11:50:00", NOW) == 600
+        assert idle_s("2024-01-01T11:50:00Z", NOW) == 600
+        assert idle_s(None, NOW) == float("inf")
+        assert idle_s("yesterday", NOW) == float("inf")
+
+    def test_rank_by_datasets_recency_and_cpu(self):
+        ranker = VictimRanker(dataset_cost=100, access_half_life_s=600, cpu_cost=1)
+        pairs = [("busy", "ip1"), ("stale", "ip2"), ("fresh", "ip3"), ("empty", "ip4"), ("down", "ip5")]
+        probes = {"ip1": ProbeResult(ProbeOutcome.OK, 2, "2024-01-01T11:50:00"),
+                  "ip2": ProbeResult(ProbeOutcome.OK, 2, "2024-01-01T06:00:00"),
+                  "ip3": ProbeResult(ProbeOutcome.OK, 2, "2024-01-01T12:00:00"),
+                  "ip4": ProbeResult(ProbeOutcome.OK, 0),
+                  "ip5": ProbeResult(ProbeOutcome.TIMEOUT)}
+
+        ranked = ranker.rank(pairs, probes, {"busy": 300, "empty": 50}, NOW)
+
+        assert [s.name for s in ranked] == ["empty", "stale", "fresh", "busy", "down"]
+        assert [s.cost for s in ranked] == [51, 201, 401, 601, UNKNOWN_COST]
+
+    def test_select_victims(self):
+        ranker = VictimRanker()
+        pairs = [(f"web-{i}", f"ip{i}") for i in range(5)]
+        probes = {"ip0": ProbeResult(ProbeOutcome.OK, 3), "ip1": ProbeResult(ProbeOutcome.OK, 0),
+                  "ip2": ProbeResult(ProbeOutcome.OK, 1), "ip3": ProbeResult(ProbeOutcome.OK, 0),
+                  "ip4": ProbeResult(ProbeOutcome.CONNECTION_ERROR)}
+        ranked = ranker.rank(pairs, probes, {}, NOW)
+
+        assert [s.name for s in select_victims(ranked, 4, proportional=False)] == ["web-1", "web-3"]
+        assert [s.name for s in select_victims(ranked, 1, proportional=False)] == ["web-1"]
+        assert [s.name for s in select_victims(ranked, 4, proportional=True)] == ["web-1", "web-3", "web-2", "web-0"]
+        assert [s.name for s in select_victims(ranked[2:], 4, proportional=False)] == ["web-2"]